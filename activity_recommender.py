@@ -0,0 +1,343 @@
+"""
+Door 3 activity recommendations.
+
+Each activity in the catalogue is precomputed once into a row of a float32
+feature matrix:
+
+    category    one-hot over ACTIVITY_CATEGORIES
+    targets     how much it lifts mood, energy, social and security (0-1)
+    burden      effort and length, scaled to 0-1
+
+A user becomes one weight vector over the same columns: affinity per category
+from the Door 3 adherence and effectiveness answers (social activities, which
+no question covers, from the Entry Hall social need), need per target from the
+Entry Hall subscores (a low index is a high need) and a penalty on effort and
+length from the barrier answers. Every activity is then scored by one
+matrix-vector product, and the top k come from an argpartition. A batch of
+users is one matrix product per chunk.
+
+The top-k lists are kept in an LRU cache keyed by the user's answer codes and
+subscores, which is all the weights depend on. Users who give the same
+answers share one entry, and a rerun of the completion page is a dictionary
+lookup.
+
+The built-in catalogue (CATALOGUE) holds a few dozen activities. Pass any
+list of Activity to ActivityRecommender for a larger one.
+`python activity_recommender.py batch` recommends for every stored user
+(the cluster table and, with --journal, every journaled Door 3 session), and
+`python activity_recommender.py --bench` times 10k-1M activity catalogues.
+"""
+
+import argparse
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Tuple
+
+import numpy as np
+
+from cluster_search import top_k_indices
+
+ACTIVITY_CATEGORIES = ['mindfulness', 'breathing', 'journaling', 'movement', 'social', 'self_care', 'digital']
+TARGETS = ['mood', 'energy', 'social', 'security']
+SUBSCORE_FIELDS = ['mood_index', 'energy_index', 'social_index', 'security_index']
+N_DOOR3_QUESTIONS = 20
+MAX_DURATION_MIN = 60
+DEFAULT_TOP_K = 5
+DEFAULT_CACHE_SIZE = 4096
+BATCH_SCORES = 4_000_000        # user x activity scores held at once in batch mode (16 MB)
+
+# Door 3 questions (0-based) behind each category's affinity: doing it, then finding it helps.
+# No question asks about social activities, so 'social' affinity comes from the Entry Hall social need.
+CATEGORY_QUESTIONS = {
+    'mindfulness': [2, 12],
+    'breathing': [8, 12],
+    'journaling': [3, 13],
+    'movement': [4, 14],
+    'self_care': [6, 10],
+    'digital': [7, 9],
+}
+# completes, follows through, finishes once started, intends to continue, would recommend
+GENERAL_ADHERENCE = [0, 1, 5, 15, 16]
+BARRIER_FORGET, BARRIER_TIME, BARRIER_TIRED = 17, 18, 19
+
+CATEGORY_WEIGHT = 1.0
+NEED_WEIGHT = 1.5
+BURDEN_WEIGHT = 1.0
+
+
+class Activity(NamedTuple):
+    name: str
+    category: str
+    duration_min: int
+    effort: int                         # 1 (effortless) to 5 (demanding)
+    targets: Tuple[float, float, float, float]    # lift of mood, energy, social, security
+
+
+CATALOGUE = [
+    Activity("Five-minute body scan", 'mindfulness', 5, 1, (0.6, 0.2, 0.0, 0.7)),
+    Activity("Guided morning meditation", 'mindfulness', 15, 2, (0.7, 0.3, 0.0, 0.6)),
+    Activity("Mindful walk", 'mindfulness', 20, 2, (0.6, 0.5, 0.1, 0.5)),
+    Activity("Loving-kindness meditation", 'mindfulness', 10, 2, (0.7, 0.1, 0.4, 0.5)),
+    Activity("Box breathing", 'breathing', 3, 1, (0.3, 0.2, 0.0, 0.8)),
+    Activity("4-7-8 breathing before sleep", 'breathing', 5, 1, (0.3, 0.4, 0.0, 0.7)),
+    Activity("Energizing breath", 'breathing', 3, 2, (0.3, 0.7, 0.0, 0.2)),
+    Activity("Three good things", 'journaling', 5, 1, (0.8, 0.1, 0.2, 0.3)),
+    Activity("Worry dump and reframe", 'journaling', 15, 3, (0.5, 0.1, 0.0, 0.8)),
+    Activity("Weekly reflection", 'journaling', 30, 3, (0.5, 0.2, 0.1, 0.6)),
+    Activity("Gratitude letter", 'journaling', 20, 2, (0.7, 0.1, 0.6, 0.3)),
+    Activity("Desk stretch break", 'movement', 5, 1, (0.2, 0.6, 0.0, 0.2)),
+    Activity("Brisk 20-minute walk", 'movement', 20, 3, (0.5, 0.8, 0.1, 0.3)),
+    Activity("Beginner yoga flow", 'movement', 30, 3, (0.5, 0.6, 0.0, 0.5)),
+    Activity("Dance to three songs", 'movement', 10, 3, (0.8, 0.8, 0.1, 0.1)),
+    Activity("Interval workout", 'movement', 45, 5, (0.5, 0.9, 0.0, 0.3)),
+    Activity("Message a friend", 'social', 5, 1, (0.5, 0.1, 0.8, 0.3)),
+    Activity("Call someone you miss", 'social', 20, 2, (0.6, 0.2, 0.9, 0.4)),
+    Activity("Join a group class", 'social', 60, 4, (0.5, 0.6, 0.9, 0.2)),
+    Activity("Volunteer for an hour", 'social', 60, 4, (0.7, 0.3, 0.8, 0.5)),
+    Activity("Shared meal without phones", 'social', 45, 2, (0.6, 0.2, 0.8, 0.4)),
+    Activity("Tidy one small space", 'self_care', 10, 2, (0.4, 0.3, 0.0, 0.6)),
+    Activity("Screen-free hour before bed", 'self_care', 60, 2, (0.3, 0.6, 0.0, 0.5)),
+    Activity("Cook a nourishing meal", 'self_care', 45, 3, (0.5, 0.5, 0.1, 0.5)),
+    Activity("Warm shower and early night", 'self_care', 30, 1, (0.4, 0.7, 0.0, 0.5)),
+    Activity("Plan tomorrow in three lines", 'self_care', 5, 1, (0.2, 0.2, 0.0, 0.8)),
+    Activity("Mood check-in in the app", 'digital', 2, 1, (0.3, 0.1, 0.0, 0.4)),
+    Activity("Habit tracker streak", 'digital', 3, 1, (0.3, 0.3, 0.0, 0.5)),
+    Activity("Guided audio wind-down", 'digital', 15, 1, (0.4, 0.4, 0.0, 0.6)),
+    Activity("Online peer support circle", 'digital', 45, 3, (0.5, 0.2, 0.8, 0.5)),
+]
+
+
+def activity_matrix(activities):
+    """(n, d) float32 feature matrix of a catalogue: category one-hot, targets, effort, length"""
+    category_index = {category: i for i, category in enumerate(ACTIVITY_CATEGORIES)}
+    n_categories = len(ACTIVITY_CATEGORIES)
+    matrix = np.zeros((len(activities), n_categories + len(TARGETS) + 2), dtype=np.float32)
+    if not activities:
+        return matrix
+    matrix[np.arange(len(activities)), [category_index[a.category] for a in activities]] = 1.0
+    matrix[:, n_categories:n_categories + len(TARGETS)] = [a.targets for a in activities]
+    matrix[:, -2] = (np.array([a.effort for a in activities]) - 1) / 4
+    matrix[:, -1] = np.minimum([a.duration_min for a in activities], MAX_DURATION_MIN) / MAX_DURATION_MIN
+    return matrix
+
+
+def user_weights(door3_codes, subscores):
+    """
+    Weight vector of one user over the activity_matrix columns.
+
+    door3_codes: 20 answer codes (1-5, 0 or missing = unanswered, read as 3);
+    subscores: mood/energy/social/security index on the 1-5 scale.
+    """
+    codes = np.full(N_DOOR3_QUESTIONS, 3.0)
+    given = np.asarray(door3_codes, dtype=np.float64)[:N_DOOR3_QUESTIONS]
+    codes[:len(given)] = np.where(given > 0, given, 3.0)
+    agree = (codes - 3.0) / 2.0         # -1 (never) .. +1 (always)
+
+    need = [(5.0 - float(subscores.get(field) or 3.0)) / 4.0 for field in SUBSCORE_FIELDS]
+    # Social need (0..1) rescaled to the -1..+1 range of the answer-based affinities
+    social_affinity = 2.0 * need[TARGETS.index('social')] - 1.0
+    affinity = [agree[CATEGORY_QUESTIONS[category]].mean() if category in CATEGORY_QUESTIONS else social_affinity
+                for category in ACTIVITY_CATEGORIES]
+    # Barriers are reverse scored: "always too tired" penalizes effort, "no time" penalizes length
+    adherence = agree[GENERAL_ADHERENCE].mean()
+    forget = (codes[BARRIER_FORGET] - 1.0) / 4.0
+    effort_penalty = (codes[BARRIER_TIRED] - 1.0) / 4.0 - 0.5 * adherence
+    length_penalty = (codes[BARRIER_TIME] - 1.0) / 4.0 + 0.5 * forget - 0.5 * adherence
+
+    return np.concatenate([
+        CATEGORY_WEIGHT * np.asarray(affinity),
+        NEED_WEIGHT * np.asarray(need),
+        -BURDEN_WEIGHT * np.array([effort_penalty, length_penalty]),
+    ]).astype(np.float32)
+
+
+def profile_key(door3_codes, subscores):
+    """Cache key: everything user_weights reads"""
+    return (tuple(int(code) for code in door3_codes),
+            tuple(round(float(subscores.get(field) or 3.0), 2) for field in SUBSCORE_FIELDS))
+
+
+class ActivityRecommender:
+    """Top-k activities for Door 3 profiles over a precomputed catalogue matrix"""
+
+    def __init__(self, activities=CATALOGUE, cache_size=DEFAULT_CACHE_SIZE):
+        self.activities = list(activities)
+        self.matrix = activity_matrix(self.activities)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()     # profile_key -> (indices, scores), most recently used last
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def top_k(self, door3_codes, subscores, k=DEFAULT_TOP_K):
+        """(activity indices, scores) of the k best activities, best first; cached per profile"""
+        key = (profile_key(door3_codes, subscores), k)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+        scores = self.matrix @ user_weights(door3_codes, subscores)
+        top = top_k_indices(scores, k)
+        result = (top, scores[top])
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = result
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def recommend(self, door3_codes, subscores, k=DEFAULT_TOP_K):
+        """The k best activities as dicts with the reason each was picked"""
+        weights = user_weights(door3_codes, subscores)
+        indices, scores = self.top_k(door3_codes, subscores, k)
+        targets = slice(len(ACTIVITY_CATEGORIES), len(ACTIVITY_CATEGORIES) + len(TARGETS))
+        recommendations = []
+        for index, score in zip(indices, scores):
+            activity = self.activities[index]
+            # The larger of the two terms names the reason: a subscore need, or the category affinity
+            need = self.matrix[index, targets] * weights[targets]
+            category = weights[ACTIVITY_CATEGORIES.index(activity.category)]
+            if need.max() >= category:
+                reason = f"Lifts your {TARGETS[int(np.argmax(need))]}"
+            else:
+                reason = f"You stick with {activity.category.replace('_', ' ')} activities"
+            recommendations.append({'name': activity.name, 'category': activity.category,
+                                    'duration_min': activity.duration_min, 'effort': activity.effort,
+                                    'score': round(float(score), 3), 'reason': reason})
+        return recommendations
+
+    def batch_top_k(self, weights, k=DEFAULT_TOP_K):
+        """(indices, scores), each (n_users, k), for a (n_users, d) weight matrix; bypasses the cache"""
+        weights = np.asarray(weights, dtype=np.float32)
+        k = min(k, len(self.activities))
+        chunk = max(1, BATCH_SCORES // len(self.activities))
+        indices = np.empty((len(weights), k), dtype=np.intp)
+        top_scores = np.empty((len(weights), k), dtype=np.float32)
+        for start in range(0, len(weights), chunk):
+            # (chunk, n_activities) scores, one matrix product per chunk of users
+            scores = weights[start:start + chunk] @ self.matrix.T
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            part = np.take_along_axis(scores, top, axis=1)
+            order = np.argsort(-part, axis=1, kind='stable')
+            indices[start:start + chunk] = np.take_along_axis(top, order, axis=1)
+            top_scores[start:start + chunk] = np.take_along_axis(part, order, axis=1)
+        return indices, top_scores
+
+
+# ============================================================================
+# Batch mode and benchmark
+# ============================================================================
+
+def stored_profiles(journal=None):
+    """(user id, Door 3 codes, subscores) of every stored user
+
+    Cluster table users never answered Door 3, so their codes are neutral and
+    only their Entry Hall subscores personalize the list. Journaled sessions
+    that finished Door 3 bring their own answers.
+    """
+    import pandas as pd
+    from streaming_loader import CLUSTERS_CSV
+
+    fields = {f"entry_hall_{field}": field for field in SUBSCORE_FIELDS}
+    table = pd.read_csv(CLUSTERS_CSV, usecols=['user_id', *fields])
+    neutral = [3] * N_DOOR3_QUESTIONS
+    for row in table.rename(columns=fields).to_dict('records'):
+        yield row.pop('user_id'), neutral, row
+    if journal:
+        from answer_journal import read_events, session_states
+        for session, state in session_states(read_events(journal)).items():
+            if len(state['door3']) == N_DOOR3_QUESTIONS:
+                codes = [state['door3'][f"q_{i}"] for i in range(N_DOOR3_QUESTIONS)]
+                yield session, codes, state['profile']
+
+
+def batch(out, k, journal=None):
+    import csv
+
+    recommender = ActivityRecommender()
+    profiles = list(stored_profiles(journal))
+    start = time.perf_counter()
+    weights = np.stack([user_weights(codes, subscores) for _, codes, subscores in profiles])
+    indices, scores = recommender.batch_top_k(weights, k)
+    elapsed = time.perf_counter() - start
+    with open(out, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['user_id', 'rank', 'activity', 'category', 'score'])
+        for (user_id, _, _), row, row_scores in zip(profiles, indices, scores):
+            for rank, (index, score) in enumerate(zip(row, row_scores), 1):
+                activity = recommender.activities[index]
+                writer.writerow([user_id, rank, activity.name, activity.category, round(float(score), 4)])
+    print(f"[OK] {k} activities for each of {len(profiles)} users in {elapsed * 1e3:.1f} ms, written to {out}")
+
+
+def synthetic_catalogue(n, rng):
+    """n variants of the built-in activities with jittered targets, effort and length"""
+    base = rng.integers(0, len(CATALOGUE), n)
+    targets = np.clip(np.array([CATALOGUE[b].targets for b in range(len(CATALOGUE))])[base]
+                      + rng.normal(0, 0.1, (n, len(TARGETS))), 0, 1).round(2).tolist()
+    durations = np.clip(np.array([a.duration_min for a in CATALOGUE])[base] + rng.integers(-5, 6, n), 1, 90).tolist()
+    efforts = np.clip(np.array([a.effort for a in CATALOGUE])[base] + rng.integers(-1, 2, n), 1, 5).tolist()
+    return [Activity(f"{CATALOGUE[b].name} #{i}", CATALOGUE[b].category, durations[i], efforts[i], tuple(targets[i]))
+            for i, b in enumerate(base.tolist())]
+
+
+def benchmark(sizes, n_users, k):
+    rng = np.random.default_rng(0)
+    profiles = [(rng.integers(1, 6, N_DOOR3_QUESTIONS).tolist(),
+                 dict(zip(SUBSCORE_FIELDS, np.round(rng.uniform(1, 5, 4), 2).tolist())))
+                for _ in range(n_users)]
+    print(f"{'activities':>10} {'build ms':>9} {'request ms':>11} {'cached us':>10} "
+          f"{'loop ms':>9} {'batch ms':>9} {'per user us':>12}")
+    for n in sizes:
+        activities = synthetic_catalogue(n, rng)
+        start = time.perf_counter()
+        recommender = ActivityRecommender(activities)
+        build_ms = (time.perf_counter() - start) * 1e3
+
+        start = time.perf_counter()
+        for codes, subscores in profiles[:200]:
+            recommender.top_k(codes, subscores, k)
+        request_ms = (time.perf_counter() - start) / 200 * 1e3
+        start = time.perf_counter()
+        for codes, subscores in profiles[:200]:
+            recommender.top_k(codes, subscores, k)
+        cached_us = (time.perf_counter() - start) / 200 * 1e6
+
+        # Users one at a time without the cache, against the chunked matrix product
+        weights = np.stack([user_weights(codes, subscores) for codes, subscores in profiles])
+        loop_users = weights[:200]
+        start = time.perf_counter()
+        for w in loop_users:
+            top_k_indices(recommender.matrix @ w, k)
+        loop_ms = (time.perf_counter() - start) / len(loop_users) * n_users * 1e3
+        start = time.perf_counter()
+        batch_indices, _ = recommender.batch_top_k(weights, k)
+        batch_ms = (time.perf_counter() - start) * 1e3
+        assert all(set(batch_indices[i]) == set(top_k_indices(recommender.matrix @ weights[i], k))
+                   for i in range(20))
+        print(f"{n:>10} {build_ms:>9.1f} {request_ms:>11.3f} {cached_us:>10.1f} "
+              f"{loop_ms:>9.1f} {batch_ms:>9.1f} {batch_ms / n_users * 1e3:>12.1f}")
+    print(f"(loop ms: {n_users} users one request at a time without the cache, extrapolated from 200)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Door 3 activity recommendations")
+    parser.add_argument('--bench', action='store_true', help="latency for 10k-1M activity catalogues")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('-k', type=int, default=DEFAULT_TOP_K)
+    sub = parser.add_subparsers(dest='command')
+    run = sub.add_parser('batch', help="recommend for every stored user")
+    run.add_argument('--out', default='activity_recommendations.csv')
+    run.add_argument('--journal', help="also recommend for the Door 3 sessions of this answer journal")
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.sizes, args.users, args.k)
+    elif args.command == 'batch':
+        batch(args.out, args.k, args.journal)
+    else:
+        parser.print_help()
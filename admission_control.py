@@ -0,0 +1,292 @@
+"""
+Admission control and degraded matching for bursts of Door 2 completions.
+
+Every Door 2 completion used to run the full matching pipeline at once. When
+many users finished together, they all competed for the same cores, latency
+grew with the crowd, and the only fallback was "Matching system temporarily
+unavailable". AdmissionController now sits in front of the engine:
+
+    concurrency limit   at most max_concurrent full matches run at once
+    queue timeout       a request waits at most queue_timeout seconds for a slot
+    load shedding       a request is shed at once when max_queue requests are
+                        already waiting, or when the expected wait (waiting
+                        requests x recent service time / slots) exceeds the
+                        timeout anyway
+
+A shed or failed request gets a degraded answer instead: the predicted
+cluster's representative users (cluster_medoids, precomputed per model
+bundle), ranked by cosine to the new user. That costs a few dozen dot products,
+so the completion page renders quickly. Degraded answers are marked, counted
+and queued for a full rematch. A background thread runs the rematches only
+while no full request is waiting, and the results replace the quick ones in
+the session. A later full match of the same session cancels its queued
+rematch, and a rematch already running only writes if the session has not
+been matched again since (its match generation is unchanged).
+
+Run `python admission_control.py --simulate` to compare latencies of a burst
+with and without admission control.
+"""
+
+import argparse
+import collections
+import os
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_MAX_CONCURRENT = 4      # full match requests running at once
+DEFAULT_QUEUE_TIMEOUT = 2.0     # seconds a request may wait for a slot
+DEFAULT_MAX_QUEUE = 32          # requests allowed to wait; more are shed at once
+REMATCH_QUEUE_SIZE = 1_000      # degraded sessions awaiting a full rematch; the oldest are dropped beyond it
+MEDOIDS_PER_CLUSTER = 32        # representative users kept per cluster for degraded answers
+_SERVICE_SMOOTHING = 0.2        # weight of the newest full request in the service-time average
+
+
+def cluster_medoids(cluster_arrays, cluster_norms, n=MEDOIDS_PER_CLUSTER):
+    """{cluster: row positions} of the rows closest (cosine) to each cluster's mean direction
+
+    Rows nearest the normalized centroid stand in for true medoids, which would
+    need all pairwise distances.
+    """
+    medoids = {}
+    for cluster, block in cluster_arrays.items():
+        norms = cluster_norms[cluster]
+        if not len(norms):
+            medoids[cluster] = np.zeros(0, dtype=np.intp)
+            continue
+        safe = np.where(norms > 0, norms, 1.0)
+        centroid = (block.features.T.astype(np.float64) @ (1.0 / safe)) / len(norms)
+        closeness = (block.features @ centroid) / safe
+        k = min(n, len(norms))
+        medoids[cluster] = np.argpartition(-closeness, k - 1)[:k]
+    return medoids
+
+
+class AdmissionController:
+    """Concurrency limit, queue timeouts and load shedding for full match requests"""
+
+    def __init__(self, max_concurrent=DEFAULT_MAX_CONCURRENT, queue_timeout=DEFAULT_QUEUE_TIMEOUT,
+                 max_queue=DEFAULT_MAX_QUEUE, rematch_queue_size=REMATCH_QUEUE_SIZE, verbose=True):
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.verbose = verbose
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.running = 0
+        self.service_time = None        # moving average of full requests, seconds
+        self.counts = collections.Counter()
+        self._rematches = collections.OrderedDict()     # key -> job, oldest first
+        self.rematch_queue_size = rematch_queue_size
+        self._rematch_ready = threading.Condition(self._lock)
+        self._worker = None
+
+    @classmethod
+    def from_env(cls):
+        """Limits from $VITA_NOVA_MAX_MATCHES, $VITA_NOVA_MATCH_QUEUE_TIMEOUT and $VITA_NOVA_MATCH_QUEUE"""
+        return cls(max_concurrent=int(os.environ.get('VITA_NOVA_MAX_MATCHES', DEFAULT_MAX_CONCURRENT)),
+                   queue_timeout=float(os.environ.get('VITA_NOVA_MATCH_QUEUE_TIMEOUT', DEFAULT_QUEUE_TIMEOUT)),
+                   max_queue=int(os.environ.get('VITA_NOVA_MATCH_QUEUE', DEFAULT_MAX_QUEUE)))
+
+    def _shed_reason(self):
+        """Why a new request should not even wait, or None (called with the lock held)"""
+        if self.running < self.max_concurrent:
+            return None
+        if self.waiting >= self.max_queue:
+            return 'queue_full'
+        if self.service_time is not None and \
+                (self.waiting + 1) * self.service_time / self.max_concurrent > self.queue_timeout:
+            return 'predicted_wait'
+        return None
+
+    def _shed(self, reason, degraded):
+        with self._lock:
+            self.counts['degraded'] += 1
+            self.counts[f'shed_{reason}'] += 1
+            waiting, running = self.waiting, self.running
+        if self.verbose:
+            print(f"[WARNING] Match request degraded ({reason}; {running} running, {waiting} waiting)")
+        return degraded(), True
+
+    def call(self, full, degraded, failed=None):
+        """(result, degraded?) of full() if a slot frees up in time, else of degraded()
+
+        failed(result) -> True also falls back to degraded(), e.g. when the engine
+        returned no matches.
+        """
+        with self._lock:
+            reason = self._shed_reason()
+            if reason is None:
+                self.waiting += 1
+        if reason is not None:
+            return self._shed(reason, degraded)
+
+        acquired = self._slots.acquire(timeout=self.queue_timeout)
+        with self._lock:
+            self.waiting -= 1
+            if acquired:
+                self.running += 1
+        if not acquired:
+            return self._shed('timeout', degraded)
+
+        start = time.perf_counter()
+        try:
+            result = full()
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.running -= 1
+                self.service_time = elapsed if self.service_time is None else \
+                    (1 - _SERVICE_SMOOTHING) * self.service_time + _SERVICE_SMOOTHING * elapsed
+                self._rematch_ready.notify()
+            self._slots.release()
+        if failed is not None and failed(result):
+            with self._lock:
+                self.counts['full_failed'] += 1
+            return self._shed('failed', degraded)
+        with self._lock:
+            self.counts['full'] += 1
+        return result, False
+
+    def enqueue_rematch(self, key, job):
+        """Queue job(), a full rematch returning True when done, for a degraded session (replacing its older job)"""
+        with self._lock:
+            self._rematches.pop(key, None)
+            self._rematches[key] = job
+            self.counts['rematch_queued'] += 1
+            while len(self._rematches) > self.rematch_queue_size:
+                self._rematches.popitem(last=False)
+                self.counts['rematch_dropped'] += 1
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run_rematches, name='rematch', daemon=True)
+                self._worker.start()
+            self._rematch_ready.notify()
+
+    def cancel_rematch(self, key):
+        """Drop a session's queued rematch, e.g. once a newer full match has replaced its answers"""
+        with self._lock:
+            cancelled = self._rematches.pop(key, None) is not None
+            if cancelled:
+                self.counts['rematch_cancelled'] += 1
+        return cancelled
+
+    def pending_rematch(self, key):
+        with self._lock:
+            return key in self._rematches
+
+    def _run_rematches(self):
+        while True:
+            with self._lock:
+                # A rematch only takes a slot that no live request is waiting for
+                while not (self._rematches and not self.waiting and self._slots.acquire(blocking=False)):
+                    self._rematch_ready.wait(timeout=1.0)
+                key, job = self._rematches.popitem(last=False)
+                self.running += 1
+            try:
+                done = job()
+            except Exception as e:
+                print(f"[ERROR] Rematch failed: {e}")
+                done = False
+            finally:
+                with self._lock:
+                    self.running -= 1
+                self._slots.release()
+            with self._lock:
+                self.counts['rematched' if done else 'rematch_failed'] += 1
+
+    def metrics(self):
+        with self._lock:
+            return {'running': self.running, 'waiting': self.waiting, 'pending_rematches': len(self._rematches),
+                    'service_ms': round(self.service_time * 1e3, 1) if self.service_time is not None else None,
+                    **self.counts}
+
+
+def format_metrics(metrics):
+    served = metrics.get('full', 0) + metrics.get('degraded', 0)
+    shed = {key[5:]: count for key, count in metrics.items() if key.startswith('shed_') and count}
+    return (f"{served} match requests: {metrics.get('full', 0)} full, {metrics.get('degraded', 0)} degraded"
+            + (f" ({', '.join(f'{reason} {count}' for reason, count in shed.items())})" if shed else "")
+            + f"; {metrics.get('rematched', 0)} rematched, {metrics['pending_rematches']} pending"
+            + f"; {metrics['running']} running, {metrics['waiting']} waiting")
+
+
+# ============================================================================
+# Burst simulation
+# ============================================================================
+
+def simulate(burst, cluster_size, max_concurrent, queue_timeout):
+    from cluster_search import cosine_scores, top_k_indices
+    from streaming_loader import ClusterBlock
+
+    rng = np.random.default_rng(0)
+    features = rng.integers(1, 6, size=(cluster_size, 60)).astype(np.float32)
+    norms = np.linalg.norm(features.astype(np.float64), axis=1)
+    medoids = cluster_medoids({0: ClusterBlock(np.arange(cluster_size, dtype=np.int32), features)}, {0: norms})[0]
+    users = rng.integers(1, 6, size=(burst, 60)).astype(np.float64)
+
+    def full(x):
+        return top_k_indices(cosine_scores(features, norms, x), 5)
+
+    def degraded(x):
+        return medoids[top_k_indices(cosine_scores(features[medoids], norms[medoids], x), 5)]
+
+    def run_burst(serve):
+        latencies = np.zeros(burst)
+        flags = np.zeros(burst, dtype=bool)
+        barrier = threading.Barrier(burst)
+
+        def request(i):
+            barrier.wait()
+            start = time.perf_counter()
+            flags[i] = serve(users[i])
+            latencies[i] = time.perf_counter() - start
+
+        threads = [threading.Thread(target=request, args=(i,)) for i in range(burst)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies * 1e3, flags
+
+    full(users[0])
+    print(f"burst of {burst} Door 2 completions against a {cluster_size}-user cluster")
+    print(f"{'':>22} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'degraded':>9}")
+    latencies, _ = run_burst(lambda x: full(x) is None)
+    print(f"{'no admission control':>22} {np.percentile(latencies, 50):>8.1f} {np.percentile(latencies, 95):>8.1f} "
+          f"{latencies.max():>8.1f} {0:>9.0%}")
+
+    controller = AdmissionController(max_concurrent, queue_timeout, verbose=False)
+    # One warm request so the shedding policy knows the service time
+    controller.call(lambda: full(users[0]), lambda: degraded(users[0]))
+
+    def admitted(x):
+        _, was_degraded = controller.call(lambda: full(x), lambda: degraded(x))
+        if was_degraded:
+            controller.enqueue_rematch(id(x), lambda: full(x) is not None)
+        return was_degraded
+
+    latencies, flags = run_burst(admitted)
+    print(f"{'admission control':>22} {np.percentile(latencies, 50):>8.1f} {np.percentile(latencies, 95):>8.1f} "
+          f"{latencies.max():>8.1f} {flags.mean():>9.0%}")
+    start = time.perf_counter()
+    while controller.metrics()['pending_rematches'] or controller.metrics()['running']:
+        time.sleep(0.01)
+    print(f"  rematches drained in {time.perf_counter() - start:.2f} s")
+    print(f"  {format_metrics(controller.metrics())}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Admission control with degraded matching under overload")
+    parser.add_argument('--simulate', action='store_true', help="latency of a burst with and without admission control")
+    parser.add_argument('--burst', type=int, default=100)
+    parser.add_argument('--cluster-size', type=int, default=20_000)
+    parser.add_argument('--max-concurrent', type=int, default=DEFAULT_MAX_CONCURRENT)
+    parser.add_argument('--queue-timeout', type=float, default=0.5)
+    args = parser.parse_args()
+
+    if args.simulate:
+        simulate(args.burst, args.cluster_size, args.max_concurrent, args.queue_timeout)
+    else:
+        parser.print_help()
@@ -0,0 +1,270 @@
+"""
+Append-only journal of answer events.
+
+Every answer submission (Entry Hall, Doors 1-3), every profile update and
+every page transition is appended as one JSON line. The app only puts the event on a queue; a
+background writer thread batches events and writes + fsyncs a batch once it
+holds `max_batch` events or its oldest event is `flush_interval` seconds old,
+so no click waits on the disk.
+
+Events go to numbered segments (answers-000001.jsonl, ...). A process never
+appends to an existing segment. A segment is closed once it passes
+`segment_bytes` (and when the journal closes), then compressed to .jsonl.gz in
+the writer thread. A crash can lose at most the unflushed batch and leave a
+truncated last line, which the reader skips.
+
+    {"ts": 1760000000.0, "session": "3f2a...", "stage": "door2", "question": 4, "code": 5}
+    {"ts": 1760000000.1, "session": "3f2a...", "stage": "profile", "profile": {"gender": "Female", ...}}
+    {"ts": 1760000000.2, "session": "3f2a...", "stage": "page", "page": "completion"}
+
+`python answer_journal.py replay` rebuilds each session's answers from the
+journal and runs them through the matching engine offline;
+`python answer_journal.py stats` summarizes the events and
+`python answer_journal.py --bench` compares against synchronous writes.
+"""
+
+import argparse
+import atexit
+import gzip
+import json
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from collections import Counter
+
+DEFAULT_JOURNAL_DIR = 'answer_journal'
+DEFAULT_MAX_BATCH = 256
+DEFAULT_FLUSH_INTERVAL = 1.0            # seconds
+DEFAULT_SEGMENT_BYTES = 16 * 1024 * 1024
+
+ANSWER_STAGES = ['entry_hall', 'door1', 'door2', 'door3']
+# Profile fields the matching engine reads; names, emails etc. are never journaled
+PROFILE_EVENT_FIELDS = ['gender', 'education_level', 'occupation_status', 'diet_type', 'stress_level',
+                        'has_mental_health_condition', 'mental_health_condition', 'relationship_status',
+                        'age_groups', 'work_hours_groups', 'sleep_hours_groups', 'physical_activity_groups',
+                        'screen_time_groups', 'friends_groups', 'pulse_score', 'mood_index', 'energy_index',
+                        'social_index', 'security_index', 'hobbies']
+
+_SEGMENT_RE = re.compile(r'^answers-(\d{6})\.jsonl(\.gz)?$')
+_CLOSE = object()
+
+
+def journal_dir():
+    """Journal directory: $VITA_NOVA_JOURNAL_DIR, else ./answer_journal"""
+    return os.environ.get('VITA_NOVA_JOURNAL_DIR', DEFAULT_JOURNAL_DIR)
+
+
+def segment_paths(directory):
+    """Segment files of a journal in write order"""
+    if not os.path.isdir(directory):
+        return []
+    segments = []
+    for name in os.listdir(directory):
+        match = _SEGMENT_RE.match(name)
+        if match:
+            segments.append((int(match.group(1)), os.path.join(directory, name)))
+    return [path for _, path in sorted(segments)]
+
+
+class AnswerJournal:
+    """Queue-fed, batched, fsynced JSON-lines writer with segment rotation"""
+
+    def __init__(self, directory=None, max_batch=DEFAULT_MAX_BATCH, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 segment_bytes=DEFAULT_SEGMENT_BYTES, compress=True):
+        self.directory = directory or journal_dir()
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.segment_bytes = segment_bytes
+        self.compress = compress
+        self.stats = Counter()
+
+        os.makedirs(self.directory, exist_ok=True)
+        existing = [int(_SEGMENT_RE.match(os.path.basename(p)).group(1)) for p in segment_paths(self.directory)]
+        self._segment = max(existing, default=0)
+        self._file = None
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='answer-journal', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, event):
+        """Queue one event (a JSON-serializable dict); never blocks on I/O"""
+        if self._closed:
+            return
+        event.setdefault('ts', time.time())
+        self._queue.put(event)
+
+    def close(self, timeout=10.0):
+        """Flush everything queued, close and compress the current segment"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_CLOSE)
+        self._thread.join(timeout)
+
+    # Writer thread ----------------------------------------------------------
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if not batch else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is _CLOSE:
+                if batch:
+                    self._write(batch)
+                self._close_segment()
+                return
+            if item is not None:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(item)
+            if batch and (len(batch) >= self.max_batch or time.monotonic() >= deadline):
+                self._write(batch)
+                batch = []
+
+    def _write(self, batch):
+        try:
+            if self._file is None:
+                self._segment += 1
+                path = os.path.join(self.directory, f"answers-{self._segment:06d}.jsonl")
+                self._file = open(path, 'ab')
+            data = b''.join(json.dumps(event, separators=(',', ':'), default=str).encode() + b'\n'
+                            for event in batch)
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.stats['events'] += len(batch)
+            self.stats['batches'] += 1
+            self.stats['bytes'] += len(data)
+            if self._file.tell() >= self.segment_bytes:
+                self._close_segment()
+        except Exception as e:
+            self.stats['dropped'] += len(batch)
+            print(f"[ERROR] Answer journal write failed, {len(batch)} events dropped: {e}")
+
+    def _close_segment(self):
+        if self._file is None:
+            return
+        path = self._file.name
+        self._file.close()
+        self._file = None
+        if self.compress:
+            with open(path, 'rb') as src, gzip.open(path + '.gz.tmp', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(path + '.gz.tmp', path + '.gz')
+            os.remove(path)
+        self.stats['segments'] += 1
+
+
+# ============================================================================
+# Reading and replay
+# ============================================================================
+
+def read_events(directory):
+    """Every event of a journal in write order; a truncated last line is skipped"""
+    for path in segment_paths(directory):
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rb') as file:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"[WARNING] Skipping unreadable journal line in {path}")
+
+
+def session_states(events):
+    """Latest profile and answer codes per session: {session: {'profile': {...}, stage: {'q_i': code}}}"""
+    sessions = {}
+    for event in events:
+        state = sessions.setdefault(event['session'], {'profile': {}, **{stage: {} for stage in ANSWER_STAGES}})
+        if event['stage'] == 'profile':
+            state['profile'].update(event['profile'])
+        elif event['stage'] in ANSWER_STAGES:
+            state[event['stage']][f"q_{event['question']}"] = event['code']
+    return sessions
+
+
+def replay_matches(directory, top_n=5):
+    """Yield (session, cluster, matched user ids) for every session that finished Door 2"""
+    import matching_engine
+
+    if matching_engine.cluster_arrays is None and not matching_engine.load_matching_data():
+        return
+    for session, state in session_states(read_events(directory)).items():
+        if len(state['entry_hall']) < 15 or len(state['door2']) < 25:
+            continue
+        matches, cluster = matching_engine.get_user_matches(state['profile'], state['entry_hall'], state['door2'],
+                                                            top_n=top_n)
+        yield session, cluster, [int(match['user_id']) for match in matches or []]
+
+
+# ============================================================================
+# Benchmark
+# ============================================================================
+
+def benchmark(n_events, directory):
+    import tempfile
+
+    event = {'session': 'bench', 'stage': 'door2', 'question': 3, 'code': 4}
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        path = os.path.join(tmp, 'sync.jsonl')
+        start = time.perf_counter()
+        with open(path, 'ab') as file:
+            for _ in range(n_events):
+                file.write(json.dumps(dict(event, ts=time.time())).encode() + b'\n')
+                file.flush()
+                os.fsync(file.fileno())
+        sync_us = (time.perf_counter() - start) / n_events * 1e6
+
+        journal = AnswerJournal(os.path.join(tmp, 'journal'))
+        start = time.perf_counter()
+        for _ in range(n_events):
+            journal.append(dict(event))
+        append_us = (time.perf_counter() - start) / n_events * 1e6
+        journal.close()
+        drained_s = time.perf_counter() - start
+        replayed = sum(1 for _ in read_events(journal.directory))
+
+    print(f"{n_events} events")
+    print(f"  synchronous write + fsync per event: {sync_us:8.1f} us per click")
+    print(f"  journal append:                      {append_us:8.1f} us per click "
+          f"({journal.stats['batches']} fsynced batches, drained in {drained_s:.2f} s)")
+    print(f"  replayed {replayed} events from {journal.stats['segments']} compressed segment(s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Append-only answer event journal")
+    parser.add_argument('--dir', default=journal_dir())
+    parser.add_argument('--bench', action='store_true', help="append latency versus synchronous writes")
+    parser.add_argument('--events', type=int, default=2000)
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('stats', help="events per stage and sessions")
+    replay = sub.add_parser('replay', help="rerun matching for every session that finished Door 2")
+    replay.add_argument('--top-n', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.bench:
+        os.makedirs(args.dir, exist_ok=True)
+        benchmark(args.events, args.dir)
+    elif args.command == 'stats':
+        stages = Counter()
+        sessions = set()
+        for event in read_events(args.dir):
+            stages[event['stage']] += 1
+            sessions.add(event['session'])
+        print(f"{sum(stages.values())} events from {len(sessions)} sessions in {len(segment_paths(args.dir))} segments")
+        for stage, count in stages.most_common():
+            print(f"  {stage:>12} {count}")
+    elif args.command == 'replay':
+        for session, cluster, user_ids in replay_matches(args.dir, args.top_n):
+            print(f"{session} cluster {cluster}: {user_ids}")
+    else:
+        parser.print_help()
@@ -3,235 +3,26 @@ import datetime
 from typing import Dict, Any
 import pandas as pd
 import numpy as np
-import pickle
-from sklearn.metrics.pairwise import cosine_similarity
+import uuid
 import warnings
 warnings.filterwarnings('ignore')
 
-# ============================================================================
-# Matching Engine Functions (from User Matching Engine.ipynb)
-# ============================================================================
-
-# Global variables for loaded models and data
-loaded_model = None
-encoders = None
-df_clusters = None
-df_user_profiles = None
-df_matrix = None
-
-def load_matching_data():
-    """Load all required data for matching engine"""
-    global loaded_model, encoders, df_clusters, df_user_profiles, df_matrix
-    
-    try:
-        # Load classifier model
-        with open('new_user_classifier.pkl', 'rb') as file:
-            loaded_model = pickle.load(file)
-        
-        # Load label encoders
-        with open('label_encoders.pkl', 'rb') as file:
-            encoders = pickle.load(file)
-        
-        # Load cluster data
-        df_clusters = pd.read_csv("user_clusters_6_clusters.csv")
-        
-        # Load user profiles
-        df_user_profiles = pd.read_csv("user_profiles.csv")
-        
-        # Preprocess all users
-        df_matrix = pre_processing(df_clusters.copy())
-        
-        return True
-    except Exception as e:
-        print(f"[ERROR] Failed to load matching data: {e}")
-        return False
-
-def pre_processing(user_temp):
-    """Preprocess user data - encode categorical features (from notebook)"""
-    cluster_df = user_temp.copy()
-    
-    for col in ['gender','education_level','occupation_status','diet_type','stress_level', 'mental_health_condition','relationship_status',
-                'age_groups','work_hours_groups', 'sleep_hours_groups','physical_activity_groups','screen_time_groups','friends_groups']:
-        
-        if col in cluster_df.columns:
-            mapping_dict = encoders[col]
-            original_value = cluster_df[col].values[0] if cluster_df.shape[0] == 1 else None
-            cluster_df[col] = cluster_df[col].map(mapping_dict)
-            
-            # Check for NaN after mapping
-            if cluster_df[col].isna().any():
-                print(f"[WARNING] NaN found in {col} after mapping (original value: {original_value})")
-                print(f"[WARNING] Available mappings for {col}: {list(mapping_dict.keys())}")
-                # Fill NaN with a default value (0)
-                cluster_df[col] = cluster_df[col].fillna(0)
-    
-    if cluster_df.shape[0] == 1:
-        cluster_df.drop(['user_id', 'Class Name'], axis=1, inplace=True, errors='ignore')
-    else:
-        cluster_df.set_index('user_id', inplace=True)
-    
-    return cluster_df
-
-def recommendations_based_on_user_profile(user_target, df_target, k_nearest_neighbors):
-    """Find similar users using cosine similarity (from notebook)"""
-    similarity_scores = cosine_similarity(df_target, user_target)
-    
-    similarity_df = pd.DataFrame(similarity_scores, index=df_target.index, columns=['matching_score'])
-    
-    similarity_df.sort_values(by=["matching_score"], ascending=False, inplace=True)
-    
-    top_users = similarity_df.iloc[0:k_nearest_neighbors]
-    
-    return top_users
-
-def build_new_user_row(user_profile, entry_hall_answers, door2_answers):
-    """Build a new user row matching the exact structure of user_clusters_6_clusters.csv"""
-    
-    # Start with a row from the CSV to get the exact structure
-    template_row = df_clusters.iloc[0:1].copy()
-    
-    # Update with new user data
-    template_row['user_id'] = 9999
-    
-    # Categorical features
-    template_row['gender'] = user_profile.get('gender', 'Other')
-    template_row['education_level'] = user_profile.get('education_level', 'Undergraduate')
-    template_row['occupation_status'] = user_profile.get('occupation_status', 'Employed')
-    template_row['diet_type'] = user_profile.get('diet_type', 'Balanced')
-    template_row['stress_level'] = user_profile.get('stress_level', 'Medium')
-    template_row['has_mental_health_condition'] = user_profile.get('has_mental_health_condition', 0)
-    template_row['mental_health_condition'] = user_profile.get('mental_health_condition', 'Not Applicable')
-    template_row['relationship_status'] = user_profile.get('relationship_status', 'Single')
-    
-    # Door 2 answers (answer_code_56 to answer_code_80)
-    for i in range(25):
-        answer_key = f'q_{i}'
-        if answer_key in door2_answers:
-            template_row[f'answer_code_{56 + i}'] = int(door2_answers[answer_key])
-        else:
-            template_row[f'answer_code_{56 + i}'] = 3
-    
-    # Matching score
-    door2_codes = [template_row[f'answer_code_{56 + i}'].values[0] for i in range(25)]
-    template_row['matching_score'] = round(sum(door2_codes) / len(door2_codes), 2)
-    
-    # Entry Hall answers (entry_hall_answer_code_1 to entry_hall_answer_code_15)
-    for i in range(15):
-        answer_key = f'q_{i}'
-        if answer_key in entry_hall_answers:
-            template_row[f'entry_hall_answer_code_{i + 1}'] = int(entry_hall_answers[answer_key])
-        else:
-            template_row[f'entry_hall_answer_code_{i + 1}'] = 3
-    
-    # Entry Hall subscores
-    template_row['entry_hall_pulse_score'] = user_profile.get('pulse_score', 3.0)
-    template_row['entry_hall_mood_index'] = user_profile.get('mood_index', 3.0)
-    template_row['entry_hall_energy_index'] = user_profile.get('energy_index', 3.0)
-    template_row['entry_hall_social_index'] = user_profile.get('social_index', 3.0)
-    template_row['entry_hall_security_index'] = user_profile.get('security_index', 3.0)
-    
-    # Group features
-    template_row['age_groups'] = user_profile.get('age_groups', '25-34')  # regular hyphen
-    template_row['work_hours_groups'] = user_profile.get('work_hours_groups', '31–40 hrs')
-    template_row['sleep_hours_groups'] = user_profile.get('sleep_hours_groups', '6–8 hrs')
-    template_row['physical_activity_groups'] = user_profile.get('physical_activity_groups', 'Moderate (4–5)')
-    template_row['screen_time_groups'] = user_profile.get('screen_time_groups', '4–6 hrs')
-    template_row['friends_groups'] = user_profile.get('friends_groups', '3–4')
-    
-    # Class Name will be predicted
-    template_row['Class Name'] = -1
-    
-    return template_row
-
-def get_user_matches(user_profile, entry_hall_answers, door2_answers, top_n=5):
-    """Main function to get user matches (simplified from notebook)"""
-    try:
-        print("\n=== Starting User Matching ===")
-        
-        # Build new user row
-        new_user_row = build_new_user_row(user_profile, entry_hall_answers, door2_answers)
-        print(f"Built new user row with shape: {new_user_row.shape}")
-        
-        # Debug: Check for NaN in original row
-        nan_cols = new_user_row.columns[new_user_row.isna().any()].tolist()
-        if nan_cols:
-            print(f"[WARNING] NaN found in columns before preprocessing: {nan_cols}")
-            for col in nan_cols:
-                print(f"  {col}: {new_user_row[col].values[0]}")
-        
-        # Preprocess
-        X_new = pre_processing(new_user_row)
-        print(f"Preprocessed shape: {X_new.shape}")
-        
-        # Check for NaN after preprocessing
-        if X_new.isna().any().any():
-            nan_cols_after = X_new.columns[X_new.isna().any()].tolist()
-            print(f"[ERROR] NaN still present after preprocessing in: {nan_cols_after}")
-            for col in nan_cols_after:
-                print(f"  {col}: {X_new[col].values[0]}")
-        else:
-            print("[OK] No NaN values in preprocessed data")
-        
-        # Predict cluster
-        predicted_cluster = loaded_model.predict(X_new)[0]
-        print(f"[OK] Predicted cluster: {predicted_cluster}")
-        
-        # Get users in same cluster
-        df_target = df_matrix.loc[df_matrix['Class Name'] == predicted_cluster].copy()
-        
-        if len(df_target) == 0:
-            print("[WARNING] No users in this cluster")
-            return None, None
-        
-        print(f"[OK] Found {len(df_target)} users in cluster {predicted_cluster}")
-        
-        # Drop Class Name for similarity
-        df_target_features = df_target.drop('Class Name', axis=1)
-        
-        # Find similar users
-        top_users_df = recommendations_based_on_user_profile(X_new, df_target_features, top_n)
-        
-        # Get full profiles
-        matched_users = []
-        for user_id in top_users_df.index:
-            similarity_score = top_users_df.loc[user_id, 'matching_score']
-            
-            user_info = df_user_profiles[df_user_profiles['user_id'] == user_id]
-            
-            if len(user_info) > 0:
-                user_dict = user_info.iloc[0].to_dict()
-                user_dict['similarity_score'] = similarity_score
-                user_dict['cluster'] = predicted_cluster
-                matched_users.append(user_dict)
-        
-        print(f"[SUCCESS] Found {len(matched_users)} matches")
-        
-        return matched_users, predicted_cluster
-        
-    except Exception as e:
-        print(f"[ERROR] Matching failed: {e}")
-        import traceback
-        traceback.print_exc()
-        return None, None
-
-def format_match_profile(match_dict):
-    """Format a match dictionary for display"""
-    return {
-        'user_id': int(match_dict['user_id']),
-        'first_name': match_dict.get('first_name', 'Anonymous'),
-        'last_name': match_dict.get('last_name', 'User'),
-        'age': match_dict.get('age', 25),
-        'gender': match_dict.get('gender', 'Other'),
-        'education_level': match_dict.get('education_level', 'Undergraduate'),
-        'occupation_status': match_dict.get('occupation_status', 'Employed'),
-        'relationship_status': match_dict.get('relationship_status', 'Single'),
-        'similarity_score': match_dict.get('similarity_score', 0.0),
-        'cluster': match_dict.get('cluster', 0)
-    }
-
-# ============================================================================
-# End of Matching Engine Functions
-# ============================================================================
+from session_store import SessionStore, MatchRefs
+from answer_journal import AnswerJournal, PROFILE_EVENT_FIELDS
+from rerun_profiler import profiling_enabled, run_profiled
+from model_refresh import ShadowEvaluator
+from drift_monitor import DriftMonitor, format_metrics as format_drift_metrics
+from cohort_analytics import CohortAnalytics, METRICS as COHORT_METRICS
+from activity_recommender import ActivityRecommender
+from checkin_store import (CheckinStore, score_door1, new_checkin_token, is_checkin_token,
+                           TREND_METRICS as CHECKIN_TREND_METRICS)
+from group_bins import group_label, session_groups
+from admission_control import AdmissionController, format_metrics as format_admission_metrics
+import matching_engine
+from matching_engine import (
+    load_matching_data, get_user_matches, format_match_profile,
+    start_incremental_match, finish_incremental_match, people_similar_to_matches, match_details, degraded_matches,
+)
 
 # Configure page
 st.set_page_config(
@@ -241,8 +32,8 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Custom CSS for styling
-st.markdown("""
+# Custom CSS for styling, injected on every rerun by main()
+CUSTOM_CSS = """
 <style>
     .main-header {
         text-align: center;
@@ -271,27 +62,136 @@ st.markdown("""
         margin: 1rem 0;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+@st.cache_resource
+def get_session_store():
+    """Process-wide store of compact per-session state, shared by all sessions"""
+    return SessionStore()
+
+def session_data():
+    """This session's answer codes, match references, Door 2 matcher and match cursor"""
+    return get_session_store().get(st.session_state.session_key)
+
+@st.cache_resource
+def get_answer_journal():
+    """Process-wide answer event journal, flushed to disk by a background thread"""
+    return AnswerJournal()
+
+@st.cache_resource
+def get_model_refresh():
+    """Process-wide shadow evaluator of the candidate model in $VITA_NOVA_CANDIDATE_MODEL, or None"""
+    return ShadowEvaluator.from_env()
+
+@st.cache_resource
+def get_drift_monitor():
+    """Process-wide feature-drift monitor, fed every incoming user's encoded row by the engine"""
+    monitor = DriftMonitor()
+    matching_engine.drift_observer = monitor.observe
+    return monitor
+
+@st.cache_resource
+def get_cohort_analytics():
+    """Process-wide Pulse Score and subscore summaries per stage, cluster and hour"""
+    return CohortAnalytics()
+
+def record_completion(stage, cluster=None):
+    """Fold this session's Entry Hall scores into the cohort analytics for a completed stage"""
+    get_cohort_analytics().record(stage, st.session_state.user_profile, cluster)
+
+@st.cache_resource
+def get_activity_recommender():
+    """Process-wide Door 3 activity recommender with its precomputed catalogue matrix and profile cache"""
+    return ActivityRecommender()
+
+@st.cache_resource
+def get_checkin_store():
+    """Process-wide store of every user's scored Emotional Room check-ins and their rollups"""
+    return CheckinStore()
+
+def checkin_user():
+    """Series key of this user: a random check-in token kept in the page link (?checkin=...)
+    
+    The username is typed in freely and never verified, so keying by it would let anyone
+    read and extend another person's mood history. The token is unguessable, survives
+    Start Over and an expired session, and a bookmarked link brings the series back later.
+    """
+    token = st.query_params.get('checkin')
+    if not is_checkin_token(token):
+        token = new_checkin_token()
+        st.query_params['checkin'] = token
+    return token
+
+@st.cache_resource
+def get_admission_controller():
+    """Process-wide admission control in front of the matching engine, with its rematch queue"""
+    return AdmissionController.from_env()
+
+def queue_rematch(entry_hall_answers, door2_answers, generation):
+    """Queue a full rematch of this session's degraded matches; the result replaces them in the session store
+    
+    generation is the session's match_generation when the degraded matches were served; if the
+    user has completed Door 2 again since, the rematch result is stale and is dropped.
+    """
+    store, key = get_session_store(), st.session_state.session_key
+    user_profile = dict(st.session_state.user_profile)
+    
+    def rematch():
+        matches, cluster, cursor = get_user_matches(user_profile, entry_hall_answers, door2_answers,
+                                                    top_n=5, with_cursor=True)
+        if matches is None:
+            return False
+        if key in store:
+            data = store.get(key)
+            if data.match_generation != generation:
+                print("[INFO] Session matched again since the rematch was queued, result dropped")
+                return True
+            data.matches = MatchRefs.from_matches(matches, cluster, cursor.x if cursor is not None else None)
+            data.cursor = cursor
+        return True
+    
+    get_admission_controller().enqueue_rematch(key, rematch)
+
+def journal_event(stage, **fields):
+    """Append one event of this session to the answer journal"""
+    get_answer_journal().append({'session': st.session_state.session_key, 'stage': stage, **fields})
+
+def record_answer(stage, question, code):
+    """Store an answer code for this session and journal it; returns the session data"""
+    data = session_data()
+    data.answers[stage].record(question, code)
+    journal_event(stage, question=question, code=code)
+    return data
+
+def journal_profile():
+    """Journal the profile fields the matching engine reads (no names or contact details)"""
+    profile = st.session_state.user_profile
+    journal_event('profile', profile={field: profile[field] for field in PROFILE_EVENT_FIELDS if field in profile})
 
 # Initialize session state
 def init_session_state():
     """Initialize session state variables"""
+    if 'session_key' in st.session_state and st.session_state.session_key not in get_session_store():
+        # Idle for longer than the TTL - the stored answers are gone, so start over
+        for key in list(st.session_state.keys()):
+            del st.session_state[key]
+        st.info("Your session expired after a period of inactivity. Please start again.")
+    if 'session_key' not in st.session_state:
+        st.session_state.session_key = uuid.uuid4().hex
+    # Every rerun marks the session active (`in` above does not), whichever page it renders
+    get_session_store().get(st.session_state.session_key)
     if 'page' not in st.session_state:
         st.session_state.page = 'welcome'
     if 'user_profile' not in st.session_state:
         st.session_state.user_profile = {}
     if 'questionnaire_answers' not in st.session_state:
         st.session_state.questionnaire_answers = {}
-    if 'entry_hall_answers' not in st.session_state:
-        st.session_state.entry_hall_answers = {}
     if 'door_answers' not in st.session_state:
         st.session_state.door_answers = {}
     if 'current_question' not in st.session_state:
         st.session_state.current_question = 0
     if 'matching_data_loaded' not in st.session_state:
         st.session_state.matching_data_loaded = False
-    if 'user_matches' not in st.session_state:
-        st.session_state.user_matches = None
     if 'user_cluster' not in st.session_state:
         st.session_state.user_cluster = None
 
@@ -312,19 +212,7 @@ def process_questionnaire_data():
         age = (datetime.today().date() - birthdate).days // 365
         st.session_state.user_profile['age'] = age
         
-        # Map to age groups (using regular hyphen to match CSV)
-        if age < 18:
-            st.session_state.user_profile['age_groups'] = 'Under 18'
-        elif age < 25:
-            st.session_state.user_profile['age_groups'] = '18-24'  # regular hyphen
-        elif age < 35:
-            st.session_state.user_profile['age_groups'] = '25-34'  # regular hyphen
-        elif age < 45:
-            st.session_state.user_profile['age_groups'] = '35-44'  # regular hyphen
-        elif age < 55:
-            st.session_state.user_profile['age_groups'] = '45-54'  # regular hyphen
-        else:
-            st.session_state.user_profile['age_groups'] = '55-64'  # Changed from '55+' to match CSV
+        st.session_state.user_profile['age_groups'] = group_label('age_groups', age)
     
     # Education level
     education_map = {
@@ -382,87 +270,11 @@ def process_questionnaire_data():
     # Relationship status
     st.session_state.user_profile['relationship_status'] = q_answers.get('q16', 'Single')
     
-    # Group mappings for continuous variables
-    
-    # Work hours (using en-dash to match CSV format)
-    work_hours = q_answers.get('q6', 40)
-    if work_hours <= 10:
-        work_hours_group = '0–10 hrs'  # en-dash
-    elif work_hours <= 20:
-        work_hours_group = '11–20 hrs'  # en-dash
-    elif work_hours <= 30:
-        work_hours_group = '21–30 hrs'  # en-dash
-    elif work_hours <= 40:
-        work_hours_group = '31–40 hrs'  # en-dash
-    elif work_hours <= 50:
-        work_hours_group = '41–50 hrs'  # en-dash
-    elif work_hours <= 60:
-        work_hours_group = '51–60 hrs'  # en-dash
-    else:
-        work_hours_group = '60+ hrs'
-    st.session_state.user_profile['work_hours_groups'] = work_hours_group
-    
-    # Sleep hours (using en-dash to match CSV format)
-    sleep_hours = q_answers.get('q8', 7)
-    if sleep_hours < 4:
-        sleep_hours_group = '<4 hrs'
-    elif sleep_hours <= 6:
-        sleep_hours_group = '4–6 hrs'  # en-dash
-    elif sleep_hours <= 8:
-        sleep_hours_group = '6–8 hrs'  # en-dash
-    elif sleep_hours <= 10:
-        sleep_hours_group = '8–10 hrs'  # en-dash
-    else:
-        sleep_hours_group = '10+ hrs'
-    st.session_state.user_profile['sleep_hours_groups'] = sleep_hours_group
-    
-    # Physical activity (using en-dash to match CSV format)
-    activity_hours = q_answers.get('q10', 5)
-    if activity_hours <= 1:
-        activity_group = 'Rarely (0–1)'  # en-dash
-    elif activity_hours <= 3:
-        activity_group = 'Light (2–3)'  # en-dash
-    elif activity_hours <= 5:
-        activity_group = 'Moderate (4–5)'  # en-dash - matches CSV
-    elif activity_hours <= 7:
-        activity_group = 'Active (6–7)'  # en-dash - matches CSV
-    elif activity_hours <= 14:
-        activity_group = 'Very Active (8–14)'  # en-dash
-    else:
-        activity_group = 'Extremely Active (15+)'
-    st.session_state.user_profile['physical_activity_groups'] = activity_group
-    
-    # Screen time (using en-dash to match CSV format)
-    screen_hours = q_answers.get('q11', 6)
-    if screen_hours <= 2:
-        screen_group = '<2 hrs'  # matches CSV
-    elif screen_hours <= 4:
-        screen_group = '2–4 hrs'  # en-dash
-    elif screen_hours <= 6:
-        screen_group = '4–6 hrs'  # en-dash
-    elif screen_hours <= 8:
-        screen_group = '6–8 hrs'  # en-dash
-    elif screen_hours <= 12:
-        screen_group = '8–12 hrs'  # en-dash
-    else:
-        screen_group = '12+ hrs'
-    st.session_state.user_profile['screen_time_groups'] = screen_group
-    
-    # Friends groups (using en-dash to match CSV format)
-    friends = q_answers.get('q15', 3)
-    if friends <= 0:
-        friends_group = '0'
-    elif friends <= 2:
-        friends_group = '0–2'  # en-dash - matches CSV
-    elif friends <= 4:
-        friends_group = '3–4'  # en-dash
-    elif friends <= 6:
-        friends_group = '5–6'  # en-dash
-    elif friends <= 8:
-        friends_group = '7–8'  # en-dash
-    else:
-        friends_group = '9 plus'
-    st.session_state.user_profile['friends_groups'] = friends_group
+    # Hobbies, blended into match scores through the hobby index
+    st.session_state.user_profile['hobbies'] = q_answers.get('q18') or []
+    
+    # Group labels of the continuous answers (work hours, sleep, activity, screen time, friends)
+    st.session_state.user_profile.update(session_groups(q_answers))
 
 def welcome_page():
     """Welcome page with introduction to Vita Nova"""
@@ -687,11 +499,31 @@ def initial_questionnaire_page():
             
             # Process questionnaire data for matching
             process_questionnaire_data()
+            journal_profile()
             
             st.success("Questionnaire completed!")
             st.session_state.page = 'entry_hall'
             st.rerun()
 
+# Entry Hall questions, option codes are 1-based positions in "options"
+ENTRY_HALL_QUESTIONS = [
+    {"text": "How would you describe your current mood?", "options": ["Very low", "Low", "Neutral", "Good", "Very good"]},
+    {"text": "What's your energy level right now?", "options": ["Exhausted", "Low energy", "Moderate", "High energy", "Very energetic"]},
+    {"text": "How well did you sleep last night?", "options": ["Very poorly", "Poorly", "Okay", "Well", "Very well"]},
+    {"text": "How motivated do you feel today?", "options": ["Not at all", "Slightly", "Moderately", "Very", "Extremely"]},
+    {"text": "How stressed are you feeling?", "options": ["Extremely stressed", "Very stressed", "Moderately stressed", "Slightly stressed", "Not stressed"]},
+    {"text": "How lonely do you feel right now?", "options": ["Very lonely", "Somewhat lonely", "Neutral", "Connected", "Very connected"]},
+    {"text": "How hopeful are you feeling about the future?", "options": ["Not hopeful", "Slightly hopeful", "Moderately hopeful", "Very hopeful", "Extremely hopeful"]},
+    {"text": "How satisfied are you with your life currently?", "options": ["Very dissatisfied", "Dissatisfied", "Neutral", "Satisfied", "Very satisfied"]},
+    {"text": "How would you rate your overall health today?", "options": ["Very poor", "Poor", "Fair", "Good", "Excellent"]},
+    {"text": "How balanced do you feel in your daily life?", "options": ["Very unbalanced", "Unbalanced", "Somewhat balanced", "Balanced", "Very balanced"]},
+    {"text": "How secure do you feel in your current situation?", "options": ["Very insecure", "Insecure", "Neutral", "Secure", "Very secure"]},
+    {"text": "How present and mindful do you feel right now?", "options": ["Not at all", "Slightly", "Moderately", "Very", "Extremely"]},
+    {"text": "Are you more introverted or extroverted today?", "options": ["Very introverted", "Introverted", "Balanced", "Extroverted", "Very extroverted"]},
+    {"text": "How bored are you feeling?", "options": ["Extremely bored", "Very bored", "Somewhat bored", "Not very bored", "Not bored at all"]},
+    {"text": "How much are you looking forward to the rest of your day?", "options": ["Not at all", "A little", "Moderately", "Quite a bit", "Very much"]}
+]
+
 def entry_hall_page():
     """Entry Hall with 15 baseline questions
     
@@ -713,23 +545,7 @@ def entry_hall_page():
     st.progress(progress, text=f"Question {current_q + 1} of {total_q}")
     
     # Entry Hall questions (placeholder structure)
-    entry_questions = [
-        {"text": "How would you describe your current mood?", "options": ["Very low", "Low", "Neutral", "Good", "Very good"]},
-        {"text": "What's your energy level right now?", "options": ["Exhausted", "Low energy", "Moderate", "High energy", "Very energetic"]},
-        {"text": "How well did you sleep last night?", "options": ["Very poorly", "Poorly", "Okay", "Well", "Very well"]},
-        {"text": "How motivated do you feel today?", "options": ["Not at all", "Slightly", "Moderately", "Very", "Extremely"]},
-        {"text": "How stressed are you feeling?", "options": ["Extremely stressed", "Very stressed", "Moderately stressed", "Slightly stressed", "Not stressed"]},
-        {"text": "How lonely do you feel right now?", "options": ["Very lonely", "Somewhat lonely", "Neutral", "Connected", "Very connected"]},
-        {"text": "How hopeful are you feeling about the future?", "options": ["Not hopeful", "Slightly hopeful", "Moderately hopeful", "Very hopeful", "Extremely hopeful"]},
-        {"text": "How satisfied are you with your life currently?", "options": ["Very dissatisfied", "Dissatisfied", "Neutral", "Satisfied", "Very satisfied"]},
-        {"text": "How would you rate your overall health today?", "options": ["Very poor", "Poor", "Fair", "Good", "Excellent"]},
-        {"text": "How balanced do you feel in your daily life?", "options": ["Very unbalanced", "Unbalanced", "Somewhat balanced", "Balanced", "Very balanced"]},
-        {"text": "How secure do you feel in your current situation?", "options": ["Very insecure", "Insecure", "Neutral", "Secure", "Very secure"]},
-        {"text": "How present and mindful do you feel right now?", "options": ["Not at all", "Slightly", "Moderately", "Very", "Extremely"]},
-        {"text": "Are you more introverted or extroverted today?", "options": ["Very introverted", "Introverted", "Balanced", "Extroverted", "Very extroverted"]},
-        {"text": "How bored are you feeling?", "options": ["Extremely bored", "Very bored", "Somewhat bored", "Not very bored", "Not bored at all"]},
-        {"text": "How much are you looking forward to the rest of your day?", "options": ["Not at all", "A little", "Moderately", "Quite a bit", "Very much"]}
-    ]
+    entry_questions = ENTRY_HALL_QUESTIONS
     
     if current_q < len(entry_questions):
         question = entry_questions[current_q]
@@ -751,8 +567,8 @@ def entry_hall_page():
             with col_next:
                 if st.button("Next →" if current_q < len(entry_questions) - 1 else "Complete Entry Hall", 
                            type="primary", use_container_width=True):
-                    # Store answer
-                    st.session_state.entry_hall_answers[f"q_{current_q}"] = answer
+                    # Store answer code
+                    record_answer('entry_hall', current_q, question['options'].index(answer) + 1)
                     
                     if current_q < len(entry_questions) - 1:
                         st.session_state.current_question += 1
@@ -762,14 +578,8 @@ def entry_hall_page():
                         # Note: Uses consistent polarity (1-5) for all questions in this prototype
                         # In production, reverse-coded items (stress, loneliness, boredom) should be reversed
                         
-                        # Get all answer scores and store numeric codes
-                        scores = []
-                        for i in range(len(entry_questions)):
-                            answer_text = st.session_state.entry_hall_answers[f"q_{i}"]
-                            answer_code = list(entry_questions[i]['options']).index(answer_text) + 1
-                            scores.append(answer_code)
-                            # Store numeric code for matching engine
-                            st.session_state.entry_hall_answers[f"q_{i}_code"] = answer_code
+                        # Get all answer scores
+                        scores = session_data().answers['entry_hall'].codes.astype(int).tolist()
                         
                         # Calculate overall Pulse Score
                         total_score = sum(scores)
@@ -799,6 +609,8 @@ def entry_hall_page():
                         st.session_state.user_profile['energy_index'] = st.session_state.energy_index
                         st.session_state.user_profile['social_index'] = st.session_state.social_index
                         st.session_state.user_profile['security_index'] = st.session_state.security_index
+                        journal_profile()
+                        record_completion('entry_hall')
                         
                         st.success(f"Entry Hall completed! Your Pulse Score: {st.session_state.pulse_score}/5.0")
                         st.session_state.page = 'door_selection'
@@ -847,6 +659,7 @@ def door_selection_page():
             st.session_state.page = 'door2'
             st.session_state.current_door = 2
             st.session_state.current_question = 0
+            st.session_state.pop('door2_matcher_built', None)  # rebuilt from the current profile on entry
             st.rerun()
     
     with col3:
@@ -863,6 +676,132 @@ def door_selection_page():
             st.session_state.current_door = 3
             st.session_state.current_question = 0
             st.rerun()
+    
+    st.markdown("---")
+    if st.button("📊 Community Pulse", key="analytics"):
+        st.session_state.page = 'analytics'
+        st.rerun()
+
+def analytics_page():
+    """Live Pulse Score and subscore distributions per path and cluster (cohort_analytics)"""
+    st.markdown('<h1 class="main-header">📊 Community Pulse</h1>', unsafe_allow_html=True)
+    analytics = get_cohort_analytics()
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        metric = st.selectbox("Score", COHORT_METRICS, format_func=lambda m: m.replace('_', ' ').title())
+    with col2:
+        period = st.radio("Period", ["All time", "Last 24 hours"], horizontal=True)
+    since = datetime.datetime.now().timestamp() - 24 * 3600 if period == "Last 24 hours" else None
+    
+    stage_labels = {'entry_hall': 'Entry Hall', 'door1': 'Door 1: Emotional Room', 'door2': 'Door 2: Connect Hub',
+                    'door3': 'Door 3: Guided Activity Spaces'}
+    st.markdown('<h2 class="section-header">By path</h2>', unsafe_allow_html=True)
+    by_stage = pd.DataFrame.from_dict(analytics.by_stage(metric, since), orient='index')
+    st.dataframe(by_stage.rename(index=stage_labels), use_container_width=True)
+    
+    st.markdown('<h2 class="section-header">By cluster (Connect Hub)</h2>', unsafe_allow_html=True)
+    by_cluster = pd.DataFrame.from_dict(analytics.by_cluster('door2', metric, since), orient='index')
+    st.dataframe(by_cluster.rename(index=lambda c: 'All clusters' if c == '*' else f"Cluster {c}"), use_container_width=True)
+    
+    st.markdown('<h2 class="section-header">Entry Hall, last 24 hours</h2>', unsafe_allow_html=True)
+    hourly = analytics.hourly_means('entry_hall', metric)
+    st.line_chart(pd.DataFrame({'hourly mean': [mean for _, mean in hourly]},
+                               index=pd.to_datetime([bucket for bucket, _ in hourly], unit='s')))
+    
+    st.markdown('<h2 class="section-header">Matching load</h2>', unsafe_allow_html=True)
+    st.caption(format_admission_metrics(get_admission_controller().metrics()))
+    
+    # PSI per feature and unknown-category rates of the last complete window of incoming users
+    st.markdown('<h2 class="section-header">Feature drift</h2>', unsafe_allow_html=True)
+    st.text(format_drift_metrics(get_drift_monitor().metrics()))
+    
+    if st.button("← Back to Doors", use_container_width=True):
+        st.session_state.page = 'door_selection'
+        st.rerun()
+
+# Door 1 resonance questions
+DOOR1_QUESTIONS = [
+    # === CURRENT EMOTIONAL STATE (Valence & Arousal) - Q16-Q25 ===
+    {"text": "Right now, I feel content and satisfied with my life", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I am experiencing feelings of joy or happiness at this moment", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I feel anxious or worried about things in my life", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I am feeling sad or down right now", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I feel energized and activated", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I am experiencing feelings of anger or frustration", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I feel calm and peaceful", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I am feeling excited or enthusiastic about something", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I feel bored or understimulated", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I am experiencing feelings of fear or unease", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    
+    # === EMOTIONAL INTENSITY - Q26-Q30 ===
+    {"text": "My emotions right now feel very intense and overwhelming", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I can easily identify what I'm feeling", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "My emotional state is fluctuating rapidly (changing quickly)", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I feel emotionally numb or disconnected", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "My emotions feel manageable and under control", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    
+    # === CONTEXTUAL TRIGGERS - Q31-Q40 ===
+    {"text": "My current mood is influenced by work or academic stress", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "Relationship issues are affecting how I feel right now", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "Physical health or pain is impacting my emotional state", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "Financial concerns are influencing my feelings", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "Social interactions today have shaped my mood", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "My living environment or home situation affects my emotions", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "Future worries or uncertainty impact how I feel", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "Past events or memories are influencing my current state", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "My emotional state is affected by the time of day or season", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "External events (news, world events) impact my mood", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    
+    # === RECENCY & DURATION - Q41-Q50 ===
+    {"text": "This emotional state started within the last few hours", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I've been feeling this way for several days", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "My mood changes multiple times throughout the day", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I can trace this feeling back to a specific recent event", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "This emotional pattern has persisted for weeks or longer", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    
+    # === EMOTIONAL PATTERNS & RECURRENCE - Q51-Q55 ===
+    {"text": "I experience similar emotions at the same time each day/week", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "Certain situations predictably trigger specific emotions in me", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "My emotional responses feel different than they used to be", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I notice recurring emotional themes or cycles in my life", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I feel emotionally similar to how I felt last week", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+]
 
 def door1_page():
     """Door 1: Emotional Room (40 questions)"""
@@ -875,87 +814,7 @@ def door1_page():
     
     # Door 1: 40 Resonance Questions (Emotion, Intensity, Context, Recency)
     # Based on Circumplex Model of Emotion (Russell), Affect Grid, CBT, Recency Effect
-    emotional_questions = [
-        # === CURRENT EMOTIONAL STATE (Valence & Arousal) - Q16-Q25 ===
-        {"text": "Right now, I feel content and satisfied with my life", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I am experiencing feelings of joy or happiness at this moment", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I feel anxious or worried about things in my life", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I am feeling sad or down right now", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I feel energized and activated", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I am experiencing feelings of anger or frustration", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I feel calm and peaceful", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I am feeling excited or enthusiastic about something", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I feel bored or understimulated", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I am experiencing feelings of fear or unease", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        
-        # === EMOTIONAL INTENSITY - Q26-Q30 ===
-        {"text": "My emotions right now feel very intense and overwhelming", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I can easily identify what I'm feeling", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "My emotional state is fluctuating rapidly (changing quickly)", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I feel emotionally numb or disconnected", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "My emotions feel manageable and under control", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        
-        # === CONTEXTUAL TRIGGERS - Q31-Q40 ===
-        {"text": "My current mood is influenced by work or academic stress", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "Relationship issues are affecting how I feel right now", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "Physical health or pain is impacting my emotional state", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "Financial concerns are influencing my feelings", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "Social interactions today have shaped my mood", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "My living environment or home situation affects my emotions", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "Future worries or uncertainty impact how I feel", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "Past events or memories are influencing my current state", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "My emotional state is affected by the time of day or season", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "External events (news, world events) impact my mood", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        
-        # === RECENCY & DURATION - Q41-Q50 ===
-        {"text": "This emotional state started within the last few hours", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I've been feeling this way for several days", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "My mood changes multiple times throughout the day", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I can trace this feeling back to a specific recent event", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "This emotional pattern has persisted for weeks or longer", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        
-        # === EMOTIONAL PATTERNS & RECURRENCE - Q51-Q55 ===
-        {"text": "I experience similar emotions at the same time each day/week", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "Certain situations predictably trigger specific emotions in me", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "My emotional responses feel different than they used to be", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I notice recurring emotional themes or cycles in my life", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I feel emotionally similar to how I felt last week", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-    ]
+    emotional_questions = DOOR1_QUESTIONS
     
     current_q = st.session_state.current_question
     total_q = min(len(emotional_questions), 40)
@@ -986,15 +845,15 @@ def door1_page():
             with col_next:
                 if st.button("Next →" if current_q < total_q - 1 else "Complete Journey", 
                            type="primary", use_container_width=True):
-                    # Store answer
-                    if 'door1_answers' not in st.session_state:
-                        st.session_state.door1_answers = {}
-                    st.session_state.door1_answers[f"q_{current_q}"] = answer
+                    # Store answer code
+                    record_answer('door1', current_q, question['options'].index(answer) + 1)
                     
                     if current_q < total_q - 1:
                         st.session_state.current_question += 1
                         st.rerun()
                     else:
+                        record_completion('door1')
+                        get_checkin_store().append(checkin_user(), score_door1(session_data().answers['door1'].codes))
                         st.session_state.page = 'completion'
                         st.rerun()
     
@@ -1003,6 +862,78 @@ def door1_page():
     st.markdown("### 🌲 Your Emotional Forest")
     st.info("Imagine: The forest around you shifts with your emotions - warmer colors for joy, cooler tones for calm, dynamic movements for excitement...")
 
+def entry_hall_answers_coded():
+    """Entry Hall answer codes keyed the way the matching engine expects (q_0..q_14)"""
+    return session_data().answers['entry_hall'].as_dict()
+
+def answers_as_text(answers, questions):
+    """{question text: chosen option} of the answered questions, for display"""
+    return {questions[i]['text']: questions[i]['options'][code - 1]
+            for i, code in enumerate(answers.codes.tolist()) if code}
+
+# Door 2 matching questions (Q56-Q80)
+DOOR2_QUESTIONS = [
+    # Q56-Q60: Contact & Connection Preferences
+    {"text": "How often do you want to connect with others?", 
+     "options": ["Once a month or less", "Few times a month", "Few times a week", "Daily", "Multiple times daily"]},
+    {"text": "What kind of people feel most natural to you?", 
+     "options": ["Reserved/Analytical", "Calm/Thoughtful", "Balanced/Flexible", "Warm/Social", "Energetic/Expressive"]},
+    {"text": "When you feel sad, what do you prefer?", 
+     "options": ["Alone time", "Light distraction", "Music/Creative outlet", "Talk it through", "Physical comfort"]},
+    {"text": "Which talk style do you prefer?", 
+     "options": ["Brief/Factual", "Practical/Clear", "Balanced", "Expressive/Detailed", "Deep/Exploratory"]},
+    {"text": "How quickly do you open up to new people?", 
+     "options": ["Very slowly", "Slowly", "Moderately", "Fairly quickly", "Very quickly"]},
+    
+    # Q61-Q65: Understanding & Sharing
+    {"text": "How important is being understood (not judged)?", 
+     "options": ["Not important", "Slightly important", "Moderately important", "Very important", "Extremely important"]},
+    {"text": "How comfortable are you with sharing personal stories?", 
+     "options": ["Very uncomfortable", "Uncomfortable", "Somewhat comfortable", "Comfortable", "Very comfortable"]},
+    {"text": "Do you prefer 1:1 or small groups?", 
+     "options": ["Always large groups", "Prefer groups", "No preference", "Prefer 1:1", "Always 1:1"]},
+    {"text": "Which connection mode do you prefer now?", 
+     "options": ["In person only", "Prefer in person", "Video/Voice chat", "Text/Chat", "Any mode works"]},
+    {"text": "How long do you want the first session to be?", 
+     "options": ["5-10 min", "10-15 min", "15-20 min", "20-30 min", "30+ min"]},
+    
+    # Q66-Q70: Topics & Emotional Space
+    {"text": "What topics feel safe right now?", 
+     "options": ["Light/Fun only", "Practical/Daily life", "Supportive/Caring", "Mixed topics", "Deep/Meaningful"]},
+    {"text": "What topics do you want to avoid?", 
+     "options": ["Deep emotions", "Relationships", "Politics/News", "Health/Body", "No restrictions"]},
+    {"text": "How often do you feel left out?", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Very often"]},
+    {"text": "Do you feel you belong in most social spaces?", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "How important is empathic listening?", 
+     "options": ["Not important", "Slightly important", "Moderately important", "Very important", "Extremely important"]},
+    
+    # Q71-Q75: Feedback & Boundaries
+    {"text": "How do you prefer feedback?", 
+     "options": ["Direct/Blunt", "Clear but tactful", "Honest & gentle", "Very gentle", "Only positive"]},
+    {"text": "Are boundaries important to mention first?", 
+     "options": ["Never mention", "Rarely mention", "Sometimes", "Often", "Always upfront"]},
+    {"text": "Which boundary applies now?", 
+     "options": ["Need lots of space", "Prefer some space", "Flexible", "Open to closeness", "No boundaries"]},
+    {"text": "How spontaneous do you like connections to be?", 
+     "options": ["Always planned", "Prefer planned", "Somewhat flexible", "Prefer spontaneous", "Totally spontaneous"]},
+    {"text": "What time of day do you prefer?", 
+     "options": ["Early morning", "Morning", "Afternoon", "Evening", "Late night"]},
+    
+    # Q76-Q80: Conversation Dynamics & Follow-up
+    {"text": "What energizes you in conversations?", 
+     "options": ["Humor/Lightness", "Shared interests", "Learning new things", "Empathy/Care", "Deep connection"]},
+    {"text": "What drains you in conversations?", 
+     "options": ["Conflict/Tension", "Small talk", "Negativity", "Too much emotion", "Long silences"]},
+    {"text": "Do you like follow-up connections with the same person?", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "Would you like to set a small intention together?", 
+     "options": ["No", "Maybe", "Neutral", "Yes", "Definitely yes"]},
+    {"text": "After connecting, would you give quick feedback?", 
+     "options": ["Never", "Unlikely", "Maybe", "Likely", "Definitely"]},
+]
+
 def door2_page():
     """Door 2: Connect Hub (25 questions)"""
     st.markdown('<h1 class="main-header">⭐ Connect Hub</h1>', unsafe_allow_html=True)
@@ -1015,71 +946,26 @@ def door2_page():
     # Door 2: 25 Matching Questions (Communication & Interaction Preferences)
     # Based on Interpersonal Compatibility Theory & Similarity-Attraction Paradigm
     # Client's specific questions Q56-Q80
-    connect_questions = [
-        # Q56-Q60: Contact & Connection Preferences
-        {"text": "How often do you want to connect with others?", 
-         "options": ["Once a month or less", "Few times a month", "Few times a week", "Daily", "Multiple times daily"]},
-        {"text": "What kind of people feel most natural to you?", 
-         "options": ["Reserved/Analytical", "Calm/Thoughtful", "Balanced/Flexible", "Warm/Social", "Energetic/Expressive"]},
-        {"text": "When you feel sad, what do you prefer?", 
-         "options": ["Alone time", "Light distraction", "Music/Creative outlet", "Talk it through", "Physical comfort"]},
-        {"text": "Which talk style do you prefer?", 
-         "options": ["Brief/Factual", "Practical/Clear", "Balanced", "Expressive/Detailed", "Deep/Exploratory"]},
-        {"text": "How quickly do you open up to new people?", 
-         "options": ["Very slowly", "Slowly", "Moderately", "Fairly quickly", "Very quickly"]},
-        
-        # Q61-Q65: Understanding & Sharing
-        {"text": "How important is being understood (not judged)?", 
-         "options": ["Not important", "Slightly important", "Moderately important", "Very important", "Extremely important"]},
-        {"text": "How comfortable are you with sharing personal stories?", 
-         "options": ["Very uncomfortable", "Uncomfortable", "Somewhat comfortable", "Comfortable", "Very comfortable"]},
-        {"text": "Do you prefer 1:1 or small groups?", 
-         "options": ["Always large groups", "Prefer groups", "No preference", "Prefer 1:1", "Always 1:1"]},
-        {"text": "Which connection mode do you prefer now?", 
-         "options": ["In person only", "Prefer in person", "Video/Voice chat", "Text/Chat", "Any mode works"]},
-        {"text": "How long do you want the first session to be?", 
-         "options": ["5-10 min", "10-15 min", "15-20 min", "20-30 min", "30+ min"]},
-        
-        # Q66-Q70: Topics & Emotional Space
-        {"text": "What topics feel safe right now?", 
-         "options": ["Light/Fun only", "Practical/Daily life", "Supportive/Caring", "Mixed topics", "Deep/Meaningful"]},
-        {"text": "What topics do you want to avoid?", 
-         "options": ["Deep emotions", "Relationships", "Politics/News", "Health/Body", "No restrictions"]},
-        {"text": "How often do you feel left out?", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Very often"]},
-        {"text": "Do you feel you belong in most social spaces?", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "How important is empathic listening?", 
-         "options": ["Not important", "Slightly important", "Moderately important", "Very important", "Extremely important"]},
-        
-        # Q71-Q75: Feedback & Boundaries
-        {"text": "How do you prefer feedback?", 
-         "options": ["Direct/Blunt", "Clear but tactful", "Honest & gentle", "Very gentle", "Only positive"]},
-        {"text": "Are boundaries important to mention first?", 
-         "options": ["Never mention", "Rarely mention", "Sometimes", "Often", "Always upfront"]},
-        {"text": "Which boundary applies now?", 
-         "options": ["Need lots of space", "Prefer some space", "Flexible", "Open to closeness", "No boundaries"]},
-        {"text": "How spontaneous do you like connections to be?", 
-         "options": ["Always planned", "Prefer planned", "Somewhat flexible", "Prefer spontaneous", "Totally spontaneous"]},
-        {"text": "What time of day do you prefer?", 
-         "options": ["Early morning", "Morning", "Afternoon", "Evening", "Late night"]},
-        
-        # Q76-Q80: Conversation Dynamics & Follow-up
-        {"text": "What energizes you in conversations?", 
-         "options": ["Humor/Lightness", "Shared interests", "Learning new things", "Empathy/Care", "Deep connection"]},
-        {"text": "What drains you in conversations?", 
-         "options": ["Conflict/Tension", "Small talk", "Negativity", "Too much emotion", "Long silences"]},
-        {"text": "Do you like follow-up connections with the same person?", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "Would you like to set a small intention together?", 
-         "options": ["No", "Maybe", "Neutral", "Yes", "Definitely yes"]},
-        {"text": "After connecting, would you give quick feedback?", 
-         "options": ["Never", "Unlikely", "Maybe", "Likely", "Definitely"]},
-    ]
+    connect_questions = DOOR2_QUESTIONS
     
     current_q = st.session_state.current_question
     total_q = min(len(connect_questions), 25)
     
+    # Profile and Entry Hall features are already known: precompute the similarity
+    # accumulators now so each answer only updates them
+    if not st.session_state.get('door2_matcher_built'):
+        st.session_state.door2_matcher_built = True
+        session_data().matcher = None
+        try:
+            if not st.session_state.matching_data_loaded and load_matching_data():
+                st.session_state.matching_data_loaded = True
+            if st.session_state.matching_data_loaded:
+                session_data().matcher = start_incremental_match(
+                    st.session_state.user_profile, entry_hall_answers_coded()
+                )
+        except Exception as e:
+            print(f"[WARNING] Could not start incremental matching: {e}")
+    
     if current_q < total_q:
         progress = (current_q + 1) / total_q
         st.progress(progress, text=f"Question {current_q + 1} of {total_q}")
@@ -1106,10 +992,11 @@ def door2_page():
             with col_next:
                 if st.button("Next →" if current_q < total_q - 1 else "Complete Journey", 
                            type="primary", use_container_width=True):
-                    # Store answer
-                    if 'door2_answers' not in st.session_state:
-                        st.session_state.door2_answers = {}
-                    st.session_state.door2_answers[f"q_{current_q}"] = answer
+                    # Store answer code
+                    answer_code = question['options'].index(answer) + 1
+                    data = record_answer('door2', current_q, answer_code)
+                    if data.matcher is not None:
+                        data.matcher.record_answer(current_q, answer_code)
                     
                     if current_q < total_q - 1:
                         st.session_state.current_question += 1
@@ -1117,16 +1004,8 @@ def door2_page():
                     else:
                         # Calculate Matching Score for Door 2 (Connect Hub)
                         # This represents how well the user's profile matches for connections
-                        door2_scores = []
-                        door2_answers_coded = {}
-                        
-                        for i in range(min(len(connect_questions), 25)):
-                            if f"q_{i}" in st.session_state.door2_answers:
-                                answer_text = st.session_state.door2_answers[f"q_{i}"]
-                                answer_code = connect_questions[i]['options'].index(answer_text) + 1
-                                door2_scores.append(answer_code)
-                                # Store numeric code for matching engine
-                                door2_answers_coded[f"q_{i}"] = answer_code
+                        door2_answers_coded = data.answers['door2'].as_dict()
+                        door2_scores = list(door2_answers_coded.values())
                         
                         # Calculate matching score (average of all responses)
                         if door2_scores:
@@ -1141,38 +1020,66 @@ def door2_page():
                                     st.session_state.matching_data_loaded = True
                                 else:
                                     st.error("Failed to load matching models. Using placeholder recommendations.")
-                                    st.session_state.user_matches = None
+                                    data.matches = None
                                     st.session_state.user_cluster = None
                             
                             if st.session_state.matching_data_loaded:
-                                # Prepare entry hall answers coded
-                                entry_hall_coded = {}
-                                for i in range(15):
-                                    key = f"q_{i}_code"
-                                    if key in st.session_state.entry_hall_answers:
-                                        entry_hall_coded[f"q_{i}"] = st.session_state.entry_hall_answers[key]
+                                matcher = data.matcher
+                                entry_hall_answers = entry_hall_answers_coded()
                                 
-                                # Get match recommendations
-                                matches, cluster = get_user_matches(
-                                    user_profile=st.session_state.user_profile,
-                                    entry_hall_answers=entry_hall_coded,
-                                    door2_answers=door2_answers_coded,
-                                    top_n=5
+                                def full_match():
+                                    if matcher is not None:
+                                        # Accumulators are up to date - only top-k selection is left
+                                        matches, cluster, cursor = finish_incremental_match(
+                                            matcher, top_n=5, with_cursor=True
+                                        )
+                                    else:
+                                        # Get match recommendations
+                                        matches, cluster, cursor = get_user_matches(
+                                            user_profile=st.session_state.user_profile,
+                                            entry_hall_answers=entry_hall_answers,
+                                            door2_answers=door2_answers_coded,
+                                            top_n=5,
+                                            with_cursor=True
+                                        )
+                                    return matches, cluster, cursor, cursor.x if cursor is not None else None
+                                
+                                def quick_match():
+                                    # Representative users of the cluster, served when the engine is overloaded
+                                    matches, cluster, x = degraded_matches(
+                                        st.session_state.user_profile, entry_hall_answers, door2_answers_coded, matcher
+                                    )
+                                    return matches, cluster, None, x
+                                
+                                # A rematch queued by an earlier completion must not overwrite this one
+                                data.match_generation += 1
+                                controller = get_admission_controller()
+                                (matches, cluster, cursor, x), degraded = controller.call(
+                                    full_match, quick_match, failed=lambda result: result[0] is None
                                 )
+                                if not degraded:
+                                    controller.cancel_rematch(st.session_state.session_key)
                                 
+                                # Only ids and scores are kept; the accumulators are no longer needed
+                                data.matcher = None
+                                data.cursor = cursor
                                 if matches is not None:
-                                    st.session_state.user_matches = matches
+                                    data.matches = MatchRefs.from_matches(matches, cluster, x, degraded)
                                     st.session_state.user_cluster = cluster
+                                    if degraded:
+                                        queue_rematch(entry_hall_answers, door2_answers_coded,
+                                                      data.match_generation)
                                 else:
-                                    st.session_state.user_matches = None
+                                    data.matches = None
                                     st.session_state.user_cluster = None
                         except Exception as e:
                             st.error(f"Matching engine error: {str(e)}")
                             import traceback
                             traceback.print_exc()
-                            st.session_state.user_matches = None
+                            data.matches = None
                             st.session_state.user_cluster = None
                         
+                        record_completion('door2', st.session_state.user_cluster)
                         st.session_state.page = 'completion'
                         st.rerun()
     
@@ -1181,6 +1088,57 @@ def door2_page():
     st.markdown("### ✨ Your Connection Star Map")
     st.info("Imagine: Each star represents a person with similar emotional patterns. Brighter stars indicate stronger resonance...")
 
+# Door 3 adherence questions (Q81-Q100)
+DOOR3_QUESTIONS = [
+    # === COMPLETION/DOING (50% weight) - Q81-Q90 ===
+    {"text": "I complete guided wellness activities (meditation, journaling, exercise) when recommended", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I follow through on wellness activities even when I don't feel like it", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I engage in mindfulness or meditation practices regularly", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I complete journaling or reflection exercises when suggested", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I participate in physical movement or exercise activities as planned", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I finish wellness activities once I start them (don't quit halfway)", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I make time for self-care activities in my daily schedule", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I engage with digital wellness tools or apps consistently", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I complete breathing exercises or relaxation techniques when prompted", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I track my wellness activities or progress regularly", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    
+    # === EFFECTIVENESS/USEFULNESS (30% weight) - Q91-Q95 ===
+    {"text": "Guided wellness activities actually improve my mood or stress levels", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I notice positive changes in my wellbeing after completing activities", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "Meditation or mindfulness exercises help me feel more centered", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "Journaling or reflection activities provide me with valuable insights", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "Physical activities or movement improve my energy and mood", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    
+    # === REPEAT INTENTION (10% weight) - Q96-Q97 ===
+    {"text": "I intend to continue wellness activities in the future", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I would recommend guided wellness activities to others", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    
+    # === BARRIERS/HURDLES (10% weight - reverse scored) - Q98-Q100 ===
+    {"text": "I forget to do wellness activities even when I plan to", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "Lack of time prevents me from completing wellness activities", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+    {"text": "I feel too tired or unmotivated to engage in wellness practices", 
+     "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
+]
+
 def door3_page():
     """Door 3: Guided Activity Spaces (20 questions)"""
     st.markdown('<h1 class="main-header">🎯 Guided Activity Spaces</h1>', unsafe_allow_html=True)
@@ -1193,55 +1151,7 @@ def door3_page():
     # Door 3: 20 Adherence Questions (Activity Engagement & Consistency)
     # Based on Morisky Adherence Scale, Habit Formation (BJ Fogg), Digital Mental Health
     # Formula: 50% completion + 30% effect + 10% repeat intention + 10% barriers
-    activity_questions = [
-        # === COMPLETION/DOING (50% weight) - Q81-Q90 ===
-        {"text": "I complete guided wellness activities (meditation, journaling, exercise) when recommended", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I follow through on wellness activities even when I don't feel like it", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I engage in mindfulness or meditation practices regularly", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I complete journaling or reflection exercises when suggested", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I participate in physical movement or exercise activities as planned", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I finish wellness activities once I start them (don't quit halfway)", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I make time for self-care activities in my daily schedule", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I engage with digital wellness tools or apps consistently", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I complete breathing exercises or relaxation techniques when prompted", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I track my wellness activities or progress regularly", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        
-        # === EFFECTIVENESS/USEFULNESS (30% weight) - Q91-Q95 ===
-        {"text": "Guided wellness activities actually improve my mood or stress levels", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I notice positive changes in my wellbeing after completing activities", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "Meditation or mindfulness exercises help me feel more centered", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "Journaling or reflection activities provide me with valuable insights", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "Physical activities or movement improve my energy and mood", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        
-        # === REPEAT INTENTION (10% weight) - Q96-Q97 ===
-        {"text": "I intend to continue wellness activities in the future", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I would recommend guided wellness activities to others", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        
-        # === BARRIERS/HURDLES (10% weight - reverse scored) - Q98-Q100 ===
-        {"text": "I forget to do wellness activities even when I plan to", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "Lack of time prevents me from completing wellness activities", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-        {"text": "I feel too tired or unmotivated to engage in wellness practices", 
-         "options": ["Never", "Rarely", "Sometimes", "Often", "Always"]},
-    ]
+    activity_questions = DOOR3_QUESTIONS
     
     current_q = st.session_state.current_question
     total_q = min(len(activity_questions), 20)
@@ -1272,15 +1182,14 @@ def door3_page():
             with col_next:
                 if st.button("Next →" if current_q < total_q - 1 else "Complete Journey", 
                            type="primary", use_container_width=True):
-                    # Store answer
-                    if 'door3_answers' not in st.session_state:
-                        st.session_state.door3_answers = {}
-                    st.session_state.door3_answers[f"q_{current_q}"] = answer
+                    # Store answer code
+                    record_answer('door3', current_q, question['options'].index(answer) + 1)
                     
                     if current_q < total_q - 1:
                         st.session_state.current_question += 1
                         st.rerun()
                     else:
+                        record_completion('door3')
                         st.session_state.page = 'completion'
                         st.rerun()
     
@@ -1342,6 +1251,37 @@ def completion_page():
     
     st.markdown("---")
     
+    # Check-in trend of the Emotional Room, from the daily and weekly rollups
+    if st.session_state.get('current_door') == 1:
+        st.markdown("### 📈 Your Check-in Trend")
+        store = get_checkin_store()
+        trend = store.trend(checkin_user())
+        trend_cols = st.columns(len(CHECKIN_TREND_METRICS))
+        for col, metric in zip(trend_cols, CHECKIN_TREND_METRICS):
+            summary = trend[metric]
+            with col:
+                st.metric(f"{metric.title()} (7-day mean)",
+                          f"{summary['rolling_7d']:.2f}" if summary['rolling_7d'] is not None else "-",
+                          f"{summary['change']:+.2f} vs last week" if summary['change'] is not None else None)
+        if trend['checkins'] > 1:
+            series = store.series(checkin_user())
+            chart = pd.DataFrame({metric.title(): dict(series.rolling_series(metric, days=30))
+                                  for metric in CHECKIN_TREND_METRICS})
+            chart.index = pd.to_datetime(chart.index, unit='D')
+            st.line_chart(chart)
+        st.caption(f"{trend['checkins']} check-in(s) so far - come back to the Emotional Room to follow your trend. "
+                   "Bookmark this page: its link holds your private check-in code, so keep it to yourself.")
+        st.markdown("---")
+    
+    # Activities picked from the Door 3 adherence answers and Entry Hall subscores
+    door3_answers = session_data().answers['door3']
+    if st.session_state.get('current_door') == 3 and door3_answers.answered():
+        st.markdown("### 🎯 Your Recommended Activities")
+        recommendations = get_activity_recommender().recommend(door3_answers.codes, st.session_state.user_profile)
+        for activity in recommendations:
+            st.write(f"• **{activity['name']}** ({activity['duration_min']} min) - {activity['reason']}")
+        st.markdown("---")
+    
     # User Matching Recommendations Section
     st.markdown("### 🔗 User Matching Recommendations")
     
@@ -1354,11 +1294,23 @@ def completion_page():
     door = st.session_state.get('current_door', 1)
     
     # Check if we have real matches (from Door 2)
-    if door == 2 and st.session_state.user_matches is not None and len(st.session_state.user_matches) > 0:
-        # Display REAL matched users
-        cluster = st.session_state.user_cluster
-        
-        st.success(f"✨ Found {len(st.session_state.user_matches)} compatible users in your emotional wellness cluster (Cluster {cluster})!")
+    data = session_data()
+    if door == 2 and data.matches is not None and len(data.matches) > 0:
+        # Display REAL matched users - display fields are looked up now, the session keeps ids and scores
+        cluster = data.matches.cluster
+        # A background rematch may have replaced the quick matches, possibly from another cluster
+        st.session_state.user_cluster = cluster
+        user_matches = match_details(data.matches.user_ids, data.matches.scores, data.matches.cluster,
+                                     data.matches.x, data.matches.hybrid)
+        
+        st.success(f"✨ Found {len(user_matches)} compatible users in your emotional wellness cluster (Cluster {cluster})!")
+        
+        if data.matches.degraded:
+            # Served by admission control under load; a full rematch replaces these when it finishes
+            st.info("⏳ Vita Nova is busy right now, so these are quick matches with the most representative "
+                    "members of your cluster. Your full matches are being prepared - refresh to see them.")
+            if st.button("🔄 Refresh matches"):
+                st.rerun()
         
         st.info("""
         **You've been matched with users based on:**
@@ -1371,12 +1323,13 @@ def completion_page():
         st.markdown("#### 🌟 Your Top Matches:")
         
         # Display top 5 matches (user_matches is now a list of dicts)
-        for idx, match_dict in enumerate(st.session_state.user_matches, 1):
+        for idx, match_dict in enumerate(user_matches, 1):
             match = format_match_profile(match_dict)
             
-            # Create expandable section for each match
+            # Create expandable section for each match, headed by the score it was ranked by
             similarity_pct = match['similarity_score'] * 100
-            with st.expander(f"**Match #{idx}: {match['first_name']} {match['last_name']}** (Similarity: {similarity_pct:.1f}%)", expanded=(idx <= 2)):
+            match_pct = match['match_score'] * 100
+            with st.expander(f"**Match #{idx}: {match['first_name']} {match['last_name']}** (Match: {match_pct:.1f}%)", expanded=(idx <= 2)):
                 col_a, col_b = st.columns(2)
                 
                 with col_a:
@@ -1390,21 +1343,54 @@ def completion_page():
                 
                 with col_b:
                     st.markdown("**Compatibility:**")
+                    st.write(f"• Match Score: {match_pct:.1f}%")
                     st.write(f"• Similarity Score: {similarity_pct:.1f}%")
+                    if match['hobby_overlap'] is not None:
+                        # Hobby overlap is blended into the ranking, so it explains any reordering by similarity
+                        st.write(f"• Shared Hobbies: {match['hobby_overlap'] * 100:.0f}% overlap")
                     st.write(f"• Cluster: {match['cluster']}")
                     st.write("")
                     
                     # Show general compatibility notes
                     st.markdown("**Why this match?**")
-                    if match['similarity_score'] > 0.95:
-                        st.write("✓ Exceptionally high similarity score (>95%)")
-                    elif match['similarity_score'] > 0.90:
-                        st.write("✓ Very high similarity score (>90%)")
-                    elif match['similarity_score'] > 0.85:
-                        st.write("✓ Strong similarity score (>85%)")
-                    
+                    # The bands are cosine similarity; other kernels score on other scales
+                    if matching_engine.similarity_kernel == 'cosine':
+                        if match['similarity_score'] > 0.95:
+                            st.write("✓ Exceptionally high similarity score (>95%)")
+                        elif match['similarity_score'] > 0.90:
+                            st.write("✓ Very high similarity score (>90%)")
+                        elif match['similarity_score'] > 0.85:
+                            st.write("✓ Strong similarity score (>85%)")
+
+                    # Share of the similarity score contributed by each group of answers
+                    explanation = match_dict.get('explanation')
+                    # Shares of the cosine the explanation decomposes, whichever kernel ranked the match
+                    if explanation and explanation['cosine'] > 0:
+                        for group, contribution in explanation['groups'].items():
+                            share = contribution / explanation['cosine'] * 100
+                            st.write(f"✓ {group}: {share:.0f}% of your similarity")
+                        closest = ", ".join(label for label, _ in explanation['top_features'])
+                        st.write(f"✓ Strongest shared answers: {closest}")
+
                     st.write(f"✓ Same emotional wellness cluster ({match['cluster']})")
                     st.write(f"✓ Similar connection preferences and communication style")
+                    if match_dict.get('reciprocal'):
+                        st.write("✓ Mutual match - you would be among their top matches too")
+        
+        # Further matches come from the cursor's cached ordering, no rescoring
+        cursor = data.cursor
+        if cursor is not None and cursor.remaining > 0:
+            if st.button("🔽 Show more matches"):
+                data.matches.extend(*cursor.next_page(5, with_ranking=True))
+                st.rerun()
+        
+        # Neighbours of the matches, served from the precomputed graph
+        similar_people = people_similar_to_matches(user_matches, limit=5)
+        if similar_people:
+            st.markdown("#### 👥 People Similar to Your Matches:")
+            for person in similar_people:
+                profile = format_match_profile(person)
+                st.write(f"• {profile['first_name']} {profile['last_name']} ({profile['age']}, {profile['gender']})")
         
         st.markdown("")
         st.markdown("**Matching Algorithm:**")
@@ -1462,6 +1448,7 @@ def completion_page():
     with col1:
         if st.button("🏠 Start Over", use_container_width=True):
             # Reset session state
+            get_session_store().drop(st.session_state.session_key)
             for key in list(st.session_state.keys()):
                 del st.session_state[key]
             st.session_state.page = 'welcome'
@@ -1484,22 +1471,31 @@ def completion_page():
         st.markdown("### 📝 Your Responses")
         
         with st.expander("Entry Hall Responses"):
-            st.json(st.session_state.entry_hall_answers)
+            st.json(answers_as_text(session_data().answers['entry_hall'], ENTRY_HALL_QUESTIONS))
         
         with st.expander("Initial Questionnaire"):
             st.json(st.session_state.questionnaire_answers)
         
-        door_key = f"door{st.session_state.get('current_door', 1)}_answers"
-        if door_key in st.session_state:
-            with st.expander(f"Door {st.session_state.get('current_door', 1)} Responses"):
-                st.json(st.session_state[door_key])
+        door = st.session_state.get('current_door', 1)
+        door_answers = session_data().answers[f"door{door}"]
+        if door_answers.answered():
+            door_questions = {1: DOOR1_QUESTIONS, 2: DOOR2_QUESTIONS, 3: DOOR3_QUESTIONS}[door]
+            with st.expander(f"Door {door} Responses"):
+                st.json(answers_as_text(door_answers, door_questions))
 
 # Main app logic
 def main():
+    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
     init_session_state()
+    get_model_refresh()
+    get_drift_monitor()
     
     # Navigation
     page = st.session_state.page
+    if st.session_state.get('journaled_page') != page:
+        # Page transitions and answer timestamps let traffic_replay.py replay real flows
+        st.session_state.journaled_page = page
+        journal_event('page', page=page)
     
     if page == 'welcome':
         welcome_page()
@@ -1519,6 +1515,13 @@ def main():
         door3_page()
     elif page == 'completion':
         completion_page()
+    elif page == 'analytics':
+        analytics_page()
 
 if __name__ == "__main__":
-    main()
+    if profiling_enabled(st.query_params):
+        # Tagged with the page and question the rerun started on
+        run_profiled(main, page=st.session_state.get('page', 'welcome'),
+                     question=st.session_state.get('current_question', 0))
+    else:
+        main()
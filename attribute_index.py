@@ -0,0 +1,175 @@
+"""
+Prebuilt bitmap indexes for attribute-filtered matching.
+
+For every cluster block and every filterable categorical column, one packed
+bitmap (np.packbits, one bit per row) is kept per value. A filter such as
+{'gender': 'Female', 'age_groups': ['18-24', '25-34']} is resolved by OR-ing
+the bitmaps of the allowed values of each column and AND-ing the columns,
+all on packed bytes, before the similarity kernel runs. Only the surviving
+rows are scored, so selective filters get cheaper rather than dearer.
+
+Run `python attribute_index.py --bench` to compare against filtering a
+pandas frame per request.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+# Encoded columns of the cluster table that can be filtered on
+FILTERABLE_CLUSTER_COLUMNS = ['gender', 'education_level', 'occupation_status', 'diet_type', 'stress_level',
+                              'has_mental_health_condition', 'mental_health_condition', 'relationship_status',
+                              'age_groups', 'work_hours_groups', 'sleep_hours_groups',
+                              'physical_activity_groups', 'screen_time_groups', 'friends_groups']
+# Filterable columns that only exist in user_profiles.csv
+FILTERABLE_PROFILE_COLUMNS = ['country']
+
+
+class AttributeIndex:
+    """Packed per-value bitmaps of the filterable columns of one cluster block"""
+
+    def __init__(self, n_rows, bitmaps):
+        self.n_rows = n_rows
+        self.bitmaps = bitmaps   # column -> {code: packed uint8 bitmap}
+
+    @classmethod
+    def build(cls, n_rows, column_codes):
+        """Build from {column: integer code per row}"""
+        bitmaps = {}
+        for col, codes in column_codes.items():
+            codes = np.asarray(codes)
+            bitmaps[col] = {int(value): np.packbits(codes == value) for value in np.unique(codes)}
+        return cls(n_rows, bitmaps)
+
+    def nbytes(self):
+        return sum(bits.nbytes for values in self.bitmaps.values() for bits in values.values())
+
+    def select(self, predicates):
+        """
+        Row positions matching every predicate, in ascending order.
+
+        predicates maps a column to the list of allowed codes; columns not in
+        the index match nothing.
+        """
+        combined = None
+        for col, codes in predicates.items():
+            values = self.bitmaps.get(col, {})
+            allowed = None
+            for code in codes:
+                bits = values.get(code)
+                if bits is not None:
+                    allowed = bits.copy() if allowed is None else np.bitwise_or(allowed, bits, out=allowed)
+            if allowed is None:
+                return np.empty(0, dtype=np.intp)
+            combined = allowed if combined is None else np.bitwise_and(combined, allowed, out=combined)
+
+        if combined is None:
+            return np.arange(self.n_rows)
+        return np.flatnonzero(np.unpackbits(combined, count=self.n_rows))
+
+
+def build_attribute_indexes(cluster_arrays, feature_columns, profiles):
+    """One AttributeIndex per cluster, over the encoded cluster columns and profile-only columns"""
+    positions = {col: feature_columns.index(col) for col in FILTERABLE_CLUSTER_COLUMNS if col in feature_columns}
+    indexes = {}
+    for cluster, block in cluster_arrays.items():
+        column_codes = {col: block.features[:, pos].astype(np.int16) for col, pos in positions.items()}
+        for col in FILTERABLE_PROFILE_COLUMNS:
+            if col in profiles.columns:
+                # Category codes of the profile column, aligned with the block's row order (-1 if missing)
+                aligned = profiles[col].reindex(block.user_ids)
+                column_codes[col] = aligned.cat.codes.to_numpy()
+        indexes[cluster] = AttributeIndex.build(len(block.user_ids), column_codes)
+    return indexes
+
+
+def filter_codes(filters, encoders, profiles):
+    """
+    Translate a filter of raw labels into codes.
+
+    filters maps a column to one label or a list of labels, e.g.
+    {'gender': 'Female', 'age_groups': ['18-24', '25-34'], 'country': 'Canada'}.
+    Unknown labels are dropped; a column left with no known label matches nothing.
+    """
+    predicates = {}
+    for col, labels in (filters or {}).items():
+        if not isinstance(labels, (list, tuple, set)):
+            labels = [labels]
+        if col in FILTERABLE_PROFILE_COLUMNS:
+            categories = profiles[col].cat.categories
+            codes = [int(code) for code in categories.get_indexer(list(labels)) if code >= 0]
+        elif col in encoders:
+            codes = [int(encoders[col][label]) for label in labels if label in encoders[col]]
+        elif col in FILTERABLE_CLUSTER_COLUMNS:
+            codes = [int(label) for label in labels]
+        else:
+            raise KeyError(f"Column {col!r} is not filterable")
+        predicates[col] = codes
+    return predicates
+
+
+# ============================================================================
+# Benchmark
+# ============================================================================
+
+def benchmark(n_rows, repeats=20):
+    from cluster_search import cosine_scores, top_k_indices
+
+    rng = np.random.default_rng(0)
+    n_features = 60
+    features = rng.integers(1, 6, size=(n_rows, n_features)).astype(np.float32)
+    norms = np.linalg.norm(features.astype(np.float64), axis=1)
+    columns = {
+        'gender': rng.integers(0, 3, n_rows),
+        'age_groups': rng.integers(0, 5, n_rows),
+        'relationship_status': rng.integers(0, 4, n_rows),
+        'country': rng.integers(0, 11, n_rows),
+    }
+    frame = pd.DataFrame(features)
+    for col, codes in columns.items():
+        frame[col] = codes
+    x = rng.integers(1, 6, size=n_features).astype(np.float64)
+
+    start = time.perf_counter()
+    index = AttributeIndex.build(n_rows, columns)
+    print(f"{n_rows} rows: index built in {time.perf_counter() - start:.3f} s, {index.nbytes() / 1e6:.1f} MB")
+
+    cases = {
+        'gender': {'gender': [1]},
+        'gender+age': {'gender': [1], 'age_groups': [0, 1]},
+        'gender+age+rel+country': {'gender': [1], 'age_groups': [0], 'relationship_status': [3], 'country': [2]},
+    }
+    print(f"{'filter':>24} {'survivors':>10} {'pandas ms':>10} {'bitmap ms':>10}")
+    for name, predicates in cases.items():
+        start = time.perf_counter()
+        for _ in range(repeats):
+            mask = np.ones(n_rows, dtype=bool)
+            for col, codes in predicates.items():
+                mask &= frame[col].isin(codes).to_numpy()
+            subset = frame.loc[mask]
+            scores = cosine_scores(subset.iloc[:, :n_features].to_numpy(dtype=np.float32),
+                                   norms[mask], x)
+            top_k_indices(scores, 5)
+        pandas_ms = (time.perf_counter() - start) / repeats * 1e3
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            rows = index.select(predicates)
+            scores = cosine_scores(features[rows], norms[rows], x)
+            top_k_indices(scores, 5)
+        bitmap_ms = (time.perf_counter() - start) / repeats * 1e3
+        print(f"{name:>24} {len(rows):>10} {pandas_ms:>10.2f} {bitmap_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bitmap attribute indexes for filtered matching")
+    parser.add_argument('--bench', action='store_true', help="compare against per-request pandas filtering")
+    parser.add_argument('--rows', type=int, default=500_000)
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.rows)
+    else:
+        parser.print_help()
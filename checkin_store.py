@@ -0,0 +1,478 @@
+"""
+Longitudinal store of scored Emotional Room check-ins.
+
+Door 1 used to be a one-off snapshot that "Start Over" threw away. Each
+completed Emotional Room is now scored into a check-in (mood, energy and
+intensity on the 1-5 scale) and appended to its user's series under
+$VITA_NOVA_CHECKIN_DIR (default ./checkins). Series are keyed by a hash of
+the caller's key, so no identifier reaches the file system. The app passes a
+random check-in token (new_checkin_token) kept in the page link, since
+usernames are not verified. Series neither opened nor appended to for
+RETENTION_DAYS are deleted by a sweep that runs at most once a day.
+
+    <user>/log.bin          fixed-size records (seq, ts, mood, energy, intensity)
+                            appended one write per check-in
+    <user>/block-NNNNNN.npz every BLOCK_ROWS records the log is sealed into a
+                            columnar block, one array per field
+    <user>/rollups.npz      daily and weekly rollups (count, sum and sum of
+                            squares per metric), saved when a block is sealed
+
+Rollups are kept in memory and updated on every append. On load, every
+record newer than the saved rollups is folded in, from the log or, when it
+was sealed after the rollups were last saved, from its block. So a crash at
+any point loses nothing that reached the log. Trend queries read only the
+rollups:
+
+    rolling_mean(metric, days)      mean over the last `days` days
+    rolling_series(metric, days, window)
+                                    daily trailing means, for charts
+    change_since_last_week(metric)  this week's mean minus last week's
+
+They touch at most `days` daily rows or two weekly rows, so a user with years
+of history answers as fast as a new one. Raw history (history()) is read only
+for exports.
+
+Run `python checkin_store.py --bench` to compare trend queries with a pandas
+scan of the raw history.
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import secrets
+import shutil
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_CHECKIN_DIR = 'checkins'
+METRICS = ['mood', 'energy', 'intensity']
+TREND_METRICS = ['mood', 'energy']
+BLOCK_ROWS = 1024               # log records per sealed columnar block
+MAX_OPEN_USERS = 10_000         # series kept in memory
+RETENTION_DAYS = 365            # series neither opened nor appended to for this long are deleted
+SWEEP_INTERVAL = 86_400         # seconds between retention sweeps
+SECONDS_PER_DAY = 86_400
+CHECKIN_TOKEN_BYTES = 24        # random bytes of a check-in token (32 URL-safe characters)
+_EPOCH_WEEKDAY = 3              # 1970-01-01 was a Thursday; weeks start on Monday
+
+_RECORD = struct.Struct('<qdfff')   # seq, ts, mood, energy, intensity
+
+# Door 1 questions (0-based) behind each metric; reversed ones count 6 - code
+DOOR1_SCORING = {
+    'mood': {'positive': [0, 1, 6, 7], 'reversed': [2, 3, 5, 9]},
+    'energy': {'positive': [4, 7], 'reversed': [8, 13]},
+    'intensity': {'positive': [10, 12], 'reversed': [14]},
+}
+
+
+def checkin_dir():
+    """Check-in directory: $VITA_NOVA_CHECKIN_DIR, else ./checkins"""
+    return os.environ.get('VITA_NOVA_CHECKIN_DIR', DEFAULT_CHECKIN_DIR)
+
+
+def new_checkin_token():
+    """Unguessable series key for a user without verified identity"""
+    return secrets.token_urlsafe(CHECKIN_TOKEN_BYTES)
+
+
+def is_checkin_token(token):
+    return bool(re.fullmatch(r'[A-Za-z0-9_-]{%d}' % (CHECKIN_TOKEN_BYTES * 4 // 3), token or ''))
+
+
+def user_key(key):
+    """Directory name of a series: a hash, never the key itself"""
+    return hashlib.sha256(str(key).encode()).hexdigest()[:24]
+
+
+def score_door1(codes):
+    """{metric: 1-5 score} from the 40 Door 1 answer codes (0 = unanswered, skipped)"""
+    codes = np.asarray(codes, dtype=np.float64)
+    scores = {}
+    for metric, items in DOOR1_SCORING.items():
+        values = np.concatenate([codes[items['positive']], 6.0 - codes[items['reversed']]])
+        answered = values[values <= 5]      # unanswered codes (0) read as 6 when reversed
+        answered = answered[answered > 0]
+        scores[metric] = round(float(answered.mean()), 2) if len(answered) else 3.0
+    return scores
+
+
+def day_of(ts):
+    return int(ts // SECONDS_PER_DAY)
+
+
+def week_of(day):
+    return (day + _EPOCH_WEEKDAY) // 7
+
+
+class Rollup:
+    """Per-period count, sum and sum of squares of each metric, as sorted growable columns"""
+
+    def __init__(self, periods=None, count=None, sums=None, sumsq=None):
+        self.periods = np.zeros(0, dtype=np.int64) if periods is None else periods
+        self.count = np.zeros(0, dtype=np.int64) if count is None else count
+        self.sums = np.zeros((0, len(METRICS))) if sums is None else sums
+        self.sumsq = np.zeros((0, len(METRICS))) if sumsq is None else sumsq
+        self.size = len(self.periods)
+
+    def _row(self, period):
+        size = self.size
+        if size and self.periods[size - 1] == period:
+            return size - 1
+        if not size or self.periods[size - 1] < period:
+            row = size
+        else:
+            # A back-dated check-in: find or insert its period
+            row = int(np.searchsorted(self.periods[:size], period))
+            if self.periods[row] == period:
+                return row
+        if size == len(self.periods):
+            capacity = max(16, 2 * size)
+            self.periods = np.resize(self.periods, capacity)
+            self.count = np.resize(self.count, capacity)
+            self.sums = np.resize(self.sums, (capacity, len(METRICS)))
+            self.sumsq = np.resize(self.sumsq, (capacity, len(METRICS)))
+        for column in (self.periods, self.count, self.sums, self.sumsq):
+            column[row + 1:size + 1] = column[row:size].copy()
+        self.periods[row] = period
+        self.count[row] = 0
+        self.sums[row] = 0.0
+        self.sumsq[row] = 0.0
+        self.size = size + 1
+        return row
+
+    def add(self, period, values):
+        row = self._row(period)
+        self.count[row] += 1
+        self.sums[row] += values
+        self.sumsq[row] += values * values
+
+    def range(self, start, stop):
+        """Row slice of the periods in [start, stop)"""
+        periods = self.periods[:self.size]
+        return slice(int(np.searchsorted(periods, start)), int(np.searchsorted(periods, stop)))
+
+    def arrays(self, prefix):
+        n = self.size
+        return {f"{prefix}_periods": self.periods[:n], f"{prefix}_count": self.count[:n],
+                f"{prefix}_sums": self.sums[:n], f"{prefix}_sumsq": self.sumsq[:n]}
+
+    @classmethod
+    def from_arrays(cls, data, prefix):
+        return cls(*(data[f"{prefix}_{name}"].copy() for name in ('periods', 'count', 'sums', 'sumsq')))
+
+
+class CheckinSeries:
+    """One user's check-ins: append log, sealed columnar blocks and in-memory rollups"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.log_path = os.path.join(directory, 'log.bin')
+        self.rollups_path = os.path.join(directory, 'rollups.npz')
+        self.daily, self.weekly = Rollup(), Rollup()
+        self.rolled_seq = 0             # highest seq the saved rollups cover
+        if os.path.exists(self.rollups_path):
+            with np.load(self.rollups_path) as data:
+                self.daily = Rollup.from_arrays(data, 'daily')
+                self.weekly = Rollup.from_arrays(data, 'weekly')
+                self.rolled_seq = int(data['seq'])
+        self.blocks = sorted(name for name in os.listdir(directory) if name.startswith('block-'))
+        self.sealed_seq = self._block_last_seq(self.blocks[-1]) if self.blocks else 0
+        self.seq = max(self.rolled_seq, self.sealed_seq)
+        # Blocks sealed after the rollups were last saved (a crash before save_rollups)
+        for name in self._blocks_after(self.rolled_seq):
+            with np.load(os.path.join(self.directory, name)) as block:
+                records = zip(block['seq'].tolist(), block['ts'].tolist(),
+                              *(block[metric].tolist() for metric in METRICS))
+                for record in records:
+                    if record[0] > self.rolled_seq:
+                        self._roll(record)
+        self.pending = []               # log records not yet sealed into a block
+        for record in self._read_log():
+            if record[0] <= self.sealed_seq:
+                continue
+            self.pending.append(record)
+            if record[0] > self.rolled_seq:
+                self._roll(record)
+            self.seq = max(self.seq, record[0])
+        self._log = open(self.log_path, 'ab')
+
+    def _block_last_seq(self, name):
+        with np.load(os.path.join(self.directory, name)) as block:
+            return int(block['seq'][-1])
+
+    def _blocks_after(self, seq):
+        """Names of the blocks holding records newer than seq, oldest first (usually none)"""
+        newer = []
+        for name in reversed(self.blocks):
+            if self._block_last_seq(name) <= seq:
+                break
+            newer.append(name)
+        return newer[::-1]
+
+    def _read_log(self):
+        if not os.path.exists(self.log_path):
+            return []
+        with open(self.log_path, 'rb') as file:
+            data = file.read()
+        # A torn last record (crash mid-write) is dropped
+        usable = len(data) - len(data) % _RECORD.size
+        return list(_RECORD.iter_unpack(data[:usable]))
+
+    def _roll(self, record):
+        values = np.asarray(record[2:], dtype=np.float64)
+        day = day_of(record[1])
+        self.daily.add(day, values)
+        self.weekly.add(week_of(day), values)
+
+    def append(self, scores, ts=None, fsync=False):
+        """Append one scored check-in ({metric: value}); one log write, O(1) rollup update"""
+        self.seq += 1
+        # Metrics are rolled up at the float32 precision the log keeps, so a reload rolls up identically
+        record = (self.seq, time.time() if ts is None else float(ts),
+                  *(float(np.float32(scores[metric])) for metric in METRICS))
+        self._log.write(_RECORD.pack(*record))
+        self._log.flush()
+        if fsync:
+            os.fsync(self._log.fileno())
+        self._roll(record)
+        self.pending.append(record)
+        if len(self.pending) >= BLOCK_ROWS:
+            self.seal()
+
+    def seal(self):
+        """Write the pending records as a columnar block, save the rollups, then reset the log"""
+        if not self.pending:
+            return
+        columns = np.array(self.pending, dtype=np.float64)
+        name = f"block-{len(self.blocks) + 1:06d}.npz"
+        _save_npz(os.path.join(self.directory, name), seq=columns[:, 0].astype(np.int64), ts=columns[:, 1],
+                  **{metric: columns[:, 2 + i].astype(np.float32) for i, metric in enumerate(METRICS)})
+        self.blocks.append(name)
+        self.sealed_seq = int(columns[-1, 0])
+        self.save_rollups()
+        self._log.close()
+        self._log = open(self.log_path, 'wb')
+        self.pending = []
+
+    def save_rollups(self):
+        _save_npz(self.rollups_path, seq=np.int64(self.seq), **self.daily.arrays('daily'),
+                  **self.weekly.arrays('weekly'))
+        self.rolled_seq = self.seq
+
+    def close(self):
+        self.save_rollups()
+        self._log.close()
+
+    # Trend queries (rollups only) --------------------------------------------
+
+    def rolling_mean(self, metric, days=7, now=None):
+        """Mean of a metric over the check-ins of the last `days` days (today included), or None"""
+        today = day_of(time.time() if now is None else now)
+        rows = self.daily.range(today - days + 1, today + 1)
+        count = self.daily.count[rows].sum()
+        return float(self.daily.sums[rows, METRICS.index(metric)].sum() / count) if count else None
+
+    def rolling_series(self, metric, days=30, window=7, now=None):
+        """[(day, trailing `window`-day mean or None)] for each of the last `days` days"""
+        today = day_of(time.time() if now is None else now)
+        first = today - days - window + 2
+        rows = self.daily.range(first, today + 1)
+        counts = np.zeros(days + window - 1)
+        sums = np.zeros(days + window - 1)
+        offsets = self.daily.periods[rows] - first
+        counts[offsets] = self.daily.count[rows]
+        sums[offsets] = self.daily.sums[rows, METRICS.index(metric)]
+        kernel = np.ones(window)
+        window_counts = np.convolve(counts, kernel, 'valid')
+        window_sums = np.convolve(sums, kernel, 'valid')
+        return [(today - days + 1 + i, float(s / c) if c else None)
+                for i, (s, c) in enumerate(zip(window_sums, window_counts))]
+
+    def change_since_last_week(self, metric, now=None):
+        """(this week's mean, last week's mean, difference); None where a week has no check-ins"""
+        week = week_of(day_of(time.time() if now is None else now))
+        rows = self.weekly.range(week - 1, week + 1)
+        means = dict(zip(self.weekly.periods[rows].tolist(),
+                         (self.weekly.sums[rows, METRICS.index(metric)] / self.weekly.count[rows]).tolist()))
+        this, last = means.get(week), means.get(week - 1)
+        return this, last, (round(this - last, 3) if this is not None and last is not None else None)
+
+    def trend(self, now=None):
+        """7-day means and week-over-week change of the trend metrics"""
+        summary = {'checkins': int(self.daily.count[:self.daily.size].sum())}
+        for metric in TREND_METRICS:
+            this, last, change = self.change_since_last_week(metric, now)
+            summary[metric] = {'rolling_7d': self.rolling_mean(metric, 7, now), 'this_week': this,
+                               'last_week': last, 'change': change}
+        return summary
+
+    # Raw history ---------------------------------------------------------------
+
+    def history(self):
+        """Every check-in as {field: array}, oldest first (reads all blocks)"""
+        parts = []
+        for name in self.blocks:
+            with np.load(os.path.join(self.directory, name)) as block:
+                parts.append({field: block[field] for field in ['seq', 'ts', *METRICS]})
+        if self.pending:
+            columns = np.array(self.pending, dtype=np.float64)
+            parts.append({'seq': columns[:, 0].astype(np.int64), 'ts': columns[:, 1],
+                          **{metric: columns[:, 2 + i].astype(np.float32) for i, metric in enumerate(METRICS)}})
+        if not parts:
+            return {field: np.zeros(0) for field in ['seq', 'ts', *METRICS]}
+        return {field: np.concatenate([part[field] for part in parts]) for field in parts[0]}
+
+
+def _save_npz(path, **arrays):
+    # np.savez appends .npz to names without it, so the temporary name keeps the suffix
+    tmp = path[:-len('.npz')] + '.tmp.npz'
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+class CheckinStore:
+    """Check-in series of many users, opened on demand and kept in an LRU"""
+
+    def __init__(self, directory=None, max_open=MAX_OPEN_USERS, retention_days=RETENTION_DAYS,
+                 sweep_interval=SWEEP_INTERVAL):
+        self.directory = directory or checkin_dir()
+        self.max_open = max_open
+        self.retention_days = retention_days
+        self.sweep_interval = sweep_interval
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = None
+        self.swept = 0
+
+    def series(self, key):
+        key = user_key(key)
+        with self._lock:
+            now = time.time()
+            if self._last_sweep is None or now - self._last_sweep >= self.sweep_interval:
+                self._sweep(now)
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = CheckinSeries(os.path.join(self.directory, key))
+                # Reopening counts as use for the retention sweep
+                os.utime(series.directory)
+                if len(self._series) > self.max_open:
+                    self._series.popitem(last=False)[1].close()
+            self._series.move_to_end(key)
+            return series
+
+    def sweep(self, now=None):
+        """Delete the series neither opened nor appended to for retention_days; returns how many"""
+        with self._lock:
+            return self._sweep(time.time() if now is None else now)
+
+    def _sweep(self, now):
+        self._last_sweep = now
+        if not os.path.isdir(self.directory):
+            return 0
+        cutoff = now - self.retention_days * SECONDS_PER_DAY
+        removed = 0
+        for key in os.listdir(self.directory):
+            path = os.path.join(self.directory, key)
+            # Only series directories (user_key hashes) are ever removed
+            if key in self._series or not re.fullmatch(r'[0-9a-f]{24}', key) or not os.path.isdir(path):
+                continue
+            log_path = os.path.join(path, 'log.bin')
+            last_used = max(os.path.getmtime(path), os.path.getmtime(log_path) if os.path.exists(log_path) else 0)
+            if last_used < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        self.swept += removed
+        if removed:
+            print(f"[INFO] Removed {removed} check-in series unused for {self.retention_days} days")
+        return removed
+
+    def append(self, key, scores, ts=None):
+        series = self.series(key)
+        with self._lock:
+            series.append(scores, ts)
+        return series
+
+    def trend(self, key, now=None):
+        series = self.series(key)
+        with self._lock:
+            return series.trend(now)
+
+    def close(self):
+        with self._lock:
+            for series in self._series.values():
+                series.close()
+            self._series.clear()
+
+
+# ============================================================================
+# Benchmark
+# ============================================================================
+
+def benchmark(years, per_day):
+    import tempfile
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    now = time.time()
+    n = int(years * 365 * per_day)
+    ts = np.sort(now - rng.uniform(0, years * 365 * SECONDS_PER_DAY, n))
+    values = np.clip(rng.normal(3, 0.8, (n, len(METRICS))), 1, 5).round(2)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CheckinStore(tmp)
+        series = store.series('bench')
+        start = time.perf_counter()
+        for t, row in zip(ts, values):
+            series.append(dict(zip(METRICS, row)), t)
+        append_us = (time.perf_counter() - start) / n * 1e6
+        store.close()
+
+        start = time.perf_counter()
+        series = CheckinStore(tmp).series('bench')
+        reopen_ms = (time.perf_counter() - start) * 1e3
+
+        def from_rollups():
+            return series.trend(now), series.rolling_series('mood', 30, 7, now)
+
+        def from_raw():
+            raw = pd.DataFrame(series.history())
+            raw['day'] = (raw['ts'] // SECONDS_PER_DAY).astype(int)
+            daily = raw.groupby('day')[TREND_METRICS].agg(['sum', 'count'])
+            recent = raw[raw['ts'] >= now - 7 * SECONDS_PER_DAY]
+            return recent[TREND_METRICS].mean(), daily
+
+        timings = {}
+        for name, query in [('rollups', from_rollups), ('raw scan', from_raw)]:
+            query()
+            start = time.perf_counter()
+            for _ in range(20):
+                query()
+            timings[name] = (time.perf_counter() - start) / 20 * 1e3
+        trend = series.trend(now)
+
+    print(f"{years:g} years, {per_day} check-ins a day: {n} check-ins in {len(series.blocks)} blocks")
+    print(f"  append:          {append_us:8.1f} us per check-in")
+    print(f"  reopen:          {reopen_ms:8.1f} ms")
+    print(f"  trend (rollups): {timings['rollups']:8.3f} ms")
+    print(f"  trend (raw):     {timings['raw scan']:8.3f} ms")
+    print(f"  mood 7-day mean {trend['mood']['rolling_7d']:.2f}, change since last week {trend['mood']['change']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Longitudinal store of scored Emotional Room check-ins")
+    parser.add_argument('--bench', action='store_true', help="trend queries from rollups versus a raw scan")
+    parser.add_argument('--years', type=float, nargs='+', default=[1, 5, 20])
+    parser.add_argument('--per-day', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.bench:
+        for years in args.years:
+            benchmark(years, args.per_day)
+    else:
+        parser.print_help()
@@ -0,0 +1,199 @@
+"""
+Top-k search across the most likely clusters of a new user.
+
+get_user_matches only searches the single cluster returned by predict, so
+users near a cluster boundary get poor matches and a tiny cluster can return
+fewer than top_n users. Here the classifier's class probabilities pick the
+smallest set of clusters covering a probability mass threshold. A total
+candidate budget is split across them, each cluster's top-k is taken with
+argpartition and the per-cluster lists are merged with a heap.
+
+Clusters larger than their share of the budget are scored on an evenly
+strided subset of rows (a view, no copy), so latency stays bounded however
+many clusters are probed. Run `python cluster_search.py --bench` to see it.
+"""
+
+import argparse
+import heapq
+import itertools
+import time
+
+import numpy as np
+
+DEFAULT_PROBABILITY_MASS = 0.9
+DEFAULT_CANDIDATE_BUDGET = 50_000
+DEFAULT_MAX_CLUSTERS = 4
+
+
+def cluster_probabilities(model, X):
+    """
+    Class probabilities of one row as {cluster: probability}.
+
+    The bundled SVC pipeline is trained with probability=False, so when the
+    model has no predict_proba the one-vs-rest decision values are turned into
+    probabilities with a softmax (the argmax still agrees with predict).
+    """
+    try:
+        proba = np.asarray(model.predict_proba(X), dtype=np.float64)[0]
+    except AttributeError:
+        decision = np.atleast_2d(np.asarray(model.decision_function(X), dtype=np.float64))[0]
+        if decision.shape[0] == 1:
+            # Binary models return a single margin
+            decision = np.array([-decision[0], decision[0]])
+        proba = np.exp(decision - decision.max())
+        proba /= proba.sum()
+    return {int(cluster): float(p) for cluster, p in zip(model.classes_, proba)}
+
+
+def plan_clusters(probabilities, cluster_sizes, top_n, probability_mass=DEFAULT_PROBABILITY_MASS,
+                  max_clusters=DEFAULT_MAX_CLUSTERS):
+    """
+    Smallest list of (cluster, probability), most likely first, that covers
+    `probability_mass` and holds at least `top_n` users, capped at max_clusters.
+    """
+    plan = []
+    mass = 0.0
+    n_users = 0
+    for cluster, p in sorted(probabilities.items(), key=lambda item: -item[1]):
+        if len(plan) >= max_clusters or (mass >= probability_mass and n_users >= top_n):
+            break
+        size = cluster_sizes.get(cluster, 0)
+        if size == 0:
+            continue
+        plan.append((cluster, p))
+        mass += p
+        n_users += size
+    return plan
+
+
+def allocate_budget(plan, cluster_sizes, candidate_budget):
+    """Split the candidate budget across planned clusters in proportion to probability"""
+    allocation = {}
+    remaining_budget = candidate_budget
+    pending = list(plan)
+    # Water-filling: clusters smaller than their share are taken whole, the rest is re-split
+    while pending:
+        total_p = sum(p for _, p in pending) or 1.0
+        small = [(c, p) for c, p in pending if cluster_sizes[c] <= remaining_budget * p / total_p]
+        if not small:
+            for cluster, p in pending:
+                allocation[cluster] = max(1, int(remaining_budget * p / total_p))
+            break
+        for cluster, p in small:
+            allocation[cluster] = cluster_sizes[cluster]
+            remaining_budget -= cluster_sizes[cluster]
+        pending = [(c, p) for c, p in pending if c not in allocation]
+    return allocation
+
+
+def cosine_scores(features, norms, x):
+    """Cosine similarity of x against every row of features (rows with zero norm score 0)"""
+    dot = features @ x
+    denom = norms * np.sqrt(x @ x)
+    return np.divide(dot, denom, out=np.zeros(len(dot), dtype=np.float64), where=denom > 0)
+
+
+def top_k_indices(scores, k):
+    """Indices of the k largest scores, best first"""
+    k = min(k, len(scores))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def merge_top_k(ranked_lists, k):
+    """Heap-merge per-part lists of (score, user_id, cluster), each sorted best first"""
+    merged = heapq.merge(*ranked_lists, key=lambda item: -item[0])
+    return list(itertools.islice(merged, k))
+
+
+def search_clusters(x, plan, cluster_arrays, cluster_norms, top_n,
+                    candidate_budget=DEFAULT_CANDIDATE_BUDGET, precomputed=None, candidate_rows=None,
+                    kernel=None, kernel_states=None):
+    """
+    Top-n (score, user_id, cluster) over the planned clusters within the budget.
+
+    `precomputed` may map a cluster to its already computed full score vector
+    (e.g. from the Door 2 accumulators); it is used as is and not charged to
+    the budget. `candidate_rows` may map a cluster to the row positions that
+    survived attribute filters; only those rows are scored. `kernel` (a
+    similarity_kernels.SimilarityKernel with its per-cluster `kernel_states`)
+    replaces plain cosine when given.
+    """
+    precomputed = precomputed or {}
+    candidate_rows = candidate_rows or {}
+    x = np.asarray(x, dtype=np.float64)
+    sizes = {}
+    for cluster, _ in plan:
+        rows = candidate_rows.get(cluster)
+        sizes[cluster] = len(rows) if rows is not None else len(cluster_arrays[cluster].user_ids)
+    budgeted = [(cluster, p) for cluster, p in plan if cluster not in precomputed]
+    allocation = allocate_budget(budgeted, sizes, candidate_budget)
+
+    ranked_lists = []
+    for cluster, _ in plan:
+        block = cluster_arrays[cluster]
+        rows = candidate_rows.get(cluster)
+        if cluster in precomputed:
+            scores, user_ids = precomputed[cluster], block.user_ids
+            if rows is not None:
+                scores, user_ids = scores[rows], user_ids[rows]
+        else:
+            step = -(-sizes[cluster] // allocation[cluster])  # ceil division
+            rows = slice(None, None, step) if rows is None else rows[::step]
+            user_ids = block.user_ids[rows]
+            if kernel is None:
+                scores = cosine_scores(block.features[rows], cluster_norms[cluster][rows], x)
+            else:
+                scores = kernel.scores(kernel_states[cluster], block.features, x, rows)
+        top = top_k_indices(scores, top_n)
+        ranked_lists.append([(float(scores[i]), user_ids[i], cluster) for i in top])
+
+    return merge_top_k(ranked_lists, top_n)
+
+
+# ============================================================================
+# Benchmark
+# ============================================================================
+
+def benchmark(cluster_size, n_clusters, budget, top_n, repeats=20):
+    rng = np.random.default_rng(0)
+    n_features = 60
+    cluster_arrays = {}
+    cluster_norms = {}
+    from streaming_loader import ClusterBlock
+    for cluster in range(n_clusters):
+        features = rng.integers(1, 6, size=(cluster_size, n_features)).astype(np.float32)
+        ids = np.arange(cluster * cluster_size, (cluster + 1) * cluster_size, dtype=np.int32)
+        cluster_arrays[cluster] = ClusterBlock(user_ids=ids, features=features)
+        cluster_norms[cluster] = np.linalg.norm(features.astype(np.float64), axis=1)
+    x = rng.integers(1, 6, size=n_features).astype(np.float64)
+    sizes = {cluster: cluster_size for cluster in cluster_arrays}
+
+    print(f"{n_clusters} clusters x {cluster_size} users, budget {budget}, top {top_n}")
+    print(f"{'probed':>7} {'scored':>9} {'ms':>8}")
+    for probed in range(1, n_clusters + 1):
+        probabilities = {cluster: 1.0 / probed if cluster < probed else 0.0 for cluster in cluster_arrays}
+        plan = plan_clusters(probabilities, sizes, top_n, probability_mass=1.0, max_clusters=probed)
+        scored = sum(allocate_budget(plan, sizes, budget).values())
+        start = time.perf_counter()
+        for _ in range(repeats):
+            search_clusters(x, plan, cluster_arrays, cluster_norms, top_n, budget)
+        elapsed = (time.perf_counter() - start) / repeats
+        print(f"{probed:>7} {scored:>9} {elapsed * 1e3:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-cluster top-k search")
+    parser.add_argument('--bench', action='store_true', help="latency as more clusters are probed")
+    parser.add_argument('--cluster-size', type=int, default=200_000)
+    parser.add_argument('--clusters', type=int, default=6)
+    parser.add_argument('--budget', type=int, default=DEFAULT_CANDIDATE_BUDGET)
+    parser.add_argument('--top-n', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.cluster_size, args.clusters, args.budget, args.top_n)
+    else:
+        parser.print_help()
@@ -0,0 +1,287 @@
+"""
+Incrementally maintained cohort analytics for the Pulse Score and subscores.
+
+Dashboards of the Entry Hall scores per cluster and per door used to mean a
+pandas group-by over every stored response on each view. Here each completion
+(the Entry Hall or a door) is folded once into mergeable summaries:
+
+    RunningStats    count, mean and variance (Welford), min and max
+    ScoreSketch     a fixed-resolution histogram over the 1-5 score range. The
+                    scores are rounded to 0.01 at most, so its quantiles are
+                    exact to that resolution and two sketches merge by adding
+                    their counts
+
+A completion updates one cell per (stage, cluster, time bucket) combination
+it belongs to, with '*' for "any cluster" and "all time". Hourly cells are
+kept for RETENTION_BUCKETS hours, so memory is bounded. A query for a
+stage, cluster and bucket reads one cell, and a range of hourly buckets
+merges one cell per hour. Neither depends on how many responses were
+recorded. The cluster is only known once Door 2 has matched the user, so Entry
+Hall, Door 1 and Door 3 completions are counted under '*' alone.
+
+The app keeps one CohortAnalytics per process and shows it on the analytics
+page. `python cohort_analytics.py rebuild` replays the answer journal into it,
+and `python cohort_analytics.py --bench` compares queries with the group-by.
+"""
+
+import argparse
+import math
+import threading
+import time
+
+import numpy as np
+
+METRICS = ['pulse_score', 'mood_index', 'energy_index', 'social_index', 'security_index']
+STAGES = ['entry_hall', 'door1', 'door2', 'door3']
+ANY = '*'
+BUCKET_SECONDS = 3600           # hourly rollups
+RETENTION_BUCKETS = 7 * 24      # hourly cells kept; older ones only live on in the all-time cells
+SCORE_MIN, SCORE_MAX, SCORE_RESOLUTION = 1.0, 5.0, 0.01
+
+
+class RunningStats:
+    """Count, mean, variance, min and max of a stream; mergeable (Chan et al.)"""
+
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        if not other.count:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+class ScoreSketch:
+    """Histogram of scores at SCORE_RESOLUTION over [SCORE_MIN, SCORE_MAX]; mergeable quantiles"""
+
+    __slots__ = ('counts',)
+    N_BINS = int(round((SCORE_MAX - SCORE_MIN) / SCORE_RESOLUTION)) + 1
+
+    def __init__(self):
+        self.counts = np.zeros(self.N_BINS, dtype=np.int32)
+
+    def add(self, value):
+        slot = int(round((value - SCORE_MIN) / SCORE_RESOLUTION))
+        self.counts[min(max(slot, 0), self.N_BINS - 1)] += 1
+
+    def merge(self, other):
+        self.counts += other.counts
+        return self
+
+    def quantiles(self, qs):
+        total = int(self.counts.sum())
+        if not total:
+            return [math.nan] * len(qs)
+        cumulative = np.cumsum(self.counts)
+        ranks = np.maximum(np.ceil(np.asarray(qs) * total), 1)
+        return (SCORE_MIN + np.searchsorted(cumulative, ranks) * SCORE_RESOLUTION).round(2).tolist()
+
+
+class MetricSummary:
+    """RunningStats and ScoreSketch of one metric in one cell"""
+
+    __slots__ = ('stats', 'sketch')
+
+    def __init__(self):
+        self.stats = RunningStats()
+        self.sketch = ScoreSketch()
+
+    def add(self, value):
+        self.stats.add(value)
+        self.sketch.add(value)
+
+    def merge(self, other):
+        self.stats.merge(other.stats)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def as_dict(self, qs=(0.1, 0.5, 0.9)):
+        stats = self.stats
+        summary = {'count': stats.count, 'mean': round(stats.mean, 3) if stats.count else math.nan,
+                   'std': round(stats.std, 3) if stats.count else math.nan, 'min': stats.min if stats.count else math.nan,
+                   'max': stats.max if stats.count else math.nan}
+        summary.update({f"p{int(q * 100)}": value for q, value in zip(qs, self.sketch.quantiles(qs))})
+        return summary
+
+
+def time_bucket(ts):
+    """Start (epoch seconds) of the hourly bucket holding ts"""
+    return int(ts // BUCKET_SECONDS) * BUCKET_SECONDS
+
+
+class CohortAnalytics:
+    """Per stage, cluster and hourly bucket summaries of the Entry Hall scores"""
+
+    def __init__(self):
+        # (stage, cluster or ANY, bucket start or ANY) -> {metric: MetricSummary}
+        self.cells = {}
+        self.clusters = set()
+        self.newest_bucket = None
+        self._lock = threading.Lock()
+
+    def _prune(self, bucket):
+        """Advance the newest bucket and drop hourly cells that fell out of retention"""
+        self.newest_bucket = bucket
+        oldest = bucket - (RETENTION_BUCKETS - 1) * BUCKET_SECONDS
+        for key in [key for key in self.cells if key[2] != ANY and key[2] < oldest]:
+            del self.cells[key]
+
+    def record(self, stage, scores, cluster=None, ts=None):
+        """Fold one completion into every cell it belongs to; scores maps metric -> value"""
+        bucket = time_bucket(time.time() if ts is None else ts)
+        clusters = (ANY,) if cluster is None else (ANY, int(cluster))
+        values = [(metric, float(scores[metric])) for metric in METRICS if scores.get(metric) is not None]
+        with self._lock:
+            if cluster is not None:
+                self.clusters.add(int(cluster))
+            if self.newest_bucket is None or bucket > self.newest_bucket:
+                self._prune(bucket)
+            retained = bucket > self.newest_bucket - RETENTION_BUCKETS * BUCKET_SECONDS
+            for cell_cluster in clusters:
+                for cell_bucket in (ANY, bucket) if retained else (ANY,):
+                    cell = self.cells.get((stage, cell_cluster, cell_bucket))
+                    if cell is None:
+                        cell = self.cells[(stage, cell_cluster, cell_bucket)] = {m: MetricSummary() for m in METRICS}
+                    for metric, value in values:
+                        cell[metric].add(value)
+
+    def summary(self, stage, metric, cluster=ANY, since=None, until=None):
+        """MetricSummary of a stage and cluster, all time or merged over the hourly buckets in [since, until)"""
+        with self._lock:
+            if since is None:
+                cell = self.cells.get((stage, cluster, ANY))
+                return MetricSummary().merge(cell[metric]) if cell else MetricSummary()
+            merged = MetricSummary()
+            until = time.time() if until is None else until
+            for bucket in range(time_bucket(since), time_bucket(until) + BUCKET_SECONDS, BUCKET_SECONDS):
+                cell = self.cells.get((stage, cluster, bucket))
+                if cell:
+                    merged.merge(cell[metric])
+            return merged
+
+    def by_cluster(self, stage, metric, since=None):
+        """{cluster: summary dict}, with ANY first"""
+        return {cluster: self.summary(stage, metric, cluster, since).as_dict()
+                for cluster in [ANY] + sorted(self.clusters)}
+
+    def by_stage(self, metric, since=None):
+        return {stage: self.summary(stage, metric, ANY, since).as_dict() for stage in STAGES}
+
+    def hourly_means(self, stage, metric, hours=24, now=None):
+        """[(bucket start, mean or nan)] for the last `hours` hourly buckets"""
+        last = time_bucket(time.time() if now is None else now)
+        series = []
+        with self._lock:
+            for bucket in range(last - (hours - 1) * BUCKET_SECONDS, last + 1, BUCKET_SECONDS):
+                cell = self.cells.get((stage, ANY, bucket))
+                stats = cell[metric].stats if cell else None
+                series.append((bucket, stats.mean if stats and stats.count else math.nan))
+        return series
+
+
+# ============================================================================
+# Journal rebuild and benchmark
+# ============================================================================
+
+def from_journal(directory):
+    """CohortAnalytics rebuilt from an answer journal (clusters are not journaled)"""
+    from answer_journal import read_events
+
+    analytics = CohortAnalytics()
+    sessions = {}
+    for event in read_events(directory):
+        state = sessions.setdefault(event['session'], {'scores': {}, 'page': None})
+        if event['stage'] == 'profile' and 'pulse_score' in event['profile']:
+            state['scores'].update({m: event['profile'][m] for m in METRICS if m in event['profile']})
+            analytics.record('entry_hall', state['scores'], ts=event['ts'])
+        elif event['stage'] == 'page':
+            if event['page'] == 'completion' and state['page'] in STAGES and state['scores']:
+                analytics.record(state['page'], state['scores'], ts=event['ts'])
+            state['page'] = event['page']
+    return analytics
+
+
+def benchmark(n):
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    now = time.time()
+    frame = pd.DataFrame({
+        'stage': rng.choice(STAGES, n),
+        'cluster': rng.integers(0, 6, n),
+        'ts': now - rng.uniform(0, 7 * 24 * 3600, n),
+        **{metric: np.round(rng.uniform(1, 5, n), 2) for metric in METRICS},
+    })
+    frame.loc[frame['stage'] != 'door2', 'cluster'] = -1
+
+    analytics = CohortAnalytics()
+    start = time.perf_counter()
+    for row in frame.itertuples(index=False):
+        scores = {metric: getattr(row, metric) for metric in METRICS}
+        analytics.record(row.stage, scores, None if row.cluster < 0 else row.cluster, row.ts)
+    record_us = (time.perf_counter() - start) / n * 1e6
+
+    def groupby_view():
+        door2 = frame[frame['stage'] == 'door2']
+        return door2.groupby('cluster')['pulse_score'].describe(percentiles=[0.1, 0.5, 0.9])
+
+    def streaming_view():
+        return analytics.by_cluster('door2', 'pulse_score')
+
+    for name, view in [('pandas group-by', groupby_view), ('streaming cells', streaming_view)]:
+        view()
+        start = time.perf_counter()
+        for _ in range(20):
+            view()
+        print(f"  {name:>16}: {(time.perf_counter() - start) / 20 * 1e3:8.2f} ms per dashboard view")
+    day = analytics.summary('door2', 'pulse_score', since=now - 24 * 3600)
+    print(f"  record: {record_us:.1f} us per completion; {len(analytics.cells)} cells for {n} completions")
+    print(f"  last 24 h of Door 2 from 25 hourly cells: {day.as_dict()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming cohort analytics of Entry Hall scores")
+    parser.add_argument('--bench', action='store_true', help="dashboard view cost versus a pandas group-by")
+    parser.add_argument('--rows', type=int, default=200_000)
+    sub = parser.add_subparsers(dest='command')
+    rebuild = sub.add_parser('rebuild', help="summarize the answer journal per stage")
+    rebuild.add_argument('--dir', default=None)
+    args = parser.parse_args()
+
+    if args.bench:
+        print(f"{args.rows} stored completions")
+        benchmark(args.rows)
+    elif args.command == 'rebuild':
+        from answer_journal import journal_dir
+        analytics = from_journal(args.dir or journal_dir())
+        for metric in METRICS:
+            print(metric)
+            for stage, summary in analytics.by_stage(metric).items():
+                print(f"  {stage:>10} {summary}")
+    else:
+        parser.print_help()
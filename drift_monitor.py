@@ -0,0 +1,272 @@
+"""
+Streaming feature-drift monitor for incoming users.
+
+New users' encoded rows used to be compared with nothing: an unseen category
+was mapped to 0 with a one-line warning, and a shift in how people answer went
+unnoticed. The engine now hands every incoming row to `drift_observer`
+(before the cluster is predicted), and DriftMonitor keeps one fixed-size
+histogram per feature:
+
+    code features       (categorical codes, answer codes: few integer values)
+                        one bin per value seen in the cluster table, plus bins
+                        for the values between and beyond them, which the table
+                        never contains
+    continuous features (subscores, matching_score) the reference deciles
+
+Bin edges for all features form one padded matrix, so updating a row is one
+vectorized comparison and one counter increment per feature. Memory does not
+grow with traffic. The reference distribution is binned once per model bundle
+from its cluster arrays (the encoded df_clusters).
+
+Every `window` requests, the window's histograms are compared with the
+reference. Each feature gets a population stability index (PSI; above 0.1 is a
+moderate shift, above 0.25 a significant one) and the share of values outside
+the reference. Unknown-category rates per categorical column come from
+pre_processing's UnknownReport. metrics() returns the last snapshot, and
+features over DRIFT_ALERT are printed as warnings.
+
+Run `python drift_monitor.py --bench` for the per-request cost and
+`python drift_monitor.py --simulate` to see scores for reference-like and
+shifted traffic.
+"""
+
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from streaming_loader import CATEGORICAL_COLUMNS
+
+DEFAULT_WINDOW = 500            # requests per comparison
+MAX_CODE_VALUES = 12            # integer features with more distinct values are binned by deciles
+REFERENCE_SAMPLE = 100_000      # reference rows binned per bundle
+DRIFT_WATCH = 0.1               # PSI of a moderate shift
+DRIFT_ALERT = 0.25              # PSI of a significant shift
+_MIN_SHARE = 1e-4               # floor for empty bins in the PSI
+
+
+def feature_edges(values):
+    """Increasing bin edges for one reference feature column"""
+    distinct = np.unique(values)
+    if len(distinct) <= MAX_CODE_VALUES and np.all(distinct == np.round(distinct)):
+        # Odd bins hold the reference values, even bins everything in between or beyond
+        return np.column_stack([distinct - 0.25, distinct + 0.25]).ravel()
+    return np.unique(np.quantile(values, np.linspace(0.1, 0.9, 9)))
+
+
+class FeatureBins:
+    """Bin edges of every feature, padded into one matrix so a row is binned in one comparison"""
+
+    def __init__(self, reference, feature_columns):
+        self.feature_columns = list(feature_columns)
+        edges = [feature_edges(reference[:, f]) for f in range(reference.shape[1])]
+        width = max(len(e) for e in edges)
+        # +inf padding is never reached, so padded bins stay empty on both sides
+        self.edges = np.full((len(edges), width), np.inf)
+        for f, e in enumerate(edges):
+            self.edges[f, :len(e)] = e
+        self.n_bins = width + 1
+        self.reference = self.histogram(reference)
+        self.reference_share = self.reference / max(len(reference), 1)
+
+    def bins(self, rows):
+        """Bin index of every feature of every row: (n_rows, n_features)"""
+        return (rows[:, :, None] >= self.edges[None, :, :]).sum(axis=2)
+
+    def histogram(self, rows, chunk=10_000):
+        counts = np.zeros((len(self.feature_columns), self.n_bins), dtype=np.int64)
+        offsets = np.arange(len(self.feature_columns)) * self.n_bins
+        for start in range(0, len(rows), chunk):
+            flat = (self.bins(rows[start:start + chunk]) + offsets).ravel()
+            counts += np.bincount(flat, minlength=counts.size).reshape(counts.shape)
+        return counts
+
+
+def psi(counts, reference_share):
+    """Population stability index of each feature's counts against the reference shares"""
+    share = counts / np.maximum(counts.sum(axis=1, keepdims=True), 1)
+    p = np.maximum(share, _MIN_SHARE)
+    q = np.maximum(reference_share, _MIN_SHARE)
+    return ((p - q) * np.log(p / q)).sum(axis=1)
+
+
+class DriftMonitor:
+    """Per-feature streaming histograms of incoming rows, compared with the cluster table every window"""
+
+    def __init__(self, window=DEFAULT_WINDOW, alert=DRIFT_ALERT, verbose=True):
+        self.window = window
+        self.alert = alert
+        self.verbose = verbose
+        self.bundle = None
+        self.bins = None
+        self.requests = 0
+        self.unknown_total = dict.fromkeys(CATEGORICAL_COLUMNS, 0)
+        self.last = None
+        self._lock = threading.Lock()
+
+    def _reset(self, bundle):
+        blocks = [block.features for block in bundle.cluster_arrays.values()]
+        reference = np.concatenate(blocks).astype(np.float64)
+        if len(reference) > REFERENCE_SAMPLE:
+            reference = reference[np.random.default_rng(0).choice(len(reference), REFERENCE_SAMPLE, replace=False)]
+        self.bins = FeatureBins(reference, bundle.feature_columns)
+        self.bundle = bundle
+        self._offsets = np.arange(len(bundle.feature_columns)) * self.bins.n_bins
+        self._counts = np.zeros((len(bundle.feature_columns), self.bins.n_bins), dtype=np.int64)
+        self._window_requests = 0
+        self._window_unknown = dict.fromkeys(CATEGORICAL_COLUMNS, 0)
+
+    def observe(self, bundle, x, unknown_report=None):
+        """Add one encoded row (and its unseen categories) to the current window"""
+        snapshot = False
+        with self._lock:
+            if bundle is not self.bundle:
+                # A promoted model brings its own reference; the window starts over
+                self._reset(bundle)
+            bins = (x[:, None] >= self.bins.edges).sum(axis=1)
+            self._counts.flat[self._offsets + bins] += 1
+            if unknown_report is not None:
+                for col, count in unknown_report.counts.items():
+                    self._window_unknown[col] = self._window_unknown.get(col, 0) + count
+            self.requests += 1
+            self._window_requests += 1
+            snapshot = self._window_requests >= self.window
+        if snapshot:
+            self.snapshot()
+
+    def snapshot(self):
+        """Compare the current window with the reference, start a new window and return the metrics"""
+        with self._lock:
+            if self.bins is None or not self._window_requests:
+                return self.last
+            counts, n, unknown = self._counts, self._window_requests, self._window_unknown
+            self._counts = np.zeros_like(counts)
+            self._window_requests = 0
+            self._window_unknown = dict.fromkeys(CATEGORICAL_COLUMNS, 0)
+            for col, count in unknown.items():
+                self.unknown_total[col] = self.unknown_total.get(col, 0) + count
+            bins = self.bins
+
+        scores = psi(counts, bins.reference_share)
+        outside = (counts * (bins.reference == 0)).sum(axis=1) / n
+        self.last = {
+            'ts': time.time(),
+            'model': self.bundle.version,
+            'requests': n,
+            'psi': dict(zip(bins.feature_columns, np.round(scores, 4).tolist())),
+            'outside_reference': {col: round(float(rate), 4)
+                                  for col, rate in zip(bins.feature_columns, outside) if rate},
+            'unknown_rate': {col: round(count / n, 4) for col, count in unknown.items() if count},
+            'drifted': [col for col, score in zip(bins.feature_columns, scores) if score > self.alert],
+        }
+        if self.verbose and self.last['drifted']:
+            worst = sorted(self.last['drifted'], key=lambda col: -self.last['psi'][col])
+            print(f"[WARNING] Feature drift over the last {n} users: "
+                  + ", ".join(f"{col} PSI {self.last['psi'][col]:.2f}" for col in worst[:5]))
+        if self.verbose and self.last['unknown_rate']:
+            print(f"[WARNING] Unknown categories over the last {n} users: {self.last['unknown_rate']}")
+        return self.last
+
+    def metrics(self):
+        """Last snapshot plus running totals"""
+        with self._lock:
+            return {'requests': self.requests, 'window_requests': self._window_requests if self.bins else 0,
+                    'unknown_total': {col: count for col, count in self.unknown_total.items() if count},
+                    'last': self.last}
+
+
+def format_metrics(metrics, top=10):
+    last = metrics['last']
+    lines = [f"{metrics['requests']} users observed"]
+    if last is None:
+        return lines[0] + ", no complete window yet"
+    lines.append(f"last window: {last['requests']} users on model {last['model']}")
+    lines.append(f"{'feature':>28} {'PSI':>7} {'outside':>8}")
+    for col, score in sorted(last['psi'].items(), key=lambda item: -item[1])[:top]:
+        flag = ' !' if score > DRIFT_ALERT else ' ?' if score > DRIFT_WATCH else ''
+        lines.append(f"{col:>28} {score:>7.3f} {last['outside_reference'].get(col, 0):>8.1%}{flag}")
+    if last['unknown_rate']:
+        lines.append("unknown categories: " + ", ".join(f"{col} {rate:.1%}"
+                                                        for col, rate in last['unknown_rate'].items()))
+    return "\n".join(lines)
+
+
+# ============================================================================
+# Benchmark and simulation
+# ============================================================================
+
+def _reference_rows(bundle, n, rng):
+    reference = np.concatenate([block.features for block in bundle.cluster_arrays.values()]).astype(np.float64)
+    return reference[rng.integers(0, len(reference), n)]
+
+
+def benchmark(n):
+    import matching_engine
+
+    if not matching_engine.load_matching_data():
+        return
+    bundle = matching_engine.active
+    rows = _reference_rows(bundle, n, np.random.default_rng(0))
+    monitor = DriftMonitor(window=n + 2, verbose=False)
+    monitor.observe(bundle, rows[0])
+    start = time.perf_counter()
+    for x in rows:
+        monitor.observe(bundle, x)
+    observe_us = (time.perf_counter() - start) / n * 1e6
+    start = time.perf_counter()
+    monitor.snapshot()
+    snapshot_ms = (time.perf_counter() - start) * 1e3
+    counters_kb = monitor._counts.nbytes / 1024
+    print(f"{n} rows of {len(bundle.feature_columns)} features")
+    print(f"  observe:  {observe_us:6.1f} us per request")
+    print(f"  snapshot: {snapshot_ms:6.2f} ms per window")
+    print(f"  counters: {counters_kb:6.1f} KB, independent of traffic")
+
+
+def simulate(window):
+    import matching_engine
+    from table_encoder import UnknownReport
+
+    if not matching_engine.load_matching_data():
+        return
+    bundle = matching_engine.active
+    rng = np.random.default_rng(0)
+    monitor = DriftMonitor(window=window, verbose=False)
+
+    for x in _reference_rows(bundle, window, rng):
+        monitor.observe(bundle, x)
+    print("Traffic drawn from the cluster table")
+    print(format_metrics(monitor.metrics(), top=5))
+
+    # Shifted traffic: lower moods, more screen time and some unseen diet labels
+    columns = bundle.feature_columns
+    mood = columns.index('entry_hall_mood_index')
+    screen = columns.index('screen_time_groups')
+    door2 = columns.index('answer_code_61')
+    for x in _reference_rows(bundle, window, rng):
+        x[mood] = max(1.0, x[mood] - 1.0)
+        x[screen] = 5.0
+        x[door2] = rng.integers(1, 6)
+        report = UnknownReport()
+        if rng.random() < 0.1:
+            report.add('diet_type', 1, ['Fast Food'])
+        monitor.observe(bundle, x, report)
+    print("\nShifted traffic")
+    print(format_metrics(monitor.metrics(), top=5))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming feature-drift monitor")
+    parser.add_argument('--bench', action='store_true', help="per-request cost of observe()")
+    parser.add_argument('--rows', type=int, default=20_000)
+    parser.add_argument('--simulate', action='store_true', help="drift scores for reference-like and shifted traffic")
+    parser.add_argument('--window', type=int, default=DEFAULT_WINDOW)
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.rows)
+    elif args.simulate:
+        simulate(args.window)
+    else:
+        parser.print_help()
@@ -0,0 +1,312 @@
+"""
+Table-driven binning of raw profile values into the cluster table's groups.
+
+process_questionnaire_data used to turn one session's age, work hours, sleep,
+physical activity, screen time and friends into `*_groups` labels through six
+if/elif ladders, and nothing could do the same for the raw rows of
+user_profiles.csv. Each ladder is now one GroupBins entry: increasing upper
+bounds, whether each bound is inclusive (`<=`) or exclusive (`<`), and the
+exact labels (en dashes, as in the cluster CSV). Exclusive bounds are moved
+one float step down, so every table is binned by a single
+`np.digitize(values, edges, right=True)`:
+
+    session path    session_groups(q_answers, age)  -> {group column: label}
+    bulk path       profile_groups(frame)           -> categorical group columns
+                    convert(path, out)              -> user_profiles.csv streamed
+                                                       in chunks into cluster rows
+
+A value the ladders sent to their `else` branch (above every bound, or NaN)
+lands in the last label, as before.
+
+Run `python group_bins.py --check-parity` to compare every table with the
+original ladders, and `python group_bins.py --bench` for the bulk throughput.
+"""
+
+import argparse
+import time
+from typing import List, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from streaming_loader import CATEGORICAL_COLUMNS, DEFAULT_CHUNKSIZE, PROFILES_CSV
+
+
+class GroupBins(NamedTuple):
+    """One ladder: labels of a numeric field between increasing upper bounds"""
+    column: str             # group column in the cluster table
+    source: str             # raw column in user_profiles.csv
+    question: str           # questionnaire key of the session path, None for age
+    default: float          # session value when the question was not answered
+    bounds: List[tuple]     # ('<' or '<=', bound) per label but the last
+    labels: List[str]
+
+    @property
+    def edges(self):
+        return np.array([bound if op == '<=' else np.nextafter(bound, -np.inf) for op, bound in self.bounds])
+
+
+GROUP_BINS = [
+    GroupBins('age_groups', 'age', None, np.nan,
+              [('<', 18), ('<', 25), ('<', 35), ('<', 45), ('<', 55)],
+              ['Under 18', '18-24', '25-34', '35-44', '45-54', '55-64']),   # regular hyphens, as in the CSV
+    GroupBins('work_hours_groups', 'work_hours', 'q6', 40,
+              [('<=', 10), ('<=', 20), ('<=', 30), ('<=', 40), ('<=', 50), ('<=', 60)],
+              ['0–10 hrs', '11–20 hrs', '21–30 hrs', '31–40 hrs', '41–50 hrs', '51–60 hrs', '60+ hrs']),
+    GroupBins('sleep_hours_groups', 'sleep_hours', 'q8', 7,
+              [('<', 4), ('<=', 6), ('<=', 8), ('<=', 10)],
+              ['<4 hrs', '4–6 hrs', '6–8 hrs', '8–10 hrs', '10+ hrs']),
+    GroupBins('physical_activity_groups', 'physical_activity', 'q10', 5,
+              [('<=', 1), ('<=', 3), ('<=', 5), ('<=', 7), ('<=', 14)],
+              ['Rarely (0–1)', 'Light (2–3)', 'Moderate (4–5)', 'Active (6–7)', 'Very Active (8–14)',
+               'Extremely Active (15+)']),
+    GroupBins('screen_time_groups', 'screen_time', 'q11', 6,
+              [('<=', 2), ('<=', 4), ('<=', 6), ('<=', 8), ('<=', 12)],
+              ['<2 hrs', '2–4 hrs', '4–6 hrs', '6–8 hrs', '8–12 hrs', '12+ hrs']),
+    GroupBins('friends_groups', 'number_of_friends', 'q15', 3,
+              [('<=', 0), ('<=', 2), ('<=', 4), ('<=', 6), ('<=', 8)],
+              ['0', '0–2', '3–4', '5–6', '7–8', '9 plus']),
+]
+BINS_BY_COLUMN = {bins.column: bins for bins in GROUP_BINS}
+_EDGES = {bins.column: bins.edges for bins in GROUP_BINS}
+
+# Profile categoricals copied into cluster rows as they are; blanks get the questionnaire's default
+PROFILE_CATEGORICALS = {'gender': None, 'education_level': 'Undergraduate', 'occupation_status': 'Employed',
+                        'diet_type': 'Balanced', 'stress_level': 'Medium',
+                        'mental_health_condition': 'Not Applicable', 'relationship_status': 'Single'}
+
+
+def bin_codes(column, values):
+    """Label index of every value in the group column's table"""
+    return np.digitize(np.asarray(values, dtype=np.float64), _EDGES[column], right=True)
+
+
+def group_label(column, value):
+    """Label of one value"""
+    return BINS_BY_COLUMN[column].labels[int(bin_codes(column, value))]
+
+
+def session_groups(q_answers, age=None):
+    """{group column: label} of one session's questionnaire answers (and age, when known)"""
+    groups = {} if age is None else {'age_groups': group_label('age_groups', age)}
+    for bins in GROUP_BINS[1:]:
+        groups[bins.column] = group_label(bins.column, q_answers.get(bins.question, bins.default))
+    return groups
+
+
+def profile_groups(frame):
+    """Categorical group columns for the raw value columns of a profile frame"""
+    return pd.DataFrame({
+        bins.column: pd.Categorical.from_codes(bin_codes(bins.column, frame[bins.source]), categories=bins.labels)
+        for bins in GROUP_BINS
+    }, index=frame.index)
+
+
+def profile_rows(frame):
+    """Cluster-table columns derivable from raw user_profiles.csv rows (no answer codes or subscores)"""
+    rows = pd.DataFrame({'user_id': frame['user_id']}, index=frame.index)
+    for col, default in PROFILE_CATEGORICALS.items():
+        values = frame[col]
+        rows[col] = (values if default is None else values.fillna(default)).astype('category')
+    rows['has_mental_health_condition'] = frame['has_mental_health_condition'].astype(str).str.lower().eq('true') \
+        .astype(np.int8)
+    rows = rows.join(profile_groups(frame))
+    return rows[['user_id', 'has_mental_health_condition'] + CATEGORICAL_COLUMNS]
+
+
+def convert(path=PROFILES_CSV, out=None, chunksize=DEFAULT_CHUNKSIZE):
+    """Stream a profiles CSV into cluster rows; written to `out` chunk by chunk, or returned"""
+    usecols = ['user_id', 'has_mental_health_condition', *PROFILE_CATEGORICALS,
+               *(bins.source for bins in GROUP_BINS)]
+    parts, written = [], 0
+    for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunksize):
+        rows = profile_rows(chunk)
+        if out is None:
+            parts.append(rows)
+        else:
+            rows.to_csv(out, mode='w' if not written else 'a', header=not written, index=False)
+        written += len(rows)
+    if out is None:
+        return pd.concat(parts, ignore_index=True) if parts else None
+    return written
+
+
+# ============================================================================
+# Parity with the original ladders and benchmark
+# ============================================================================
+
+def _ladder_groups(age, work_hours, sleep_hours, activity_hours, screen_hours, friends):
+    """The if/elif ladders process_questionnaire_data used before GROUP_BINS"""
+    if age < 18:
+        age_group = 'Under 18'
+    elif age < 25:
+        age_group = '18-24'
+    elif age < 35:
+        age_group = '25-34'
+    elif age < 45:
+        age_group = '35-44'
+    elif age < 55:
+        age_group = '45-54'
+    else:
+        age_group = '55-64'
+
+    if work_hours <= 10:
+        work_hours_group = '0–10 hrs'
+    elif work_hours <= 20:
+        work_hours_group = '11–20 hrs'
+    elif work_hours <= 30:
+        work_hours_group = '21–30 hrs'
+    elif work_hours <= 40:
+        work_hours_group = '31–40 hrs'
+    elif work_hours <= 50:
+        work_hours_group = '41–50 hrs'
+    elif work_hours <= 60:
+        work_hours_group = '51–60 hrs'
+    else:
+        work_hours_group = '60+ hrs'
+
+    if sleep_hours < 4:
+        sleep_hours_group = '<4 hrs'
+    elif sleep_hours <= 6:
+        sleep_hours_group = '4–6 hrs'
+    elif sleep_hours <= 8:
+        sleep_hours_group = '6–8 hrs'
+    elif sleep_hours <= 10:
+        sleep_hours_group = '8–10 hrs'
+    else:
+        sleep_hours_group = '10+ hrs'
+
+    if activity_hours <= 1:
+        activity_group = 'Rarely (0–1)'
+    elif activity_hours <= 3:
+        activity_group = 'Light (2–3)'
+    elif activity_hours <= 5:
+        activity_group = 'Moderate (4–5)'
+    elif activity_hours <= 7:
+        activity_group = 'Active (6–7)'
+    elif activity_hours <= 14:
+        activity_group = 'Very Active (8–14)'
+    else:
+        activity_group = 'Extremely Active (15+)'
+
+    if screen_hours <= 2:
+        screen_group = '<2 hrs'
+    elif screen_hours <= 4:
+        screen_group = '2–4 hrs'
+    elif screen_hours <= 6:
+        screen_group = '4–6 hrs'
+    elif screen_hours <= 8:
+        screen_group = '6–8 hrs'
+    elif screen_hours <= 12:
+        screen_group = '8–12 hrs'
+    else:
+        screen_group = '12+ hrs'
+
+    if friends <= 0:
+        friends_group = '0'
+    elif friends <= 2:
+        friends_group = '0–2'
+    elif friends <= 4:
+        friends_group = '3–4'
+    elif friends <= 6:
+        friends_group = '5–6'
+    elif friends <= 8:
+        friends_group = '7–8'
+    else:
+        friends_group = '9 plus'
+
+    return [age_group, work_hours_group, sleep_hours_group, activity_group, screen_group, friends_group]
+
+
+def parity_values(rng, n):
+    """Every bound, its float neighbours, integers, random floats and NaN"""
+    bounds = np.unique([bound for bins in GROUP_BINS for _, bound in bins.bounds]).astype(np.float64)
+    around = np.concatenate([bounds, np.nextafter(bounds, -np.inf), np.nextafter(bounds, np.inf),
+                             bounds - 0.5, bounds + 0.5])
+    return np.concatenate([around, np.arange(-5, 101, dtype=np.float64), rng.uniform(-5, 100, n),
+                           np.round(rng.uniform(-5, 100, n), 1), [np.nan, -np.inf, np.inf]])
+
+
+def check_parity(n, path):
+    rng = np.random.default_rng(0)
+    values = parity_values(rng, n)
+    frames = {'boundary and random values': pd.DataFrame({bins.source: values for bins in GROUP_BINS})}
+    try:
+        frames[path] = pd.read_csv(path, usecols=[bins.source for bins in GROUP_BINS])
+    except FileNotFoundError:
+        print(f"[WARNING] {path} not found, checking synthetic values only")
+
+    mismatches = 0
+    for name, frame in frames.items():
+        expected = np.array([_ladder_groups(*row) for row in frame[[b.source for b in GROUP_BINS]].to_numpy()])
+        derived = profile_groups(frame)
+        for f, bins in enumerate(GROUP_BINS):
+            wrong = np.flatnonzero(derived[bins.column].astype(str).to_numpy() != expected[:, f])
+            mismatches += len(wrong)
+            if len(wrong):
+                value = frame[bins.source].iloc[wrong[0]]
+                print(f"[ERROR] {bins.column}: {len(wrong)} of {len(frame)} differ, e.g. {value!r} -> "
+                      f"{derived[bins.column].iloc[wrong[0]]!r}, ladder {expected[wrong[0], f]!r}")
+        # The session path bins one value at a time
+        for row, labels in zip(frame.to_dict('records')[:2_000], expected):
+            q_answers = {bins.question: row[bins.source] for bins in GROUP_BINS[1:]}
+            if list(session_groups(q_answers, row['age']).values()) != list(labels):
+                mismatches += 1
+                print(f"[ERROR] session path differs for {row}")
+                break
+        print(f"[INFO] {name}: {len(frame)} rows x {len(GROUP_BINS)} group columns checked")
+
+    if mismatches:
+        print(f"[ERROR] {mismatches} labels differ from the ladders")
+    else:
+        print("[SUCCESS] Every label matches the original ladders")
+    return not mismatches
+
+
+def benchmark(n):
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({
+        'age': rng.integers(18, 66, n), 'work_hours': np.round(rng.uniform(0, 80, n), 1),
+        'sleep_hours': rng.integers(3, 12, n), 'physical_activity': np.round(rng.uniform(0, 20, n), 1),
+        'screen_time': rng.integers(1, 14, n), 'number_of_friends': rng.integers(0, 11, n),
+    })
+    sample = frame.iloc[:min(n, 100_000)].to_numpy()
+    start = time.perf_counter()
+    for row in sample:
+        _ladder_groups(*row)
+    ladder_rate = len(sample) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    profile_groups(frame)
+    bulk_rate = n / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for _ in range(10_000):
+        session_groups({'q6': 38.5, 'q8': 7, 'q10': 5, 'q11': 6, 'q15': 3}, 29)
+    session_us = (time.perf_counter() - start) / 10_000 * 1e6
+    print(f"{n} profile rows, {len(GROUP_BINS)} group columns")
+    print(f"  ladders per row: {ladder_rate / 1e6:8.3f} M rows/s")
+    print(f"  np.digitize:     {bulk_rate / 1e6:8.3f} M rows/s ({bulk_rate / ladder_rate:.0f}x)")
+    print(f"  one session:     {session_us:8.1f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Table-driven binning of raw profile values into group labels")
+    parser.add_argument('--check-parity', action='store_true', help="compare every table with the original ladders")
+    parser.add_argument('--bench', action='store_true', help="bulk binning throughput versus the ladders")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    sub = parser.add_subparsers(dest='command')
+    conv = sub.add_parser('convert', help="derive cluster-table columns from a profiles CSV")
+    conv.add_argument('path', nargs='?', default=PROFILES_CSV)
+    conv.add_argument('--out', default='profile_groups.csv')
+    conv.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    args = parser.parse_args()
+
+    if args.check_parity:
+        raise SystemExit(0 if check_parity(100_000, PROFILES_CSV) else 1)
+    elif args.bench:
+        benchmark(args.rows)
+    elif args.command == 'convert':
+        start = time.perf_counter()
+        written = convert(args.path, args.out, args.chunksize)
+        print(f"[OK] {written} profile rows -> {args.out} in {time.perf_counter() - start:.1f}s")
+    else:
+        parser.print_help()
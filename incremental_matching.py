@@ -0,0 +1,76 @@
+"""
+Incremental cosine similarity while a user answers Door 2.
+
+Everything in the new user's feature vector except the 25 Door 2 answer codes
+and the derived matching_score is known before Door 2 starts. When the user
+enters Door 2 the dot products of that known part against every candidate in
+the (provisionally predicted) cluster are computed once. Each recorded answer
+then adds `delta * column` to the per-candidate accumulators, so the final
+scoring after the last question is one axpy for matching_score plus a divide
+by the precomputed candidate norms.
+"""
+
+import numpy as np
+
+from streaming_loader import DOOR2_ANSWER_COLUMNS
+
+# Value build_new_user_row uses for Door 2 questions that were never answered
+DEFAULT_DOOR2_ANSWER = 3
+
+
+class IncrementalMatcher:
+    """Per-session similarity accumulators against one cluster block"""
+
+    def __init__(self, base_vector, feature_columns, cluster, block, norms):
+        columns = list(feature_columns)
+        self.door2_idx = np.array([columns.index(col) for col in DOOR2_ANSWER_COLUMNS])
+        self.score_idx = columns.index('matching_score')
+
+        # Known features only - Door 2 codes and matching_score start at zero and are added as they arrive
+        self.x = np.asarray(base_vector, dtype=np.float64).copy()
+        self.x[self.door2_idx] = 0.0
+        self.x[self.score_idx] = 0.0
+        self.answered = np.zeros(len(self.door2_idx), dtype=bool)
+
+        self.retarget(cluster, block, norms)
+
+    def retarget(self, cluster, block, norms):
+        """Point the accumulators at another cluster (one matrix-vector product)"""
+        self.cluster = cluster
+        self.block = block
+        self.norms = norms
+        self.dot = block.features @ self.x if block is not None else None
+
+    def record_answer(self, question, code):
+        """Fold the answer code for Door 2 question `question` (0-based) into the accumulators"""
+        col = self.door2_idx[question]
+        old = self.x[col]
+        delta = float(code) - old
+        if delta:
+            if self.dot is not None:
+                self.dot += delta * self.block.features[:, col]
+            self.x[col] = float(code)
+        self.answered[question] = True
+
+    def final_vector(self):
+        """The complete feature vector, as build_new_user_row + pre_processing would produce it"""
+        x = self.x.copy()
+        x[self.door2_idx[~self.answered]] = DEFAULT_DOOR2_ANSWER
+        x[self.score_idx] = round(x[self.door2_idx].mean(), 2)
+        return x
+
+    def scores(self):
+        """Cosine similarity of the final vector against every candidate of the cluster"""
+        if self.dot is None:
+            return None
+
+        x = self.final_vector()
+        dot = self.dot.copy()
+        missing = self.door2_idx[~self.answered]
+        if len(missing):
+            dot += self.block.features[:, missing].sum(axis=1, dtype=np.float64) * DEFAULT_DOOR2_ANSWER
+        dot += x[self.score_idx] * self.block.features[:, self.score_idx]
+
+        denom = np.sqrt(x @ x) * self.norms
+        # Zero vectors score 0, as in sklearn's cosine_similarity
+        return np.divide(dot, denom, out=np.zeros_like(dot), where=denom > 0)
@@ -0,0 +1,135 @@
+"""
+Paginated "show more matches" over a cached partial ordering.
+
+When a match request scores a cluster, the best `max_candidates` scores and
+ids are kept in a MatchCursor (one argpartition, O(n)). Nothing beyond that
+is sorted up front. Each time a page reaches past the sorted prefix, the next
+block is pulled out of the unsorted remainder with argpartition and sorted on
+its own, with blocks doubling in size. A page is then a slice of the sorted
+prefix, and a session that never asks for more pays only for the first cut.
+
+The cursor holds its own copies of at most max_candidates float32 scores,
+int32 ids and int32 ordering (120 KB at the default), plus float32 ranking
+scores when hobby overlap reorders the candidates, so its memory is bounded
+however large the cluster is. It lives in the Streamlit session
+state and expires with the session.
+
+Run `python match_cursor.py --bench` for page latencies.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+DEFAULT_MAX_CANDIDATES = 10_000
+DEFAULT_PAGE_SIZE = 5
+
+
+class MatchCursor:
+    """Lazily sorted candidate scores of one match request, consumed page by page"""
+
+    def __init__(self, user_ids, scores, cluster=None, x=None, exclude=(),
+                 max_candidates=DEFAULT_MAX_CANDIDATES, ranking=None):
+        scores = np.asarray(scores)
+        user_ids = np.asarray(user_ids)
+        # ranking orders the candidates when it differs from the scores handed out (e.g. hybrid scores)
+        ranking = scores if ranking is None else np.asarray(ranking)
+        if len(exclude):
+            keep = ~np.isin(user_ids, np.asarray(list(exclude)))
+            user_ids, scores, ranking = user_ids[keep], scores[keep], ranking[keep]
+        if len(scores) > max_candidates:
+            best = np.argpartition(-ranking, max_candidates - 1)[:max_candidates]
+            user_ids, scores, ranking = user_ids[best], scores[best], ranking[best]
+
+        self.user_ids = user_ids.astype(np.int32)
+        self.scores = scores.astype(np.float32)
+        self.ranking = self.scores if ranking is scores else ranking.astype(np.float32)
+        self.cluster = cluster
+        self.x = x                  # the requesting user's feature vector, for explanations
+        self.order = np.arange(len(self.scores), dtype=np.int32)
+        self.n_sorted = 0           # order[:n_sorted] is sorted best first
+        self.position = 0           # candidates already handed out
+
+    def __len__(self):
+        return len(self.scores)
+
+    @property
+    def remaining(self):
+        return len(self.scores) - self.position
+
+    def nbytes(self):
+        extra = self.ranking.nbytes if self.ranking is not self.scores else 0
+        return self.user_ids.nbytes + self.scores.nbytes + self.order.nbytes + extra
+
+    def _sort_through(self, stop):
+        """Extend the sorted prefix, in doubling blocks, until it covers order[:stop]"""
+        while self.n_sorted < stop:
+            rest = self.order[self.n_sorted:]
+            block = min(max(stop - self.n_sorted, self.n_sorted, DEFAULT_PAGE_SIZE), len(rest))
+            if block < len(rest):
+                rest[:] = rest[np.argpartition(-self.ranking[rest], block - 1)]
+            head = rest[:block]
+            head[:] = head[np.argsort(-self.ranking[head], kind='stable')]
+            self.n_sorted += block
+
+    def next_page(self, n=DEFAULT_PAGE_SIZE, with_ranking=False):
+        """(user_ids, scores) of the next n candidates, best first (empty once exhausted)
+        
+        with_ranking=True adds the ranking scores of the page, or None when the scores rank on their own.
+        """
+        stop = min(self.position + n, len(self.scores))
+        self._sort_through(stop)
+        page = self.order[self.position:stop]
+        self.position = stop
+        if with_ranking:
+            ranking = self.ranking[page] if self.ranking is not self.scores else None
+            return self.user_ids[page], self.scores[page], ranking
+        return self.user_ids[page], self.scores[page]
+
+
+# ============================================================================
+# Benchmark
+# ============================================================================
+
+def benchmark(cluster_size, pages, page_size, repeats=20):
+    rng = np.random.default_rng(0)
+    scores = rng.random(cluster_size)
+    user_ids = np.arange(cluster_size, dtype=np.int32)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        MatchCursor(user_ids, scores)
+    open_ms = (time.perf_counter() - start) / repeats * 1e3
+
+    page_ms = np.zeros(pages)
+    for _ in range(repeats):
+        cursor = MatchCursor(user_ids, scores)
+        for p in range(pages):
+            start = time.perf_counter()
+            cursor.next_page(page_size)
+            page_ms[p] += (time.perf_counter() - start) * 1e3 / repeats
+
+    cursor = MatchCursor(user_ids, scores)
+    paged = np.concatenate([cursor.next_page(page_size)[1] for _ in range(pages)])
+    full = np.sort(-scores)[:len(paged)]
+    assert np.allclose(-full, paged, atol=1e-6), "paged order differs from a full sort"
+
+    print(f"{cluster_size} scores: cursor opened in {open_ms:.2f} ms, {cursor.nbytes() / 1e3:.0f} KB")
+    print(f"{'page':>5} {'ms':>7}")
+    for p in range(pages):
+        print(f"{p + 1:>5} {page_ms[p]:>7.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Paginated match cursor")
+    parser.add_argument('--bench', action='store_true', help="latency of successive pages")
+    parser.add_argument('--cluster-size', type=int, default=200_000)
+    parser.add_argument('--pages', type=int, default=10)
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE)
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.cluster_size, args.pages, args.page_size)
+    else:
+        parser.print_help()
@@ -0,0 +1,130 @@
+"""
+Per-feature explanations of cosine-similarity matches.
+
+Cosine similarity is a sum over features: cos(x, z) = sum_j x_j z_j / (|x| |z|).
+Each term is that feature's contribution to the match, so the contributions of
+a match add up exactly to its cosine similarity, whichever kernel ranked it
+(only under the cosine kernel is that its similarity score). For the top-k
+matches they are computed in one (k, n_features) pass from the candidate rows
+and the per-row norms the similarity step already holds, then summed into the
+groups shown on the completion page with a single matrix product.
+
+Run `python match_explanations.py --bench` to time it against the scoring pass.
+"""
+
+import argparse
+import functools
+import time
+
+import numpy as np
+
+from streaming_loader import DOOR2_ANSWER_COLUMNS, ENTRY_HALL_ANSWER_COLUMNS, SUBSCORE_COLUMNS
+
+# Display groups, in the order shown; every feature not listed elsewhere is a demographic
+EXPLANATION_GROUPS = ['Entry Hall', 'Door 2', 'Subscores', 'Demographics']
+_GROUP_COLUMNS = {
+    'Entry Hall': ENTRY_HALL_ANSWER_COLUMNS,
+    'Door 2': DOOR2_ANSWER_COLUMNS + ['matching_score'],
+    'Subscores': SUBSCORE_COLUMNS,
+}
+DEFAULT_TOP_FEATURES = 3
+
+
+@functools.lru_cache(maxsize=4)
+def group_matrix(feature_columns):
+    """One-hot (n_features, n_groups) matrix assigning each feature column to its group"""
+    group_of = {col: EXPLANATION_GROUPS.index(group) for group, cols in _GROUP_COLUMNS.items() for col in cols}
+    groups = np.array([group_of.get(col, EXPLANATION_GROUPS.index('Demographics')) for col in feature_columns])
+    matrix = np.zeros((len(feature_columns), len(EXPLANATION_GROUPS)))
+    matrix[np.arange(len(feature_columns)), groups] = 1.0
+    return matrix
+
+
+def feature_label(col):
+    """Readable name of a feature column, e.g. answer_code_60 -> 'Door 2 Q5'"""
+    if col in ENTRY_HALL_ANSWER_COLUMNS:
+        return f"Entry Hall Q{ENTRY_HALL_ANSWER_COLUMNS.index(col) + 1}"
+    if col in DOOR2_ANSWER_COLUMNS:
+        return f"Door 2 Q{DOOR2_ANSWER_COLUMNS.index(col) + 1}"
+    if col == 'matching_score':
+        return "Door 2 average"
+    return col.replace('entry_hall_', '').replace('_groups', '').replace('_', ' ').capitalize()
+
+
+def feature_contributions(x, features, norms):
+    """
+    (k, n_features) contributions of each feature to the cosine similarity of x
+    against each of the k candidate rows; row sums are the similarity scores.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    features = np.asarray(features, dtype=np.float64)
+    denom = np.asarray(norms, dtype=np.float64) * np.sqrt(x @ x)
+    # Zero vectors score 0, as in the similarity step
+    scale = np.divide(1.0, denom, out=np.zeros(len(denom)), where=denom > 0)
+    return features * x * scale[:, None]
+
+
+def explain(x, features, norms, feature_columns, top_features=DEFAULT_TOP_FEATURES):
+    """
+    Explanation of each of the k matches:
+    {'cosine': similarity, 'groups': {group: contribution}, 'top_features': [(label, contribution), ...]}.
+    The contributions add up to 'cosine', whichever kernel ranked the match.
+    """
+    contributions = feature_contributions(x, features, norms)
+    grouped = contributions @ group_matrix(tuple(feature_columns))
+    n_top = min(top_features, contributions.shape[1])
+    top = np.argsort(-contributions, axis=1, kind='stable')[:, :n_top]
+    top_values = np.take_along_axis(contributions, top, axis=1)
+
+    explanations = []
+    for cosine, group_row, top_row, value_row in zip(contributions.sum(axis=1).tolist(), grouped.tolist(),
+                                                     top.tolist(), top_values.tolist()):
+        explanations.append({
+            'cosine': cosine,
+            'groups': dict(zip(EXPLANATION_GROUPS, group_row)),
+            'top_features': [(feature_label(feature_columns[j]), value) for j, value in zip(top_row, value_row)],
+        })
+    return explanations
+
+
+# ============================================================================
+# Benchmark
+# ============================================================================
+
+def benchmark(cluster_size, top_n, repeats=50):
+    from cluster_search import cosine_scores, top_k_indices
+    from streaming_loader import read_cluster_header, cluster_feature_columns
+
+    columns = cluster_feature_columns(read_cluster_header())
+    rng = np.random.default_rng(0)
+    features = rng.integers(1, 6, size=(cluster_size, len(columns))).astype(np.float32)
+    norms = np.linalg.norm(features.astype(np.float64), axis=1)
+    x = rng.integers(1, 6, size=len(columns)).astype(np.float64)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        scores = cosine_scores(features, norms, x)
+        top = top_k_indices(scores, top_n)
+    scoring_ms = (time.perf_counter() - start) / repeats * 1e3
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        explanations = explain(x, features[top], norms[top], columns)
+    explain_ms = (time.perf_counter() - start) / repeats * 1e3
+
+    total = sum(explanations[0]['groups'].values())
+    print(f"{cluster_size} candidates, top {top_n}: scoring {scoring_ms:.2f} ms, explanations {explain_ms:.3f} ms")
+    print(f"contributions of match 1 sum to {total:.6f} (score {scores[top[0]]:.6f})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-feature match explanations")
+    parser.add_argument('--bench', action='store_true', help="explanation cost next to the scoring pass")
+    parser.add_argument('--cluster-size', type=int, default=200_000)
+    parser.add_argument('--top-n', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.cluster_size, args.top_n)
+    else:
+        parser.print_help()
@@ -0,0 +1,747 @@
+"""
+Vita Nova user matching engine (from User Matching Engine.ipynb).
+
+Kept free of Streamlit so it can be imported by app.py, offline jobs and
+benchmark scripts alike.
+"""
+import pandas as pd
+import numpy as np
+import pickle
+import functools
+import threading
+import warnings
+from contextlib import contextmanager
+warnings.filterwarnings('ignore')
+
+from streaming_loader import (
+    CLUSTERS_CSV, PROFILES_CSV, DEFAULT_CHUNKSIZE,
+    stream_cluster_arrays, stream_profiles, peak_rss_mb,
+)
+from table_encoder import compile_encoders, encode_frame
+from incremental_matching import IncrementalMatcher
+from cluster_search import (
+    DEFAULT_PROBABILITY_MASS, DEFAULT_CANDIDATE_BUDGET, DEFAULT_MAX_CLUSTERS,
+    cluster_probabilities, plan_clusters, search_clusters, cosine_scores, top_k_indices,
+)
+from attribute_index import build_attribute_indexes, filter_codes
+from neighbour_graph import NEIGHBOUR_GRAPH_PATH, NeighbourGraph
+from match_explanations import explain
+from similarity_kernels import DEFAULT_KERNEL, make_kernel
+from match_cursor import MatchCursor
+from diversity_rerank import DEFAULT_POOL_SIZE as DIVERSITY_POOL_SIZE, normalized_rows, mmr_select
+from batch_assignment import DEFAULT_INBOUND_CAP, DEFAULT_POOL_SIZE, assign_cluster, merge_stats, format_stats
+from hobby_index import DEFAULT_HOBBY_WEIGHT, blend, load_hobby_index
+from sharded_search import default_workers, sharded_scores, sharded_top_k
+from admission_control import cluster_medoids
+import os
+
+# ============================================================================
+# Matching Engine Functions (from User Matching Engine.ipynb)
+# ============================================================================
+
+# Loaded models and data, bundled so a new model version is swapped in with one assignment
+class ModelBundle:
+    """Everything the matching engine loads for one model version"""
+    
+    def __init__(self, version, loaded_model, encoders, cluster_template, cluster_arrays, feature_columns,
+                 df_user_profiles, neighbour_graph=None, hobby_index=None):
+        self.version = version
+        self.loaded_model = loaded_model
+        self.encoders = encoders
+        self.compiled_encoders = compile_encoders(encoders)    # encoders precompiled into lookup arrays (table_encoder)
+        self.cluster_template = cluster_template    # first raw row of the cluster table, structure template for new users
+        self.cluster_arrays = cluster_arrays        # Class Name -> ClusterBlock(user_ids, float32 features)
+        self.feature_columns = feature_columns      # feature column order shared by the classifier and cluster_arrays
+        self.df_user_profiles = df_user_profiles    # compact display fields, indexed by user_id
+        self.neighbour_graph = neighbour_graph      # NeighbourGraph built offline by neighbour_graph.py, if present
+        # Class Name -> L2 norm of every feature row (float64)
+        self.cluster_norms = {
+            cluster: np.linalg.norm(block.features.astype(np.float64), axis=1)
+            for cluster, block in cluster_arrays.items()
+        }
+        # Class Name -> pd.Index of user ids, for user id -> block row lookups
+        self.cluster_row_index = {cluster: pd.Index(block.user_ids) for cluster, block in cluster_arrays.items()}
+        # Class Name -> AttributeIndex (bitmaps of the filterable columns)
+        self.attribute_indexes = build_attribute_indexes(cluster_arrays, feature_columns, df_user_profiles)
+        # Class Name -> row positions of its representative users, the degraded answer under overload
+        self.medoid_rows = cluster_medoids(cluster_arrays, self.cluster_norms)
+        self.prepared_kernels = {}  # kernel name -> (SimilarityKernel, {Class Name: kernel state})
+        # HobbyIndex of the clustered users' hobbies (hobby_index.py), with postings laid out per cluster
+        self.hobby_index = hobby_index
+        if hobby_index is not None:
+            for cluster, row_index in self.cluster_row_index.items():
+                hobby_index.add_cluster(cluster, row_index)
+
+# The bundle serving requests. Each request pins the bundle that was active when it started
+# (pinned_bundle), so promote_bundle never tears a request in flight.
+active = None
+_request = threading.local()
+
+def current_bundle():
+    """The bundle pinned by the request running on this thread, else the active one"""
+    return getattr(_request, 'bundle', None) or active
+
+@contextmanager
+def pinned(bundle=None):
+    """Serve every engine call on this thread from one bundle (the active one by default)"""
+    outer = getattr(_request, 'bundle', None)
+    # Nested engine calls keep the outermost pin
+    _request.bundle = outer or bundle or active
+    try:
+        yield _request.bundle
+    finally:
+        _request.bundle = outer
+
+def pinned_bundle(fn):
+    """Decorator for engine entry points: pin the active bundle for the whole call"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with pinned():
+            return fn(*args, **kwargs)
+    return wrapper
+
+def promote_bundle(bundle):
+    """Make bundle the active one; requests already running finish on the bundle they pinned"""
+    global active
+    previous, active = active, bundle
+    print(f"[OK] Promoted model {bundle.version}" + (f" (was {previous.version})" if previous else ""))
+    return previous
+
+# Observer of single-cluster match requests (model_refresh.ShadowEvaluator.observe), or None.
+# Called as shadow_observer(bundle, X_new, cluster) once the live matches are computed.
+shadow_observer = None
+
+# Observer of every incoming user's encoded row (drift_monitor.DriftMonitor.observe), or None.
+# Called as drift_observer(bundle, x, unknown_report) before the cluster is predicted.
+drift_observer = None
+
+def __getattr__(name):
+    """matching_engine.cluster_arrays, .feature_columns, ... read the active bundle (None before loading)"""
+    if name in ('loaded_model', 'encoders', 'compiled_encoders', 'cluster_template', 'cluster_arrays',
+                'cluster_norms', 'cluster_row_index', 'feature_columns', 'df_user_profiles', 'attribute_indexes',
+                'neighbour_graph', 'prepared_kernels', 'hobby_index', 'medoid_rows'):
+        return getattr(active, name) if active is not None else None
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Attribute filters applied to every match request unless the caller passes its own,
+# e.g. {'country': 'Canada', 'age_groups': ['18-24', '25-34']}
+match_filters = {}
+
+# Weight of diversity in the optional MMR re-ranking of matches (0 = plain top-k by similarity),
+# applied to every match request unless the caller passes its own
+match_diversity = 0.0
+
+# Weight of hobby overlap (Jaccard) in the ranking of single-cluster matches, for users who listed
+# hobbies (0 = similarity only); see hobby_index.blend. The shown similarity_score stays the kernel's
+hobby_weight = DEFAULT_HOBBY_WEIGHT
+
+# Similarity kernel used to rank candidates (see similarity_kernels.KERNELS), unless the caller passes
+# its own; kernels are prepared against each bundle's cluster arrays on first use
+similarity_kernel = DEFAULT_KERNEL
+
+# Threads scoring one large cluster in parallel shards (sharded_search; 1 = always the calling thread)
+search_workers = default_workers()
+
+def get_kernel(name=None):
+    """(kernel, per-cluster states) for a kernel name, preparing it on first use"""
+    name = similarity_kernel if name is None else name
+    bundle = current_bundle()
+    if name not in bundle.prepared_kernels:
+        kernel = make_kernel(name)
+        bundle.prepared_kernels[name] = (kernel, kernel.prepare(bundle.cluster_arrays, bundle.feature_columns))
+    return bundle.prepared_kernels[name]
+
+def kernel_scores(kernel_name, cluster, x, rows=None):
+    """(user_ids, scores) of every candidate of one cluster (or its `rows`) under a kernel"""
+    kernel, states = get_kernel(kernel_name)
+    block = current_bundle().cluster_arrays[cluster]
+    scores = sharded_scores(kernel, states[cluster], block.features, x, rows, search_workers)
+    return (block.user_ids if rows is None else block.user_ids[rows]), scores
+
+def hobby_ranking(scores, cluster, hobbies, rows=None):
+    """Hybrid ranking scores: a cluster's kernel scores (of its `rows`) blended with hobby overlap
+    
+    None without known hobbies, when the kernel scores rank on their own.
+    """
+    index = current_bundle().hobby_index
+    hobby_ids = index.hobby_ids(hobbies) if index is not None and hobby_weight else []
+    if not hobby_ids:
+        return None
+    block_rows, jaccard = index.jaccard(int(cluster), hobby_ids)
+    return blend(scores, block_rows, jaccard, hobby_weight, rows)
+
+def select_matches(user_ids, scores, cluster, x, top_n, diversity, with_cursor, ranking=None):
+    """Top-n (optionally re-ranked) matches from a cluster's scores, plus a cursor over the rest
+    
+    ranking (e.g. hobby_ranking) orders the candidates in place of the scores when given;
+    the matches still show the kernel scores.
+    """
+    ranking = scores if ranking is None else ranking
+    top = sharded_top_k(ranking, candidate_pool_size(top_n, diversity), search_workers)
+    picks = top[diversity_picks(user_ids[top], ranking[top], cluster, top_n, diversity)]
+    matched_users = match_profiles(user_ids[picks], scores[picks], cluster,
+                                   ranking[picks] if ranking is not scores else None)
+    explain_matches(matched_users, x)
+    cursor = (MatchCursor(user_ids, scores, cluster, x, exclude=user_ids[picks],
+                          ranking=ranking if ranking is not scores else None) if with_cursor else None)
+    return matched_users, cursor
+
+@pinned_bundle
+def match_details(user_ids, scores, cluster, x=None, hybrid_scores=None):
+    """Display profiles (and explanations, given the user's feature vector) of matches kept as ids and scores"""
+    matched_users = match_profiles(user_ids, scores, cluster, hybrid_scores)
+    if x is not None:
+        explain_matches(matched_users, np.asarray(x, dtype=np.float64))
+    return matched_users
+
+def more_matches(cursor, n=5):
+    """Next page of matches from a cursor returned with with_cursor=True (empty once exhausted)"""
+    user_ids, scores, ranking = cursor.next_page(n, with_ranking=True)
+    return match_details(user_ids, scores, cursor.cluster, cursor.x, ranking)
+
+def load_bundle(directory='.', chunksize=DEFAULT_CHUNKSIZE, version=None):
+    """Load the classifier, encoders and cluster table of one model version (streamed in chunks)
+    
+    directory holds new_user_classifier.pkl, label_encoders.pkl and the cluster table, as the
+    repo root or an artifacts/vNNNN directory written by recluster.py. Profiles come from the
+    directory if it has its own user_profiles.csv, else from the working directory.
+    """
+    # Load classifier model
+    with open(os.path.join(directory, 'new_user_classifier.pkl'), 'rb') as file:
+        loaded_model = pickle.load(file)
+    
+    # Load label encoders
+    with open(os.path.join(directory, 'label_encoders.pkl'), 'rb') as file:
+        encoders = pickle.load(file)
+    
+    # Stream cluster data, encoding each chunk into per-cluster arrays
+    cluster_arrays, feature_columns, cluster_template = stream_cluster_arrays(
+        encoders, os.path.join(directory, CLUSTERS_CSV), chunksize
+    )
+    
+    # Load only the profile fields shown for matches, and only for clustered users
+    keep_ids = np.concatenate([block.user_ids for block in cluster_arrays.values()])
+    profiles_path = os.path.join(directory, PROFILES_CSV)
+    profiles_path = profiles_path if os.path.exists(profiles_path) else PROFILES_CSV
+    df_user_profiles = stream_profiles(profiles_path, keep_ids=keep_ids, chunksize=chunksize)
+    hobbies = load_hobby_index(profiles_path, keep_ids, chunksize)
+    
+    # Precomputed neighbour graph is optional (python neighbour_graph.py build)
+    graph_path = os.path.join(directory, NEIGHBOUR_GRAPH_PATH)
+    graph = None
+    if os.path.exists(graph_path):
+        graph = NeighbourGraph.load(graph_path)
+    else:
+        print(f"[INFO] {graph_path} not found, reciprocal match checks disabled")
+    
+    bundle = ModelBundle(version or os.path.basename(os.path.abspath(directory)), loaded_model, encoders,
+                         cluster_template, cluster_arrays, feature_columns, df_user_profiles, graph, hobbies)
+    with pinned(bundle):
+        get_kernel()
+    print(f"[OK] Loaded {len(keep_ids)} users in {len(cluster_arrays)} clusters "
+          f"(peak RSS {peak_rss_mb():.1f} MB)")
+    return bundle
+
+def load_matching_data(chunksize=DEFAULT_CHUNKSIZE, reload=False):
+    """Load all required data for matching engine (streamed in chunks)
+    
+    Once a bundle is active this is a no-op unless reload=True, so a new session
+    never replaces a model promoted by model_refresh.
+    """
+    global active
+    if active is not None and not reload:
+        return True
+    try:
+        active = load_bundle('.', chunksize, version='base')
+        return True
+    except Exception as e:
+        print(f"[ERROR] Failed to load matching data: {e}")
+        return False
+
+def pre_processing(user_temp, n_jobs=1, compiled=None, with_report=False):
+    """Preprocess user data - encode categorical features (from notebook)
+
+    All categorical columns are encoded in one pass with the compiled encoders
+    (the current bundle's unless given; no copy of the input frame); unseen
+    categories fall back to 0 and are reported once. n_jobs > 1 splits large
+    tables across a process pool. with_report=True returns (frame, UnknownReport).
+    """
+    compiled = compiled if compiled is not None else current_bundle().compiled_encoders
+    cluster_df, unknown_report = encode_frame(user_temp, compiled, n_jobs)
+    
+    if unknown_report.total:
+        print(f"[WARNING] {unknown_report.total} unknown categories mapped to 0: {unknown_report.summary()}")
+    
+    if cluster_df.shape[0] == 1:
+        cluster_df.drop(['user_id', 'Class Name'], axis=1, inplace=True, errors='ignore')
+    else:
+        cluster_df.set_index('user_id', inplace=True)
+    
+    return (cluster_df, unknown_report) if with_report else cluster_df
+
+def build_new_user_row(user_profile, entry_hall_answers, door2_answers):
+    """Build a new user row matching the exact structure of user_clusters_6_clusters.csv"""
+    
+    # Start with a row from the CSV to get the exact structure
+    template_row = current_bundle().cluster_template.copy()
+    
+    # Update with new user data
+    template_row['user_id'] = 9999
+    
+    # Categorical features
+    template_row['gender'] = user_profile.get('gender', 'Other')
+    template_row['education_level'] = user_profile.get('education_level', 'Undergraduate')
+    template_row['occupation_status'] = user_profile.get('occupation_status', 'Employed')
+    template_row['diet_type'] = user_profile.get('diet_type', 'Balanced')
+    template_row['stress_level'] = user_profile.get('stress_level', 'Medium')
+    template_row['has_mental_health_condition'] = user_profile.get('has_mental_health_condition', 0)
+    template_row['mental_health_condition'] = user_profile.get('mental_health_condition', 'Not Applicable')
+    template_row['relationship_status'] = user_profile.get('relationship_status', 'Single')
+    
+    # Door 2 answers (answer_code_56 to answer_code_80)
+    for i in range(25):
+        answer_key = f'q_{i}'
+        if answer_key in door2_answers:
+            template_row[f'answer_code_{56 + i}'] = int(door2_answers[answer_key])
+        else:
+            template_row[f'answer_code_{56 + i}'] = 3
+    
+    # Matching score
+    door2_codes = [template_row[f'answer_code_{56 + i}'].values[0] for i in range(25)]
+    template_row['matching_score'] = round(sum(door2_codes) / len(door2_codes), 2)
+    
+    # Entry Hall answers (entry_hall_answer_code_1 to entry_hall_answer_code_15)
+    for i in range(15):
+        answer_key = f'q_{i}'
+        if answer_key in entry_hall_answers:
+            template_row[f'entry_hall_answer_code_{i + 1}'] = int(entry_hall_answers[answer_key])
+        else:
+            template_row[f'entry_hall_answer_code_{i + 1}'] = 3
+    
+    # Entry Hall subscores
+    template_row['entry_hall_pulse_score'] = user_profile.get('pulse_score', 3.0)
+    template_row['entry_hall_mood_index'] = user_profile.get('mood_index', 3.0)
+    template_row['entry_hall_energy_index'] = user_profile.get('energy_index', 3.0)
+    template_row['entry_hall_social_index'] = user_profile.get('social_index', 3.0)
+    template_row['entry_hall_security_index'] = user_profile.get('security_index', 3.0)
+    
+    # Group features
+    template_row['age_groups'] = user_profile.get('age_groups', '25-34')  # regular hyphen
+    template_row['work_hours_groups'] = user_profile.get('work_hours_groups', '31–40 hrs')
+    template_row['sleep_hours_groups'] = user_profile.get('sleep_hours_groups', '6–8 hrs')
+    template_row['physical_activity_groups'] = user_profile.get('physical_activity_groups', 'Moderate (4–5)')
+    template_row['screen_time_groups'] = user_profile.get('screen_time_groups', '4–6 hrs')
+    template_row['friends_groups'] = user_profile.get('friends_groups', '3–4')
+    
+    # Class Name will be predicted
+    template_row['Class Name'] = -1
+    
+    return template_row
+
+def filtered_rows(filters):
+    """Row positions per cluster that pass the attribute filters, or None when nothing is filtered"""
+    filters = match_filters if filters is None else filters
+    if not filters:
+        return None
+    bundle = current_bundle()
+    predicates = filter_codes(filters, bundle.encoders, bundle.df_user_profiles)
+    return {cluster: index.select(predicates) for cluster, index in bundle.attribute_indexes.items()}
+
+@pinned_bundle
+def get_user_matches(user_profile, entry_hall_answers, door2_answers, top_n=5, search_mode='single',
+                     probability_mass=DEFAULT_PROBABILITY_MASS, candidate_budget=DEFAULT_CANDIDATE_BUDGET,
+                     filters=None, diversity=None, kernel=None, with_cursor=False):
+    """Main function to get user matches (simplified from notebook)
+    
+    search_mode='single' searches the predicted cluster only; 'multi_cluster'
+    searches the most likely clusters covering probability_mass, scoring at
+    most candidate_budget users in total. filters restricts candidates by
+    attribute (defaults to match_filters). diversity > 0 re-ranks a larger
+    candidate pool for variety among the matches (defaults to match_diversity).
+    kernel names the similarity kernel (defaults to similarity_kernel).
+    In single mode, user_profile['hobbies'] are blended into the ranking (hobby_weight);
+    each match's similarity_score stays the kernel score, its hybrid_score is the blend.
+    
+    with_cursor=True returns (matches, cluster, cursor), where the MatchCursor
+    pages through the remaining candidates without rescoring (None in
+    multi_cluster mode).
+    """
+    failed = (None, None, None) if with_cursor else (None, None)
+    bundle = current_bundle()
+    try:
+        print("\n=== Starting User Matching ===")
+        
+        # Build new user row
+        new_user_row = build_new_user_row(user_profile, entry_hall_answers, door2_answers)
+        print(f"Built new user row with shape: {new_user_row.shape}")
+        
+        # Debug: Check for NaN in original row
+        nan_cols = new_user_row.columns[new_user_row.isna().any()].tolist()
+        if nan_cols:
+            print(f"[WARNING] NaN found in columns before preprocessing: {nan_cols}")
+            for col in nan_cols:
+                print(f"  {col}: {new_user_row[col].values[0]}")
+        
+        # Preprocess
+        X_new, unknown_report = pre_processing(new_user_row, with_report=True)
+        print(f"Preprocessed shape: {X_new.shape}")
+        
+        # Check for NaN after preprocessing
+        if X_new.isna().any().any():
+            nan_cols_after = X_new.columns[X_new.isna().any()].tolist()
+            print(f"[ERROR] NaN still present after preprocessing in: {nan_cols_after}")
+            for col in nan_cols_after:
+                print(f"  {col}: {X_new[col].values[0]}")
+        else:
+            print("[OK] No NaN values in preprocessed data")
+        
+        x = X_new.to_numpy(dtype=np.float64)[0]
+        if drift_observer is not None:
+            drift_observer(bundle, x, unknown_report)
+        
+        rows_by_cluster = filtered_rows(filters)
+        
+        if search_mode == 'multi_cluster':
+            result = multi_cluster_matches(X_new, top_n, probability_mass, candidate_budget,
+                                           candidate_rows=rows_by_cluster, diversity=diversity, kernel=kernel)
+            return result + (None,) if with_cursor else result
+        
+        # Predict cluster
+        predicted_cluster = bundle.loaded_model.predict(X_new)[0]
+        print(f"[OK] Predicted cluster: {predicted_cluster}")
+        
+        # Get users in same cluster
+        block = bundle.cluster_arrays.get(int(predicted_cluster))
+        
+        if block is None or len(block.user_ids) == 0:
+            print("[WARNING] No users in this cluster")
+            return failed
+        
+        print(f"[OK] Found {len(block.user_ids)} users in cluster {predicted_cluster}")
+        
+        rows = None
+        if rows_by_cluster is not None:
+            # Only the rows that survived the bitmap filters are scored
+            rows = rows_by_cluster[int(predicted_cluster)]
+            if len(rows) == 0:
+                print("[WARNING] No users in this cluster match the filters")
+                return failed
+            print(f"[OK] {len(rows)} users pass the filters")
+        
+        # Find similar users
+        diversity = match_diversity if diversity is None else diversity
+        user_ids, scores = kernel_scores(kernel, int(predicted_cluster), x, rows)
+        ranking = hobby_ranking(scores, predicted_cluster, user_profile.get('hobbies'), rows)
+        
+        # Get full profiles
+        matched_users, cursor = select_matches(user_ids, scores, predicted_cluster, x, top_n, diversity,
+                                               with_cursor, ranking)
+        
+        print(f"[SUCCESS] Found {len(matched_users)} matches")
+        if shadow_observer is not None:
+            shadow_observer(bundle, X_new, int(predicted_cluster))
+        
+        return (matched_users, predicted_cluster, cursor) if with_cursor else (matched_users, predicted_cluster)
+        
+    except Exception as e:
+        print(f"[ERROR] Matching failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return failed
+
+def match_profiles(user_ids, similarity_scores, predicted_cluster, hybrid_scores=None):
+    """Attach display profile fields to matched user ids (and the hybrid scores they were ranked by)"""
+    profiles = current_bundle().df_user_profiles
+    matched_users = []
+    if hybrid_scores is None:
+        hybrid_scores = [None] * len(user_ids)
+    for user_id, similarity_score, hybrid_score in zip(user_ids, similarity_scores, hybrid_scores):
+        if user_id in profiles.index:
+            user_dict = profiles.loc[user_id].to_dict()
+            user_dict['user_id'] = user_id
+            user_dict['similarity_score'] = similarity_score
+            if hybrid_score is not None:
+                user_dict['hybrid_score'] = hybrid_score
+                # The Jaccard overlap the blend added, so the page can say why the ranking differs
+                if hobby_weight:
+                    overlap = (hybrid_score - (1.0 - hobby_weight) * similarity_score) / hobby_weight
+                    user_dict['hobby_overlap'] = max(0.0, overlap)
+            user_dict['cluster'] = predicted_cluster
+            # Set by explain_matches, which has the cosine the neighbour graph is scored in
+            user_dict['reciprocal'] = None
+            matched_users.append(user_dict)
+    return matched_users
+
+def candidate_pool_size(top_n, diversity):
+    """How many candidates to take before re-ranking"""
+    return max(top_n, DIVERSITY_POOL_SIZE) if diversity else top_n
+
+def diversity_picks(user_ids, scores, clusters, top_n, diversity):
+    """Positions of the top_n candidates of a pool (sorted best first) to show, in order
+    
+    clusters is the cluster of every candidate, or one cluster for all of them.
+    With diversity 0 this is just the first top_n; otherwise maximal marginal relevance.
+    """
+    user_ids = np.asarray(user_ids)
+    if not diversity or len(user_ids) <= 1:
+        return np.arange(min(top_n, len(user_ids)))
+    
+    bundle = current_bundle()
+    clusters = np.broadcast_to(np.asarray(clusters), user_ids.shape)
+    Z = np.empty((len(user_ids), len(bundle.feature_columns)), dtype=np.float32)
+    for cluster in np.unique(clusters):
+        in_cluster = np.flatnonzero(clusters == cluster)
+        rows = bundle.cluster_row_index[int(cluster)].get_indexer(user_ids[in_cluster])
+        Z[in_cluster] = normalized_rows(bundle.cluster_arrays[int(cluster)].features[rows],
+                                        bundle.cluster_norms[int(cluster)][rows])
+    return mmr_select(np.asarray(scores, dtype=np.float64), Z, top_n, diversity)
+
+def explain_matches(matched_users, x):
+    """Attach per-group contributions to the cosine similarity of each match (match['explanation'])
+    
+    The decomposition is always of cosine, also under other kernels; shares are taken of its
+    'cosine' total, not of the match's similarity_score. The same cosine decides
+    match['reciprocal'] against the neighbour graph, whose scores are cosine too.
+    
+    Uses the matches' cluster rows and precomputed norms, so this is one small
+    (k, n_features) pass however large the cluster is.
+    """
+    bundle = current_bundle()
+    for cluster in {match['cluster'] for match in matched_users}:
+        cluster_matches = [match for match in matched_users if match['cluster'] == cluster]
+        block = bundle.cluster_arrays[int(cluster)]
+        rows = bundle.cluster_row_index[int(cluster)].get_indexer([match['user_id'] for match in cluster_matches])
+        explanations = explain(x, block.features[rows], bundle.cluster_norms[int(cluster)][rows],
+                               bundle.feature_columns)
+        for match, explanation in zip(cluster_matches, explanations):
+            match['explanation'] = explanation
+            # Mutual if the new user would also be in this user's precomputed top-K
+            if bundle.neighbour_graph is not None:
+                match['reciprocal'] = bundle.neighbour_graph.would_reciprocate(match['user_id'], explanation['cosine'])
+    return matched_users
+
+@pinned_bundle
+def people_similar_to_matches(matched_users, limit=5):
+    """Existing users closest to the given matches, from the neighbour graph"""
+    graph = current_bundle().neighbour_graph
+    if graph is None or not matched_users:
+        return []
+    match_ids = [int(match['user_id']) for match in matched_users]
+    similar = graph.similar_to(match_ids, limit)
+    # Neighbours share a cluster with the match they came from, not necessarily with the new user
+    row_index = current_bundle().cluster_row_index
+    return [profile for user_id, score in similar
+            for profile in match_profiles([user_id], [score],
+                                          next((c for c, index in row_index.items() if user_id in index), None))]
+
+@pinned_bundle
+def multi_cluster_matches(X_new, top_n=5, probability_mass=DEFAULT_PROBABILITY_MASS,
+                          candidate_budget=DEFAULT_CANDIDATE_BUDGET, precomputed=None, candidate_rows=None,
+                          diversity=None, kernel=None):
+    """Top-k merged across the most likely clusters of a preprocessed user row"""
+    bundle = current_bundle()
+    probabilities = cluster_probabilities(bundle.loaded_model, X_new)
+    cluster_sizes = {cluster: len(block.user_ids) for cluster, block in bundle.cluster_arrays.items()}
+    if candidate_rows is not None:
+        cluster_sizes = {cluster: len(rows) for cluster, rows in candidate_rows.items()}
+    plan = plan_clusters(probabilities, cluster_sizes, top_n, probability_mass, DEFAULT_MAX_CLUSTERS)
+    
+    if not plan:
+        print("[WARNING] No users in the likely clusters")
+        return None, None
+    
+    print(f"[OK] Searching clusters {[(c, round(p, 3)) for c, p in plan]}")
+    x = np.asarray(X_new, dtype=np.float64).reshape(-1)
+    diversity = match_diversity if diversity is None else diversity
+    kernel, kernel_states = get_kernel(kernel)
+    top = search_clusters(x, plan, bundle.cluster_arrays, bundle.cluster_norms, candidate_pool_size(top_n, diversity),
+                          candidate_budget, precomputed, candidate_rows, kernel, kernel_states)
+    if diversity and top:
+        scores, user_ids, clusters = (np.array(column) for column in zip(*top))
+        top = [top[i] for i in diversity_picks(user_ids, scores, clusters, top_n, diversity)]
+    
+    # Each match keeps the cluster it was found in; the most likely one is reported as the user's
+    matched_users = []
+    for score, user_id, cluster in top:
+        matched_users.extend(match_profiles([user_id], [score], cluster))
+    explain_matches(matched_users, x)
+    print(f"[SUCCESS] Found {len(matched_users)} matches across {len(plan)} clusters")
+    
+    return matched_users, plan[0][0]
+
+@pinned_bundle
+def batch_match_cohort(cohort_df, top_n=5, inbound_cap=DEFAULT_INBOUND_CAP, pool_size=DEFAULT_POOL_SIZE):
+    """Capacity-constrained matches for a whole cohort in cluster-table format
+    
+    Each cohort user is predicted into a cluster and matched against that cluster
+    with no candidate receiving more than inbound_cap matches. Returns
+    ({user_id: [(match user_id, score), ...]}, AssignmentStats).
+    """
+    bundle = current_bundle()
+    X = pre_processing(cohort_df)
+    X = X[bundle.feature_columns]
+    predicted = bundle.loaded_model.predict(X)
+    features = X.to_numpy(dtype=np.float64)
+    cohort_ids = X.index.to_numpy()
+    
+    matches = {}
+    stats_list = []
+    for cluster in np.unique(predicted):
+        block = bundle.cluster_arrays.get(int(cluster))
+        if block is None:
+            continue
+        rows = predicted == cluster
+        cluster_matches, stats = assign_cluster(features[rows], cohort_ids[rows], block,
+                                                bundle.cluster_norms[int(cluster)], top_n, inbound_cap, pool_size)
+        matches.update(cluster_matches)
+        stats_list.append(stats)
+    
+    stats = merge_stats(stats_list)
+    if stats is not None:
+        print(f"[OK] {format_stats(stats)}")
+    return matches, stats
+
+@pinned_bundle
+def start_incremental_match(user_profile, entry_hall_answers):
+    """Precompute similarity accumulators for a user entering Door 2
+    
+    The provisional cluster is predicted with every Door 2 answer at its default;
+    finish_incremental_match re-predicts with the real answers. The matcher keeps
+    the bundle it was built on, so a promotion during Door 2 does not mix models.
+    """
+    bundle = current_bundle()
+    new_user_row = build_new_user_row(user_profile, entry_hall_answers, {})
+    X_new, unknown_report = pre_processing(new_user_row, with_report=True)
+    provisional_cluster = int(bundle.loaded_model.predict(X_new)[0])
+    
+    matcher = IncrementalMatcher(
+        X_new.to_numpy(dtype=np.float64)[0], bundle.feature_columns, provisional_cluster,
+        bundle.cluster_arrays.get(provisional_cluster), bundle.cluster_norms.get(provisional_cluster)
+    )
+    matcher.bundle = bundle
+    matcher.unknown_report = unknown_report    # the profile's unseen categories, for drift_observer
+    matcher.hobbies = user_profile.get('hobbies')
+    return matcher
+
+def finish_incremental_match(matcher, top_n=5, search_mode='single', filters=None, diversity=None,
+                             kernel=None, with_cursor=False):
+    """Final top-k from a matcher whose Door 2 answers have all been recorded
+    
+    The accumulators hold cosine dot products; any other kernel scores the final vector afresh.
+    with_cursor behaves as in get_user_matches.
+    """
+    with pinned(getattr(matcher, 'bundle', None)):
+        return _finish_incremental_match(matcher, top_n, search_mode, filters, diversity, kernel, with_cursor)
+
+def _finish_incremental_match(matcher, top_n, search_mode, filters, diversity, kernel, with_cursor):
+    failed = (None, None, None) if with_cursor else (None, None)
+    bundle = current_bundle()
+    try:
+        X_new = pd.DataFrame([matcher.final_vector()], columns=bundle.feature_columns)
+        if drift_observer is not None:
+            drift_observer(bundle, matcher.final_vector(), getattr(matcher, 'unknown_report', None))
+        rows_by_cluster = filtered_rows(filters)
+        
+        kernel = similarity_kernel if kernel is None else kernel
+        accumulated = kernel == 'cosine' and matcher.dot is not None
+        
+        if search_mode == 'multi_cluster':
+            # The accumulated cluster is reused as is, the other likely clusters are scored now
+            precomputed = {matcher.cluster: matcher.scores()} if accumulated else None
+            result = multi_cluster_matches(X_new, top_n, precomputed=precomputed, candidate_rows=rows_by_cluster,
+                                           diversity=diversity, kernel=kernel)
+            return result + (None,) if with_cursor else result
+        
+        predicted_cluster = int(bundle.loaded_model.predict(X_new)[0])
+        
+        if predicted_cluster != matcher.cluster:
+            print(f"[INFO] Cluster changed from {matcher.cluster} to {predicted_cluster} during Door 2, rescoring")
+            matcher.retarget(predicted_cluster, bundle.cluster_arrays.get(predicted_cluster),
+                             bundle.cluster_norms.get(predicted_cluster))
+        
+        rows = rows_by_cluster.get(predicted_cluster) if rows_by_cluster is not None else None
+        diversity = match_diversity if diversity is None else diversity
+        x = matcher.final_vector()
+        user_ids, scores = None, None
+        if kernel == 'cosine' and matcher.dot is not None:
+            user_ids, scores = matcher.block.user_ids, matcher.scores()
+            if rows is not None:
+                user_ids, scores = user_ids[rows], scores[rows]
+        elif kernel != 'cosine' and predicted_cluster in bundle.cluster_arrays:
+            user_ids, scores = kernel_scores(kernel, predicted_cluster, x, rows)
+        if user_ids is None or len(user_ids) == 0:
+            print("[WARNING] No users in this cluster" + (" match the filters" if rows is not None else ""))
+            return failed
+        ranking = hobby_ranking(scores, predicted_cluster, getattr(matcher, 'hobbies', None), rows)
+        
+        matched_users, cursor = select_matches(user_ids, scores, predicted_cluster, x, top_n, diversity,
+                                               with_cursor, ranking)
+        print(f"[SUCCESS] Found {len(matched_users)} matches (incremental)")
+        if shadow_observer is not None:
+            shadow_observer(bundle, X_new, predicted_cluster)
+        
+        return (matched_users, predicted_cluster, cursor) if with_cursor else (matched_users, predicted_cluster)
+    
+    except Exception as e:
+        print(f"[ERROR] Incremental matching failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return failed
+
+@pinned_bundle
+def representative_matches(x, cluster, top_n=5):
+    """Matches among a cluster's precomputed representative users, ranked by cosine to x
+    
+    The cheap answer served when admission control sheds a request: a few dozen
+    dot products instead of a pass over the whole cluster.
+    """
+    bundle = current_bundle()
+    cluster = int(cluster)
+    rows = bundle.medoid_rows.get(cluster)
+    if rows is None or len(rows) == 0:
+        return None, None
+    x = np.asarray(x, dtype=np.float64)
+    block = bundle.cluster_arrays[cluster]
+    scores = cosine_scores(block.features[rows], bundle.cluster_norms[cluster][rows], x)
+    top = top_k_indices(scores, top_n)
+    matched_users = explain_matches(match_profiles(block.user_ids[rows[top]], scores[top], cluster), x)
+    print(f"[OK] {len(matched_users)} representative matches from cluster {cluster} (degraded)")
+    return matched_users, cluster
+
+def degraded_matches(user_profile, entry_hall_answers, door2_answers, matcher=None, top_n=5):
+    """(matches, cluster, x) from the representative users of the user's cluster
+    
+    With a Door 2 matcher its final vector and cluster are reused; otherwise the
+    row is built and the cluster predicted, but no cluster is scored.
+    """
+    try:
+        if matcher is not None:
+            x = matcher.final_vector()
+            with pinned(getattr(matcher, 'bundle', None)):
+                return representative_matches(x, matcher.cluster, top_n) + (x,)
+        with pinned() as bundle:
+            X_new = pre_processing(build_new_user_row(user_profile, entry_hall_answers, door2_answers))
+            x = X_new.to_numpy(dtype=np.float64)[0]
+            return representative_matches(x, bundle.loaded_model.predict(X_new)[0], top_n) + (x,)
+    except Exception as e:
+        print(f"[ERROR] Degraded matching failed: {e}")
+        return None, None, None
+
+def format_match_profile(match_dict):
+    """Format a match dictionary for display"""
+    return {
+        'user_id': int(match_dict['user_id']),
+        'first_name': match_dict.get('first_name', 'Anonymous'),
+        'last_name': match_dict.get('last_name', 'User'),
+        'age': match_dict.get('age', 25),
+        'gender': match_dict.get('gender', 'Other'),
+        'education_level': match_dict.get('education_level', 'Undergraduate'),
+        'occupation_status': match_dict.get('occupation_status', 'Employed'),
+        'relationship_status': match_dict.get('relationship_status', 'Single'),
+        'similarity_score': match_dict.get('similarity_score', 0.0),
+        # The score the match was ranked by: the hobby blend when there was one, else the similarity
+        'match_score': match_dict.get('hybrid_score', match_dict.get('similarity_score', 0.0)),
+        'hobby_overlap': match_dict.get('hobby_overlap'),
+        'cluster': match_dict.get('cluster', 0)
+    }
+
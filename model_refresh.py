@@ -0,0 +1,269 @@
+"""
+Background model refresh: shadow evaluation and atomic promotion.
+
+A candidate model version, an artifacts/vNNNN directory written by
+recluster.py, is loaded into a ModelBundle on a background thread while the
+active bundle keeps serving. Once it is loaded, a sampled fraction of live
+single-cluster match requests is mirrored to it. After computing the live
+matches, matching_engine calls shadow_observer. observe() only draws a random
+number and, for a sampled request, puts (live bundle, encoded row, live
+cluster) on a bounded queue. A worker thread then scores the row against both
+bundles and records
+
+    same_cluster    the candidate's classifier predicts the live cluster
+    overlap         |live top-k & candidate top-k| / k, plain cosine top-k
+                    without filters or re-ranking on both sides
+
+No request waits on the candidate; when the queue is full the sample is
+dropped and counted. promote() replaces the engine's active bundle reference
+in one assignment. Requests already running finish on the bundle they pinned
+and new requests get the candidate. With `promote_after` set, the worker
+promotes on its own once that many samples meet the agreement thresholds.
+
+Shadow rows are encoded by the live bundle, so a candidate must share its
+label encoders (recluster.py copies them into every version).
+
+In the app, set VITA_NOVA_CANDIDATE_MODEL=artifacts/v0002 (optionally
+VITA_NOVA_SHADOW_RATE and VITA_NOVA_PROMOTE_AFTER). Run
+`python model_refresh.py artifacts/v0002` to shadow a candidate on synthetic
+requests, then promote it under concurrent load.
+"""
+
+import argparse
+import os
+import queue
+import random
+import threading
+import time
+
+import numpy as np
+
+import matching_engine
+from cluster_search import top_k_indices
+
+DEFAULT_SAMPLE_RATE = 0.1
+DEFAULT_TOP_K = 5
+DEFAULT_QUEUE_SIZE = 256
+DEFAULT_MIN_SAME_CLUSTER = 0.9
+DEFAULT_MIN_OVERLAP = 0.6
+
+
+class ShadowEvaluator:
+    """Loads a candidate bundle in the background, shadows live requests on it and promotes it"""
+
+    def __init__(self, sample_rate=DEFAULT_SAMPLE_RATE, top_k=DEFAULT_TOP_K, queue_size=DEFAULT_QUEUE_SIZE,
+                 promote_after=None, min_same_cluster=DEFAULT_MIN_SAME_CLUSTER, min_overlap=DEFAULT_MIN_OVERLAP,
+                 seed=None):
+        self.sample_rate = sample_rate
+        self.top_k = top_k
+        self.promote_after = promote_after
+        self.min_same_cluster = min_same_cluster
+        self.min_overlap = min_overlap
+        self.candidate = None
+        self.status = 'idle'        # loading -> shadowing -> promoted, or failed
+        self.samples = 0
+        self.same_cluster = 0
+        self.overlap_sum = 0.0
+        self.dropped = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """The evaluator configured by VITA_NOVA_CANDIDATE_MODEL, loading in the background, or None"""
+        directory = os.environ.get('VITA_NOVA_CANDIDATE_MODEL')
+        if not directory:
+            return None
+        promote_after = os.environ.get('VITA_NOVA_PROMOTE_AFTER')
+        evaluator = cls(sample_rate=float(os.environ.get('VITA_NOVA_SHADOW_RATE', DEFAULT_SAMPLE_RATE)),
+                        promote_after=int(promote_after) if promote_after else None)
+        evaluator.load_candidate(directory)
+        return evaluator
+
+    def load_candidate(self, directory, chunksize=matching_engine.DEFAULT_CHUNKSIZE):
+        """Start loading a candidate version on a background thread; returns the thread"""
+        self.status = 'loading'
+        thread = threading.Thread(target=self._load, args=(directory, chunksize), name='model-refresh-load',
+                                  daemon=True)
+        thread.start()
+        return thread
+
+    def _load(self, directory, chunksize):
+        try:
+            candidate = matching_engine.load_bundle(directory, chunksize)
+        except Exception as e:
+            self.status = 'failed'
+            print(f"[ERROR] Could not load candidate model from {directory}: {e}")
+            return
+        live = matching_engine.active
+        if live is not None and live.encoders != candidate.encoders:
+            print(f"[WARNING] Candidate {candidate.version} has different label encoders; "
+                  f"shadow rows are encoded by the live model")
+        self.candidate = candidate
+        self.status = 'shadowing'
+        threading.Thread(target=self._work, name='model-refresh-shadow', daemon=True).start()
+        matching_engine.shadow_observer = self.observe
+        print(f"[OK] Shadowing candidate model {candidate.version} on {self.sample_rate:.0%} of match requests")
+
+    # Request path --------------------------------------------------------------
+
+    def observe(self, bundle, X_new, cluster):
+        """Called by the engine after each single-cluster match; never blocks"""
+        if self.status != 'shadowing' or bundle is self.candidate or self._random.random() >= self.sample_rate:
+            return
+        try:
+            self._queue.put_nowait((bundle, X_new, cluster))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    # Shadow worker -------------------------------------------------------------
+
+    def _top_ids(self, bundle, cluster, x):
+        with matching_engine.pinned(bundle):
+            if cluster not in bundle.cluster_arrays:
+                return np.empty(0, dtype=np.int32)
+            user_ids, scores = matching_engine.kernel_scores('cosine', cluster, x)
+            return user_ids[top_k_indices(scores, self.top_k)]
+
+    def compare(self, live, X_new, live_cluster):
+        """(same cluster, top-k overlap) of the live and candidate models for one encoded row"""
+        candidate = self.candidate
+        X_candidate = X_new[candidate.feature_columns]
+        candidate_cluster = int(candidate.loaded_model.predict(X_candidate)[0])
+        live_ids = self._top_ids(live, live_cluster, X_new.to_numpy(dtype=np.float64)[0])
+        candidate_ids = self._top_ids(candidate, candidate_cluster, X_candidate.to_numpy(dtype=np.float64)[0])
+        overlap = len(np.intersect1d(live_ids, candidate_ids)) / max(len(live_ids), 1)
+        return candidate_cluster == live_cluster, overlap
+
+    def _work(self):
+        while self.status == 'shadowing':
+            try:
+                live, X_new, live_cluster = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            try:
+                same, overlap = self.compare(live, X_new, live_cluster)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                print(f"[WARNING] Shadow evaluation failed: {e}")
+                continue
+            finally:
+                self._queue.task_done()
+            with self._lock:
+                self.samples += 1
+                self.same_cluster += same
+                self.overlap_sum += overlap
+            if self.promote_after and self.samples >= self.promote_after:
+                metrics = self.agreement()
+                if metrics['same_cluster'] >= self.min_same_cluster and metrics['overlap'] >= self.min_overlap:
+                    self.promote()
+                else:
+                    print(f"[WARNING] Candidate {self.candidate.version} not promoted: {self.format_agreement()}")
+                    self.stop()
+
+    def drain(self):
+        """Wait until every queued sample has been compared"""
+        self._queue.join()
+
+    def agreement(self):
+        with self._lock:
+            n = self.samples
+            return {'samples': n, 'same_cluster': self.same_cluster / n if n else float('nan'),
+                    'overlap': self.overlap_sum / n if n else float('nan'), 'dropped': self.dropped,
+                    'errors': self.errors}
+
+    def format_agreement(self):
+        metrics = self.agreement()
+        return (f"{metrics['samples']} samples, same cluster {metrics['same_cluster']:.1%}, "
+                f"top-{self.top_k} overlap {metrics['overlap']:.1%}, {metrics['dropped']} dropped")
+
+    def promote(self):
+        """Swap the candidate in as the engine's active bundle"""
+        if self.candidate is None:
+            raise RuntimeError("No candidate model loaded")
+        self.stop()
+        print(f"[OK] Candidate agreement before promotion: {self.format_agreement()}")
+        matching_engine.promote_bundle(self.candidate)
+        self.status = 'promoted'
+
+    def stop(self):
+        """Stop shadowing (the candidate stays loaded until promoted or dropped)"""
+        if matching_engine.shadow_observer == self.observe:
+            matching_engine.shadow_observer = None
+        if self.status == 'shadowing':
+            self.status = 'idle'
+
+
+# ============================================================================
+# Simulation
+# ============================================================================
+
+def _random_request(rng):
+    profile = {'gender': rng.choice(['Male', 'Female']), 'age_groups': rng.choice(['18-24', '25-34', '35-44'])}
+    entry_hall = {f"q_{i}": int(rng.integers(1, 6)) for i in range(15)}
+    door2 = {f"q_{i}": int(rng.integers(1, 6)) for i in range(25)}
+    return profile, entry_hall, door2
+
+
+def simulate(directory, requests, threads):
+    import contextlib
+    import io
+
+    if not matching_engine.load_matching_data():
+        return
+    rng = np.random.default_rng(0)
+    workload = [_random_request(rng) for _ in range(requests)]
+
+    def run(batch):
+        errors, latencies = 0, []
+        for profile, entry_hall, door2 in batch:
+            start = time.perf_counter()
+            matches, _ = matching_engine.get_user_matches(profile, entry_hall, door2)
+            latencies.append((time.perf_counter() - start) * 1e3)
+            errors += matches is None
+        return errors, latencies
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, baseline = run(workload)
+
+    evaluator = ShadowEvaluator(sample_rate=1.0, seed=0)
+    evaluator.load_candidate(directory).join()
+    if evaluator.candidate is None:
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, shadowed = run(workload)
+    evaluator.drain()
+    print(f"{requests} requests, live p50 {np.median(baseline):.2f} ms without shadowing, "
+          f"{np.median(shadowed):.2f} ms with every request shadowed")
+    print(f"[OK] {evaluator.format_agreement()}")
+
+    # Promote while `threads` threads keep matching; no request may fail or mix models
+    results = []
+    workers = [threading.Thread(target=lambda b=workload[i::threads]: results.append(run(b)))
+               for i in range(threads)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for worker in workers:
+            worker.start()
+        time.sleep(0.05)
+        evaluator.promote()
+        for worker in workers:
+            worker.join()
+    print(f"[OK] Promoted {matching_engine.active.version} under load: "
+          f"{sum(errors for errors, _ in results)} failed requests out of {requests}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shadow-evaluate and promote a candidate model version")
+    parser.add_argument('candidate', nargs='?', help="artifact directory written by recluster.py")
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    if args.candidate:
+        simulate(args.candidate, args.requests, args.threads)
+    else:
+        parser.print_help()
@@ -0,0 +1,228 @@
+"""
+Precomputed top-K neighbour graph of the existing users.
+
+`python neighbour_graph.py build` scores every user of user_clusters_6_clusters.csv
+against the rest of their cluster with blocked matrix multiplication on
+row-normalized features (row blocks run on a thread pool - NumPy's matmul
+releases the GIL) and keeps each user's K best neighbours. Each row block is
+scored against the cluster one candidate tile at a time and merged into a
+running top-K, so a worker's memory is bounded by the tile, not by the
+cluster size; the build prints its peak RSS. The graph is stored CSR-style in
+one .npz file:
+
+    user_ids    int32  (n,)       sorted user ids, row i of the graph
+    indptr      int64  (n + 1,)   neighbours of row i are indptr[i]:indptr[i + 1]
+    neighbours  int32  (nnz,)     neighbour user ids, best first
+    scores      float32 (nnz,)    cosine similarity of each neighbour
+    k           int64  ()         K the graph was built with
+
+The app answers reciprocal-match checks and "people similar to your matches"
+from it in O(K) per user instead of scoring a whole cluster.
+"""
+
+import argparse
+import os
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from streaming_loader import CLUSTERS_CSV, stream_cluster_arrays, peak_rss_mb
+
+NEIGHBOUR_GRAPH_PATH = "user_neighbours.npz"
+DEFAULT_K = 20
+DEFAULT_BLOCK_SIZE = 2048          # query rows per worker task
+DEFAULT_CANDIDATE_BLOCK = 4096     # candidate columns per similarity tile (~100 MB per worker with the above)
+
+
+def _normalized(features):
+    """float32 rows scaled to unit length (zero rows stay zero)"""
+    norms = np.linalg.norm(features.astype(np.float64), axis=1)
+    norms[norms == 0] = 1.0
+    return (features / norms[:, None]).astype(np.float32)
+
+
+def _block_top_k(Z, start, stop, k, candidate_block=DEFAULT_CANDIDATE_BLOCK):
+    """Top-k neighbour positions and scores of rows start:stop against all of Z
+
+    Candidates are scored one (rows, candidate_block) tile at a time and merged
+    into a running per-row top-k, so a worker holds about
+    12 * (stop - start) * candidate_block bytes however large the cluster is.
+    """
+    rows = stop - start
+    k = min(k, Z.shape[0] - 1)
+    if k <= 0:
+        return np.empty((rows, 0), dtype=np.int64), np.empty((rows, 0), dtype=np.float32)
+    best_pos = np.full((rows, k), -1, dtype=np.int64)
+    best_scores = np.full((rows, k), -np.inf, dtype=np.float32)
+    queries = Z[start:stop]
+    for c0 in range(0, Z.shape[0], candidate_block):
+        c1 = min(c0 + candidate_block, Z.shape[0])
+        sims = queries @ Z[c0:c1].T
+        # A user is not their own neighbour
+        own = np.arange(max(start, c0), min(stop, c1))
+        sims[own - start, own - c0] = -np.inf
+        kk = min(k, c1 - c0)
+        # Largest kk of each row, partitioned to the end (no negated copy of the tile)
+        top = np.argpartition(sims, c1 - c0 - kk, axis=1)[:, -kk:]
+        pos = np.concatenate([best_pos, top + c0], axis=1)
+        scores = np.concatenate([best_scores, np.take_along_axis(sims, top, axis=1)], axis=1)
+        keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_pos = np.take_along_axis(pos, keep, axis=1)
+        best_scores = np.take_along_axis(scores, keep, axis=1)
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    return np.take_along_axis(best_pos, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+def cluster_neighbours(block, k=DEFAULT_K, block_size=DEFAULT_BLOCK_SIZE, n_jobs=None,
+                       candidate_block=DEFAULT_CANDIDATE_BLOCK):
+    """(neighbour user ids, scores), each (n, k'), for every user of one cluster block"""
+    Z = _normalized(block.features)
+    n = Z.shape[0]
+    starts = range(0, n, block_size)
+    with ThreadPoolExecutor(max_workers=n_jobs or os.cpu_count()) as pool:
+        parts = list(pool.map(lambda start: _block_top_k(Z, start, min(start + block_size, n), k,
+                                                            candidate_block), starts))
+    if not parts:
+        return np.empty((0, 0), dtype=np.int32), np.empty((0, 0), dtype=np.float32)
+    positions = np.concatenate([p for p, _ in parts])
+    scores = np.concatenate([s for _, s in parts])
+    return block.user_ids[positions], scores.astype(np.float32)
+
+
+def build_graph(cluster_arrays, k=DEFAULT_K, block_size=DEFAULT_BLOCK_SIZE, n_jobs=None,
+                candidate_block=DEFAULT_CANDIDATE_BLOCK):
+    """CSR arrays (user_ids, indptr, neighbours, scores) over all clusters"""
+    ids_parts, nbr_parts, score_parts, count_parts = [], [], [], []
+    for cluster, block in cluster_arrays.items():
+        neighbours, scores = cluster_neighbours(block, k, block_size, n_jobs, candidate_block)
+        ids_parts.append(block.user_ids)
+        nbr_parts.append(neighbours)
+        score_parts.append(scores)
+        count_parts.append(np.full(len(block.user_ids), neighbours.shape[1], dtype=np.int64))
+
+    user_ids = np.concatenate(ids_parts)
+    counts = np.concatenate(count_parts)
+    # Rows are stored sorted by user id so lookups are a binary search
+    order = np.argsort(user_ids, kind='stable')
+    row_starts = np.concatenate([[0], np.cumsum(counts)])[:-1]
+    flat_neighbours = np.concatenate([part.reshape(-1) for part in nbr_parts])
+    flat_scores = np.concatenate([part.reshape(-1) for part in score_parts])
+
+    indptr = np.zeros(len(user_ids) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum(counts[order])
+    # Source position of each output slot: its row's old start plus its offset within the row
+    take = np.arange(indptr[-1]) + np.repeat(row_starts[order] - indptr[:-1], counts[order])
+    return (user_ids[order].astype(np.int32), indptr,
+            flat_neighbours[take].astype(np.int32), flat_scores[take].astype(np.float32))
+
+
+def save_graph(path, user_ids, indptr, neighbours, scores, k=DEFAULT_K):
+    np.savez(path, user_ids=user_ids, indptr=indptr, neighbours=neighbours, scores=scores, k=k)
+
+
+class NeighbourGraph:
+    """Read-only view of a saved neighbour graph"""
+
+    def __init__(self, user_ids, indptr, neighbours, scores, k=None):
+        self.user_ids = user_ids
+        self.indptr = indptr
+        self.neighbour_ids = neighbours
+        self.scores = scores
+        # Graphs saved without k: the longest neighbour list
+        self.k = int(np.diff(indptr).max(initial=0)) if k is None else int(k)
+
+    @classmethod
+    def load(cls, path=NEIGHBOUR_GRAPH_PATH):
+        with np.load(path) as data:
+            k = data['k'] if 'k' in data.files else None
+            return cls(data['user_ids'], data['indptr'], data['neighbours'], data['scores'], k)
+
+    def _row(self, user_id):
+        row = np.searchsorted(self.user_ids, user_id)
+        if row < len(self.user_ids) and self.user_ids[row] == user_id:
+            return row
+        return None
+
+    def neighbours(self, user_id):
+        """(neighbour ids, scores) of an existing user, best first (empty if unknown)"""
+        row = self._row(user_id)
+        if row is None:
+            return self.neighbour_ids[:0], self.scores[:0]
+        start, stop = self.indptr[row], self.indptr[row + 1]
+        return self.neighbour_ids[start:stop], self.scores[start:stop]
+
+    def is_reciprocal(self, user_a, user_b):
+        """True if each of two existing users is in the other's top-K"""
+        return bool(np.isin(user_b, self.neighbours(user_a)[0]) and np.isin(user_a, self.neighbours(user_b)[0]))
+
+    def would_reciprocate(self, user_id, similarity_score):
+        """
+        True if someone scoring `similarity_score` against an existing user would
+        enter that user's top-K, i.e. the match is mutual. A list shorter than K
+        (a cluster of at most K users) takes anyone.
+        """
+        if self._row(user_id) is None:
+            return False
+        _, scores = self.neighbours(user_id)
+        if len(scores) < self.k:
+            return True
+        return bool(similarity_score >= scores[-1])
+
+    def similar_to(self, match_ids, limit=5, exclude=()):
+        """
+        Users most similar to a set of matches: neighbours of each match,
+        aggregated by their best score, excluding the matches themselves.
+        """
+        best = {}
+        skip = set(int(user_id) for user_id in match_ids) | set(int(user_id) for user_id in exclude)
+        for match_id in match_ids:
+            ids, scores = self.neighbours(match_id)
+            for user_id, score in zip(ids.tolist(), scores.tolist()):
+                if user_id not in skip and score > best.get(user_id, -np.inf):
+                    best[user_id] = score
+        return sorted(best.items(), key=lambda item: -item[1])[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Top-K neighbour graph of the existing users")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    build = sub.add_parser('build', help="build the graph from the cluster table")
+    build.add_argument('--k', type=int, default=DEFAULT_K)
+    build.add_argument('--block-size', type=int, default=DEFAULT_BLOCK_SIZE)
+    build.add_argument('--candidate-block', type=int, default=DEFAULT_CANDIDATE_BLOCK,
+                       help="candidate columns per similarity tile (memory per worker ~ 12 x block x this)")
+    build.add_argument('--jobs', type=int, default=None, help="worker threads (default: all cores)")
+    build.add_argument('--clusters', default=CLUSTERS_CSV)
+    build.add_argument('--out', default=NEIGHBOUR_GRAPH_PATH)
+
+    query = sub.add_parser('query', help="print the neighbours of a user")
+    query.add_argument('user_id', type=int)
+    query.add_argument('--graph', default=NEIGHBOUR_GRAPH_PATH)
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        with open('label_encoders.pkl', 'rb') as file:
+            encoders = pickle.load(file)
+        start = time.perf_counter()
+        cluster_arrays, _, _ = stream_cluster_arrays(encoders, args.clusters)
+        loaded = time.perf_counter()
+        graph = build_graph(cluster_arrays, args.k, args.block_size, args.jobs, args.candidate_block)
+        built = time.perf_counter()
+        save_graph(args.out, *graph, k=args.k)
+        size_mb = os.path.getsize(args.out) / 1e6
+        print(f"[OK] {len(graph[0])} users, {len(graph[2])} edges -> {args.out} ({size_mb:.1f} MB)")
+        print(f"     load {loaded - start:.2f} s, build {built - loaded:.2f} s, peak RSS {peak_rss_mb():.0f} MB")
+    else:
+        graph = NeighbourGraph.load(args.graph)
+        ids, scores = graph.neighbours(args.user_id)
+        for user_id, score in zip(ids, scores):
+            mutual = "mutual" if graph.is_reciprocal(args.user_id, user_id) else ""
+            print(f"{user_id:>10} {score:.4f} {mutual}")
+
+
+if __name__ == "__main__":
+    main()
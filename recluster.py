@@ -0,0 +1,321 @@
+"""
+Offline re-clustering and new-user classifier retraining.
+
+The `Class Name` labels of user_clusters_6_clusters.csv and new_user_classifier.pkl
+came from a notebook that is not in the repo. `python recluster.py train`
+regenerates both from the current cluster table, out of core:
+
+    1. stream the table in chunks, encoding each like pre_processing does, and
+       spill the float32 features to a scratch file (the only CSV parse pass
+       besides the final write); the MinMax scaler is fitted on the way
+    2. MiniBatchKMeans.partial_fit over shuffled mini-batches of the spilled
+       features for --epochs passes; its kernels run on all cores via OpenMP
+    3. assign every row a cluster; new cluster ids are mapped onto the previous
+       labels by largest overlap, so unchanged clusters keep their id
+    4. refit the same MinMaxScaler + SVC pipeline as new_user_classifier.pkl on
+       a stratified sample of at most --sample rows (SVC training is
+       superlinear, so its cost stays bounded as the population grows), and
+       score it on held-out rows
+    5. copy the table row by row with the new Class Name, leaving every other
+       field exactly as written
+
+Memory stays at one chunk plus the labels (one byte per row) and the
+classifier sample. Every run writes a new version directory that is never
+overwritten:
+
+    artifacts/v0003/
+        user_clusters_6_clusters.csv    the table with the new Class Name
+        new_user_classifier.pkl
+        label_encoders.pkl              copied, so a version is self-contained
+        manifest.json                   source checksum, parameters, metrics and timings
+
+Run `python recluster.py report` for wall time and peak memory at several
+table sizes.
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from streaming_loader import (
+    CLUSTERS_CSV, DEFAULT_CHUNKSIZE, cluster_dtypes, cluster_feature_columns, encode_chunk, peak_rss_mb,
+    read_cluster_header,
+)
+
+ARTIFACTS_DIR = 'artifacts'
+CLASSIFIER_PATH = 'new_user_classifier.pkl'
+ENCODERS_PATH = 'label_encoders.pkl'
+DEFAULT_N_CLUSTERS = 6
+DEFAULT_EPOCHS = 3
+DEFAULT_SAMPLE = 20_000
+HOLDOUT_FRACTION = 0.2
+# Hyperparameters of the bundled new_user_classifier.pkl
+CLASSIFIER_PARAMS = {'C': 1, 'kernel': 'poly', 'degree': 4, 'gamma': 'scale', 'max_iter': 5000, 'random_state': 42}
+
+
+def next_version_dir(root=ARTIFACTS_DIR):
+    """artifacts/vNNNN one past the newest existing version"""
+    versions = [int(name[1:]) for name in os.listdir(root) if name[:1] == 'v' and name[1:].isdigit()] \
+        if os.path.isdir(root) else []
+    return os.path.join(root, f"v{max(versions, default=0) + 1:04d}")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def spill_features(path, encoders, scratch_dir, chunksize):
+    """
+    Pass 1: encode the table chunk by chunk into a float32 scratch file.
+
+    Returns (features memmap, feature columns, previous labels int8, fitted MinMaxScaler).
+    """
+    from sklearn.preprocessing import MinMaxScaler
+    from table_encoder import compile_encoders
+
+    columns = read_cluster_header(path)
+    feature_columns = cluster_feature_columns(columns)
+    compiled = compile_encoders(encoders)
+    scaler = MinMaxScaler()
+    labels, n_rows = [], 0
+    spill_path = os.path.join(scratch_dir, 'features.f32')
+    with open(spill_path, 'wb') as spill:
+        for chunk in pd.read_csv(path, usecols=columns, dtype=cluster_dtypes(columns), chunksize=chunksize):
+            encode_chunk(chunk, compiled)
+            features = chunk[feature_columns].to_numpy(dtype=np.float32)
+            scaler.partial_fit(features)
+            spill.write(features.tobytes())
+            labels.append(chunk['Class Name'].to_numpy(dtype=np.int8))
+            n_rows += len(chunk)
+    features = np.memmap(spill_path, dtype=np.float32, mode='r', shape=(n_rows, len(feature_columns)))
+    return features, feature_columns, np.concatenate(labels), scaler
+
+
+def fit_clusters(features, scaler, n_clusters, epochs, batch_size, chunksize, seed):
+    """Passes 2..: MiniBatchKMeans on shuffled mini-batches of scaled features"""
+    from sklearn.cluster import MiniBatchKMeans
+
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_size, random_state=seed, n_init=3)
+    rng = np.random.default_rng(seed)
+    n = len(features)
+    # The first partial_fit initializes the centroids, so give it a random sample of several batches
+    init_rows = np.sort(rng.choice(n, size=min(n, max(3 * n_clusters, 10 * batch_size)), replace=False))
+    kmeans.partial_fit(scaler.transform(features[init_rows]))
+    for _ in range(epochs):
+        for start in rng.permutation(np.arange(0, n, chunksize)):
+            chunk = scaler.transform(features[start:start + chunksize])
+            chunk = chunk[rng.permutation(len(chunk))]
+            for batch in range(0, len(chunk), batch_size):
+                kmeans.partial_fit(chunk[batch:batch + batch_size])
+    return kmeans
+
+
+def assign_clusters(features, scaler, kmeans, chunksize):
+    """Cluster of every row and the total inertia"""
+    labels = np.empty(len(features), dtype=np.int8)
+    inertia = 0.0
+    for start in range(0, len(features), chunksize):
+        distances = kmeans.transform(scaler.transform(features[start:start + chunksize]))
+        labels[start:start + len(distances)] = distances.argmin(axis=1)
+        nearest = distances.min(axis=1)
+        inertia += float(nearest @ nearest)
+    return labels, inertia
+
+
+def align_labels(new_labels, previous_labels, n_clusters):
+    """Renumber new clusters onto previous ids by maximum overlap; returns (labels, agreement, mapping)
+
+    The result always uses ids 0..n_clusters-1. With fewer clusters than before,
+    the matched previous ids are renumbered in order, so ids no cluster took are
+    not left as gaps. mapping[k-means id] is the id a cluster was given.
+    """
+    from scipy.optimize import linear_sum_assignment
+
+    size = max(n_clusters, int(previous_labels.max()) + 1 if len(previous_labels) else 0)
+    overlap = np.zeros((size, size), dtype=np.int64)
+    np.add.at(overlap, (new_labels, previous_labels), 1)
+    rows, cols = linear_sum_assignment(-overlap)
+    mapping = np.empty(size, dtype=np.int8)
+    mapping[rows] = cols
+    mapping = mapping[:n_clusters]
+    if mapping.max(initial=-1) >= n_clusters:
+        mapping = np.argsort(np.argsort(mapping)).astype(np.int8)
+    aligned = mapping[new_labels]
+    return aligned, float(np.mean(aligned == previous_labels)), mapping
+
+
+def sample_rows(labels, n_clusters, sample_size, seed):
+    """Stratified sample of row positions: at most sample_size / n_clusters per cluster"""
+    rng = np.random.default_rng(seed)
+    per_cluster = max(1, sample_size // n_clusters)
+    rows = []
+    for cluster in np.unique(labels):
+        members = np.flatnonzero(labels == cluster)
+        if len(members) > per_cluster:
+            members = rng.choice(members, per_cluster, replace=False)
+        rows.append(members)
+    return np.sort(np.concatenate(rows))
+
+
+def train_classifier(features, feature_columns, labels, sample_size, n_clusters, seed):
+    """Fit the MinMaxScaler + SVC pipeline on a stratified sample; returns (model, holdout accuracy, n)"""
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import MinMaxScaler
+    from sklearn.svm import SVC
+
+    rows = sample_rows(labels, n_clusters, sample_size, seed)
+    rng = np.random.default_rng(seed)
+    holdout = rng.random(len(rows)) < HOLDOUT_FRACTION
+    # Fitted on a named frame like the original, so predict() on pre_processing output does not warn
+    X = pd.DataFrame(np.asarray(features[rows], dtype=np.float64), columns=feature_columns)
+    y = labels[rows]
+    model = Pipeline([('scaler', MinMaxScaler()), ('model', SVC(**CLASSIFIER_PARAMS))])
+    model.fit(X[~holdout], y[~holdout])
+    accuracy = float(np.mean(model.predict(X[holdout]) == y[holdout])) if holdout.any() else float('nan')
+    return model, accuracy, int((~holdout).sum())
+
+
+def write_table(path, out_path, labels):
+    """Final pass: copy the table row by row with the new Class Name, every other field as written"""
+    with open(path, newline='', encoding='utf-8') as src, open(out_path, 'w', newline='', encoding='utf-8') as dst:
+        reader, writer = csv.reader(src), csv.writer(dst, lineterminator='\n')
+        header = next(reader)
+        writer.writerow(header)
+        column = header.index('Class Name')
+        for row, label in zip(reader, labels.tolist()):
+            row[column] = label
+            writer.writerow(row)
+
+
+def train(clusters_path=CLUSTERS_CSV, out_root=ARTIFACTS_DIR, n_clusters=DEFAULT_N_CLUSTERS, epochs=DEFAULT_EPOCHS,
+          sample_size=DEFAULT_SAMPLE, chunksize=DEFAULT_CHUNKSIZE, seed=0):
+    """Run the whole pipeline; returns the manifest of the new artifact version"""
+    with open(ENCODERS_PATH, 'rb') as file:
+        encoders = pickle.load(file)
+    batch_size = max(1024, 256 * (os.cpu_count() or 1))
+    timings, peaks = {}, {}
+
+    def stage(name, start):
+        timings[name] = round(time.perf_counter() - start, 3)
+        peaks[name] = round(peak_rss_mb(), 1)
+        return time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as scratch:
+        start = time.perf_counter()
+        features, feature_columns, previous_labels, scaler = spill_features(clusters_path, encoders, scratch, chunksize)
+        start = stage('encode_and_spill', start)
+        kmeans = fit_clusters(features, scaler, n_clusters, epochs, batch_size, chunksize, seed)
+        start = stage('fit_clusters', start)
+        labels, inertia = assign_clusters(features, scaler, kmeans, chunksize)
+        labels, agreement, mapping = align_labels(labels, previous_labels, n_clusters)
+        start = stage('assign_clusters', start)
+        model, accuracy, n_train = train_classifier(features, feature_columns, labels, sample_size, n_clusters, seed)
+        start = stage('train_classifier', start)
+        n_rows = len(features)
+        del features
+
+        version_dir = next_version_dir(out_root)
+        os.makedirs(version_dir)
+        write_table(clusters_path, os.path.join(version_dir, os.path.basename(CLUSTERS_CSV)), labels)
+        stage('write_table', start)
+
+    with open(os.path.join(version_dir, CLASSIFIER_PATH), 'wb') as file:
+        pickle.dump(model, file)
+    shutil.copyfile(ENCODERS_PATH, os.path.join(version_dir, ENCODERS_PATH))
+    manifest = {
+        'version': os.path.basename(version_dir),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'source': {'path': clusters_path, 'sha256': file_sha256(clusters_path), 'rows': n_rows},
+        'params': {'n_clusters': n_clusters, 'epochs': epochs, 'batch_size': batch_size,
+                   'classifier_sample': sample_size, 'seed': seed, 'classifier': CLASSIFIER_PARAMS},
+        'label_mapping': {str(kmeans_id): int(label) for kmeans_id, label in enumerate(mapping.tolist())},
+        'metrics': {'inertia': inertia, 'agreement_with_previous_labels': agreement,
+                    'classifier_holdout_accuracy': accuracy, 'classifier_train_rows': n_train,
+                    'cluster_sizes': np.bincount(labels, minlength=n_clusters).tolist()},
+        'timings_s': timings,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'peak_rss_mb_after': peaks,
+    }
+    with open(os.path.join(version_dir, 'manifest.json'), 'w') as file:
+        json.dump(manifest, file, indent=2)
+    return version_dir, manifest
+
+
+# ============================================================================
+# Scaling report
+# ============================================================================
+
+def report(scales, chunksize, sample_size):
+    from streaming_loader import _scale_tables
+
+    print(f"{'scale':>7} {'rows':>10} {'wall s':>8} {'peak MB':>8}  stages (s)")
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in scales:
+            clusters_path, _ = _scale_tables(scale, tmp)
+            # Fresh interpreter per size so ru_maxrss only reflects this run
+            start = time.perf_counter()
+            out = subprocess.run(
+                [sys.executable, '-W', 'ignore', os.path.abspath(__file__), 'train', '--clusters', clusters_path,
+                 '--out', os.path.join(tmp, 'artifacts'), '--chunksize', str(chunksize),
+                 '--sample', str(sample_size)],
+                capture_output=True, text=True, check=True,
+            )
+            wall = time.perf_counter() - start
+            version_dir = out.stdout.split()[-1]
+            with open(os.path.join(version_dir, 'manifest.json')) as file:
+                manifest = json.load(file)
+            stages = ' '.join(f"{name}={seconds:.1f}" for name, seconds in manifest['timings_s'].items())
+            print(f"{scale:>7} {manifest['source']['rows']:>10} {wall:>8.1f} {manifest['peak_rss_mb']:>8.0f}  {stages}")
+            shutil.rmtree(version_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline re-clustering and classifier retraining")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('train', help="recluster the table and retrain the classifier into a new version")
+    run.add_argument('--clusters', default=CLUSTERS_CSV)
+    run.add_argument('--out', default=ARTIFACTS_DIR)
+    run.add_argument('--k', type=int, default=DEFAULT_N_CLUSTERS)
+    run.add_argument('--epochs', type=int, default=DEFAULT_EPOCHS)
+    run.add_argument('--sample', type=int, default=DEFAULT_SAMPLE, help="classifier training sample size")
+    run.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    run.add_argument('--seed', type=int, default=0)
+
+    scaling = sub.add_parser('report', help="wall time and peak memory at several table sizes")
+    scaling.add_argument('--scales', type=int, nargs='+', default=[1, 100, 1000])
+    scaling.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    scaling.add_argument('--sample', type=int, default=DEFAULT_SAMPLE)
+
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        version_dir, manifest = train(args.clusters, args.out, args.k, args.epochs, args.sample, args.chunksize,
+                                      args.seed)
+        metrics = manifest['metrics']
+        print(f"[OK] {manifest['source']['rows']} rows in {args.k} clusters {metrics['cluster_sizes']}, "
+              f"{metrics['agreement_with_previous_labels']:.1%} keep their previous cluster, "
+              f"classifier holdout accuracy {metrics['classifier_holdout_accuracy']:.1%}")
+        print(f"     {sum(manifest['timings_s'].values()):.1f} s, peak RSS {manifest['peak_rss_mb']:.0f} MB")
+        print(version_dir)
+    else:
+        report(args.scales, args.chunksize, args.sample)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Opt-in sampling profiler for Streamlit reruns.
+
+Off by default. Set VITA_NOVA_PROFILE=1 to profile every rerun of the
+process, or open the app with ?profile=1 to profile only that browser
+session. While a rerun executes `main()`, a sampler thread reads the script
+thread's Python stack every `interval` seconds via sys._current_frames(). The
+script thread itself is never traced, so the overhead is a few stack walks per
+interval, not a hook on every call the way cProfile adds one.
+
+Each sampled stack is prefixed with the rerun's tags, the page and
+current_question it started on:
+
+    page:door2;question:24;main (app.py:1373);door2_page (app.py:895);finish_incremental_match (matching_engine.py:463);... 12
+
+Counts are aggregated per process and written, every FLUSH_EVERY reruns and
+at exit, to $VITA_NOVA_PROFILE_DIR (default ./profiles):
+
+    reruns.collapsed    collapsed stacks, for flamegraph.pl, speedscope or inferno
+    reruns.jsonl        one line per rerun: tags, wall time and sample count
+
+Run `python rerun_profiler.py --summary` for the slowest pages and hottest
+frames of a profile directory, and `python rerun_profiler.py --bench` for the
+sampler's overhead.
+"""
+
+import argparse
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+DEFAULT_PROFILE_DIR = 'profiles'
+DEFAULT_INTERVAL = 0.005        # seconds between samples
+FLUSH_EVERY = 20                # reruns between writes
+
+
+def profile_dir():
+    """Profile directory: $VITA_NOVA_PROFILE_DIR, else ./profiles"""
+    return os.environ.get('VITA_NOVA_PROFILE_DIR', DEFAULT_PROFILE_DIR)
+
+
+def profiling_enabled(query_params=None):
+    """True when VITA_NOVA_PROFILE is set or the session was opened with ?profile=1"""
+    if os.environ.get('VITA_NOVA_PROFILE', '') not in ('', '0'):
+        return True
+    return query_params is not None and query_params.get('profile') == '1'
+
+
+def frame_label(code):
+    # ';' separates frames in the collapsed format
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ',')
+
+
+class StackSampler:
+    """Samples one thread's stack, up to but excluding a root frame, from a daemon thread"""
+
+    def __init__(self, thread_id, root, interval=DEFAULT_INTERVAL):
+        self.thread_id = thread_id
+        self.root = root
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='rerun-profiler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None and frame is not self.root:
+                labels.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if labels:
+                self.stacks[tuple(reversed(labels))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+
+class ProfileAggregate:
+    """Process-wide collapsed-stack counts and per-rerun stats, shared by all sessions"""
+
+    def __init__(self):
+        self.stacks = Counter()
+        self.reruns = []
+        self.pending = 0
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def record(self, tags, stacks, wall_ms):
+        prefix = tuple(f"{name}:{value}" for name, value in tags.items())
+        with self._lock:
+            for stack, count in stacks.items():
+                self.stacks[prefix + stack] += count
+            self.reruns.append({'ts': time.time(), **tags, 'wall_ms': round(wall_ms, 2),
+                                'samples': sum(stacks.values())})
+            self.pending += 1
+            if self.pending < FLUSH_EVERY:
+                return
+        self.flush()
+
+    def flush(self, directory=None):
+        directory = directory or profile_dir()
+        with self._lock:
+            if not self.pending:
+                return
+            stacks = sorted(self.stacks.items())
+            reruns, self.reruns, self.pending = self.reruns, [], 0
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # The collapsed file holds the aggregate so far; it is rewritten, not appended
+            path = os.path.join(directory, 'reruns.collapsed')
+            with open(path + '.tmp', 'w') as file:
+                file.writelines(f"{';'.join(stack)} {count}\n" for stack, count in stacks)
+            os.replace(path + '.tmp', path)
+            with open(os.path.join(directory, 'reruns.jsonl'), 'a') as file:
+                file.writelines(json.dumps(rerun) + '\n' for rerun in reruns)
+        except OSError as e:
+            print(f"[ERROR] Could not write rerun profile to {directory}: {e}")
+
+
+aggregate = ProfileAggregate()
+
+
+def run_profiled(fn, interval=DEFAULT_INTERVAL, **tags):
+    """Call fn() while sampling this thread; the samples are recorded under the tags"""
+    sampler = StackSampler(threading.get_ident(), sys._getframe(), interval)
+    start = time.perf_counter()
+    sampler.start()
+    try:
+        return fn()
+    finally:
+        # st.rerun() and st.stop() end a rerun with an exception; it is still recorded
+        stacks = sampler.stop()
+        aggregate.record(tags, stacks, (time.perf_counter() - start) * 1e3)
+
+
+# ============================================================================
+# Summary and benchmark
+# ============================================================================
+
+def summary(directory, top):
+    reruns_path = os.path.join(directory, 'reruns.jsonl')
+    collapsed_path = os.path.join(directory, 'reruns.collapsed')
+    if not os.path.exists(reruns_path):
+        print(f"[WARNING] No profile in {directory}")
+        return
+
+    walls = {}
+    with open(reruns_path) as file:
+        for line in file:
+            rerun = json.loads(line)
+            walls.setdefault(rerun['page'], []).append(rerun['wall_ms'])
+    print(f"{'page':>16} {'reruns':>7} {'mean ms':>8} {'max ms':>8}")
+    for page, times in sorted(walls.items(), key=lambda item: -sum(item[1])):
+        print(f"{page:>16} {len(times):>7} {sum(times) / len(times):>8.1f} {max(times):>8.1f}")
+
+    self_counts, total_counts = Counter(), Counter()
+    with open(collapsed_path) as file:
+        for line in file:
+            stack, count = line.rsplit(' ', 1)
+            frames = [frame for frame in stack.split(';') if not frame.startswith(('page:', 'question:'))]
+            if frames:
+                self_counts[frames[-1]] += int(count)
+                for frame in set(frames):
+                    total_counts[frame] += int(count)
+    n = sum(self_counts.values()) or 1
+    print(f"\nhottest frames over {n} samples")
+    print(f"{'self %':>7} {'total %':>8}  frame")
+    for frame, count in self_counts.most_common(top):
+        print(f"{count / n:>7.1%} {total_counts[frame] / n:>8.1%}  {frame}")
+
+
+def benchmark(repeats):
+    import contextlib
+    import io
+    import tempfile
+    import numpy as np
+    import matching_engine
+
+    if not matching_engine.load_matching_data():
+        return
+    rng = np.random.default_rng(0)
+    profile = {'gender': 'Female', 'age_groups': '25-34'}
+    entry_hall = {f"q_{i}": int(rng.integers(1, 6)) for i in range(15)}
+    door2 = {f"q_{i}": int(rng.integers(1, 6)) for i in range(25)}
+
+    def rerun():
+        matching_engine.get_user_matches(profile, entry_hall, door2, top_n=5)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        rerun()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            rerun()
+        plain_ms = (time.perf_counter() - start) / repeats * 1e3
+        with tempfile.TemporaryDirectory() as tmp:
+            os.environ['VITA_NOVA_PROFILE_DIR'] = tmp
+            start = time.perf_counter()
+            for _ in range(repeats):
+                run_profiled(rerun, page='door2', question=24)
+            profiled_ms = (time.perf_counter() - start) / repeats * 1e3
+            aggregate.flush(tmp)
+            samples = sum(aggregate.stacks.values())
+
+    print(f"get_user_matches as a rerun, {repeats} reruns")
+    print(f"  unprofiled: {plain_ms:7.2f} ms")
+    print(f"  sampled:    {profiled_ms:7.2f} ms ({(profiled_ms / plain_ms - 1):+.1%}, "
+          f"{samples} samples at {DEFAULT_INTERVAL * 1e3:.0f} ms)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Opt-in per-rerun sampling profiler")
+    parser.add_argument('--dir', default=profile_dir())
+    parser.add_argument('--summary', action='store_true', help="slowest pages and hottest frames")
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--bench', action='store_true', help="overhead of the sampler")
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+
+    if args.summary:
+        summary(args.dir, args.top)
+    elif args.bench:
+        benchmark(args.repeats)
+    else:
+        parser.print_help()
@@ -0,0 +1,281 @@
+"""
+Compact per-session state with idle-session eviction.
+
+Streamlit keeps each browser session's st.session_state alive until the tab
+disconnects, so a session abandoned mid-journey would keep its answer text
+strings, its match profile dicts, the Door 2 similarity accumulators and the
+match cursor for as long as the tab stays open. Here the heavy per-session
+parts live in one process-wide SessionStore instead, keyed by a small id
+kept in st.session_state:
+
+    answers     one int8 code array per questionnaire (0 = unanswered)
+    matches     user ids and float32 scores; display fields, reciprocity and
+                explanations are fetched from the engine when the page renders
+    matcher     the Door 2 IncrementalMatcher, dropped once matching is done
+    cursor      the "show more matches" MatchCursor
+
+Sessions idle for longer than the TTL are dropped on the next sweep; a sweep
+runs from whichever session touches the store after SWEEP_INTERVAL seconds.
+
+Run `python session_store.py --report` for bytes per session before and after.
+"""
+
+import argparse
+import sys
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_IDLE_TTL = 30 * 60      # seconds
+SWEEP_INTERVAL = 60             # seconds between idle sweeps
+
+# Questions per questionnaire whose answers are kept as codes
+ANSWER_SETS = {'entry_hall': 15, 'door1': 40, 'door2': 25, 'door3': 20}
+
+
+class AnswerCodes:
+    """1-based option codes of one questionnaire, 0 for unanswered questions"""
+
+    __slots__ = ('codes',)
+
+    def __init__(self, n_questions):
+        self.codes = np.zeros(n_questions, dtype=np.int8)
+
+    def record(self, question, code):
+        self.codes[question] = code
+
+    def get(self, question):
+        code = int(self.codes[question])
+        return code or None
+
+    def answered(self):
+        return int(np.count_nonzero(self.codes))
+
+    def as_dict(self):
+        """{'q_i': code} of the answered questions, as the matching engine expects"""
+        return {f"q_{i}": int(code) for i, code in enumerate(self.codes.tolist()) if code}
+
+    def nbytes(self):
+        return self.codes.nbytes
+
+
+class MatchRefs:
+    """Matches as user ids and scores; everything shown is looked up when the page renders"""
+
+    __slots__ = ('user_ids', 'scores', 'cluster', 'x', 'degraded', 'hybrid')
+
+    def __init__(self, user_ids, scores, cluster, x=None, degraded=False, hybrid=None):
+        self.user_ids = np.asarray(user_ids, dtype=np.int32)
+        self.scores = np.asarray(scores, dtype=np.float32)
+        # Hybrid scores the matches were ranked by when hobby overlap reordered them, else None
+        self.hybrid = None if hybrid is None else np.asarray(hybrid, dtype=np.float32)
+        self.cluster = cluster
+        # The user's feature vector, so explanations can be recomputed on demand
+        self.x = None if x is None else np.asarray(x, dtype=np.float32)
+        # Representative users served under overload, awaiting a full rematch (admission_control)
+        self.degraded = degraded
+
+    @classmethod
+    def from_matches(cls, matched_users, cluster, x=None, degraded=False):
+        hybrid = None
+        if matched_users and all('hybrid_score' in match for match in matched_users):
+            hybrid = [match['hybrid_score'] for match in matched_users]
+        return cls([match['user_id'] for match in matched_users],
+                   [match['similarity_score'] for match in matched_users], cluster, x, degraded, hybrid)
+
+    def extend(self, user_ids, scores, hybrid=None):
+        self.user_ids = np.concatenate([self.user_ids, np.asarray(user_ids, dtype=np.int32)])
+        self.scores = np.concatenate([self.scores, np.asarray(scores, dtype=np.float32)])
+        if self.hybrid is not None:
+            self.hybrid = np.concatenate([self.hybrid, np.asarray(hybrid, dtype=np.float32)])
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def nbytes(self):
+        extra = (self.x.nbytes if self.x is not None else 0) + (self.hybrid.nbytes if self.hybrid is not None else 0)
+        return self.user_ids.nbytes + self.scores.nbytes + extra
+
+
+class SessionData:
+    """Heavy state of one session"""
+
+    __slots__ = ('answers', 'matches', 'matcher', 'cursor', 'match_generation', 'last_seen')
+
+    def __init__(self, now):
+        self.answers = {name: AnswerCodes(n) for name, n in ANSWER_SETS.items()}
+        self.matches = None
+        self.matcher = None
+        self.cursor = None
+        self.match_generation = 0       # Door 2 completions so far; a background rematch checks it before writing
+        self.last_seen = now
+
+    def nbytes(self):
+        total = sum(answers.nbytes() for answers in self.answers.values())
+        if self.matches is not None:
+            total += self.matches.nbytes()
+        if self.cursor is not None:
+            total += self.cursor.nbytes()
+        if self.matcher is not None:
+            total += matcher_nbytes(self.matcher)
+        return total
+
+
+def matcher_nbytes(matcher):
+    """Per-session arrays of an IncrementalMatcher (its cluster block is shared, not counted)"""
+    return sum(a.nbytes for a in (matcher.x, matcher.answered, matcher.dot, matcher.door2_idx) if a is not None)
+
+
+class SessionStore:
+    """Process-wide SessionData by session key, with idle-TTL eviction"""
+
+    def __init__(self, idle_ttl=DEFAULT_IDLE_TTL, sweep_interval=SWEEP_INTERVAL, clock=time.monotonic):
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_sweep = clock()
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, key):
+        return key in self._sessions
+
+    def get(self, key):
+        """The session's data, created if missing; marks the session active"""
+        now = self.clock()
+        with self._lock:
+            data = self._sessions.get(key)
+            if data is None:
+                data = self._sessions[key] = SessionData(now)
+            data.last_seen = now
+            if now - self._last_sweep >= self.sweep_interval:
+                self._evict_idle(now)
+        return data
+
+    def drop(self, key):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+    def evict_idle(self):
+        """Drop every session idle for longer than the TTL; returns how many were dropped"""
+        with self._lock:
+            return self._evict_idle(self.clock())
+
+    def _evict_idle(self, now):
+        idle = [key for key, data in self._sessions.items() if now - data.last_seen > self.idle_ttl]
+        for key in idle:
+            del self._sessions[key]
+        self._last_sweep = now
+        self.evicted += len(idle)
+        return len(idle)
+
+    def nbytes(self):
+        return sum(data.nbytes() for data in self._sessions.values())
+
+
+# ============================================================================
+# Memory report
+# ============================================================================
+
+def deep_sizeof(obj, seen=None):
+    """Approximate bytes held by an object graph (NumPy arrays count their buffers)"""
+    from incremental_matching import IncrementalMatcher
+
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, IncrementalMatcher):
+        return sys.getsizeof(obj) + matcher_nbytes(obj)
+    if isinstance(obj, np.ndarray):
+        return sys.getsizeof(obj) + (obj.nbytes if obj.base is None else 0)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, '__dict__'):
+        size += deep_sizeof(vars(obj), seen)
+    elif hasattr(obj, '__slots__'):
+        size += sum(deep_sizeof(getattr(obj, slot), seen) for slot in obj.__slots__ if hasattr(obj, slot))
+    return size
+
+
+def _answer_texts(rng, n_questions):
+    options = ["Not at all", "Slightly", "Moderately", "Very", "Extremely"]
+    return {f"q_{i}": options[rng.integers(5)] for i in range(n_questions)}
+
+
+def report(n_matches, scale, cluster_size):
+    import pandas as pd
+    import matching_engine
+    from streaming_loader import PROFILES_CSV
+
+    if not matching_engine.load_matching_data():
+        return
+    rng = np.random.default_rng(0)
+    profile = {'gender': 'Female', 'age_groups': '25-34'}
+    entry_hall = {f"q_{i}": int(rng.integers(1, 6)) for i in range(15)}
+    door2 = {f"q_{i}": int(rng.integers(1, 6)) for i in range(25)}
+
+    matcher = matching_engine.start_incremental_match(profile, entry_hall)
+    for i in range(25):
+        matcher.record_answer(i, door2[f"q_{i}"])
+    matches, cluster, cursor = matching_engine.finish_incremental_match(matcher, n_matches, with_cursor=True)
+
+    # Original: answer texts plus codes, whole user_profiles.csv rows per match
+    full_profiles = pd.read_csv(PROFILES_CSV).set_index('user_id', drop=False)
+    original = {
+        'entry_hall_answers': {**_answer_texts(rng, 15), **{f"q_{i}_code": c for i, c in enumerate(entry_hall.values())}},
+        'door2_answers': _answer_texts(rng, 25),
+        'user_matches': [dict(full_profiles.loc[int(m['user_id'])].to_dict(), similarity_score=m['similarity_score'],
+                              cluster=cluster) for m in matches],
+    }
+    # Current: answer texts, compact profile dicts with explanations, matcher and cursor kept for the session
+    current = {
+        'entry_hall_answers': original['entry_hall_answers'],
+        'door2_answers': original['door2_answers'],
+        'user_matches': matches,
+        'door2_matcher': matcher,
+        'match_cursor': cursor,
+    }
+    # Compact: codes, id/score pairs and the cursor; the matcher is dropped after matching
+    data = SessionData(0.0)
+    for i, code in enumerate(entry_hall.values()):
+        data.answers['entry_hall'].record(i, code)
+    for i, code in enumerate(door2.values()):
+        data.answers['door2'].record(i, code)
+    data.matches = MatchRefs.from_matches(matches, cluster, cursor.x)
+    data.cursor = cursor
+
+    print(f"cluster {cluster} of {len(matcher.block.user_ids)} users, {n_matches} matches")
+    print(f"{'':>26} {'bytes/session':>14} {'x' + str(scale) + ' sessions MB':>18}")
+    rows = [('original (full rows)', deep_sizeof(original)),
+            ('current', deep_sizeof(current)),
+            ('compact', deep_sizeof(data)),
+            ('compact, no cursor', deep_sizeof(data) - deep_sizeof(cursor))]
+    for name, size in rows:
+        print(f"{name:>26} {size:>14,} {size * scale / 1e6:>18.1f}")
+    # The matcher's accumulators grow with the cluster; 'current' keeps them until the session ends
+    dot_bytes = cluster_size * np.dtype(np.float64).itemsize
+    print(f"with a {cluster_size}-user cluster 'current' also holds {dot_bytes:,} bytes of Door 2 accumulators "
+          f"({dot_bytes * scale / 1e6:.0f} MB for {scale} sessions); compact drops them after matching")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compact per-session state")
+    parser.add_argument('--report', action='store_true', help="bytes per session before and after")
+    parser.add_argument('--matches', type=int, default=5)
+    parser.add_argument('--sessions', type=int, default=10_000, help="sessions to extrapolate to")
+    parser.add_argument('--cluster-size', type=int, default=200_000, help="cluster size to extrapolate to")
+    args = parser.parse_args()
+
+    if args.report:
+        report(args.matches, args.sessions, args.cluster_size)
+    else:
+        parser.print_help()
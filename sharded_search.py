@@ -0,0 +1,194 @@
+"""
+Multi-core sharded exact search over large cluster blocks.
+
+With millions of users, one cluster of the 6-cluster model holds hundreds of
+thousands of rows, and the kernel pass plus the top-k selection over them ran
+on the request's thread alone. Here a block larger than PARALLEL_MIN_ROWS
+candidates is split into contiguous shards of at least MIN_SHARD_ROWS rows,
+one per worker. The shards are scored on a shared thread pool: the kernels'
+matrix-vector products and elementwise passes run in NumPy with the GIL
+released, and every kernel keeps its scratch buffers per thread. Each shard
+writes its slice of one score vector, so the scores are bit-for-bit the ones a
+single thread computes and the search stays exact. The top-k is then taken per
+shard with argpartition, ties at the cut going to the lower rows, and the shard
+lists are merged, so ties come out the same however many shards there are.
+
+Below the cutoff a whole search takes a few milliseconds, too little to be
+worth taking pool threads from concurrent requests, so small clusters and
+filtered candidate sets are scored on the calling thread as before. The
+worker count defaults to the usable cores ($VITA_NOVA_SEARCH_THREADS
+overrides it). With several workers, limit BLAS to one thread per worker
+(e.g. OPENBLAS_NUM_THREADS=1) so the two do not oversubscribe the cores.
+
+Run `python sharded_search.py --bench` to see how the speedup scales with the
+number of workers.
+"""
+
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from cluster_search import top_k_indices
+
+PARALLEL_MIN_ROWS = 200_000     # candidate sets below this are searched on the calling thread
+MIN_SHARD_ROWS = 50_000         # rows per shard, at least
+
+
+def default_workers():
+    """Search threads: $VITA_NOVA_SEARCH_THREADS, else the cores this process may run on"""
+    if os.environ.get('VITA_NOVA_SEARCH_THREADS'):
+        return max(1, int(os.environ['VITA_NOVA_SEARCH_THREADS']))
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(workers):
+    """Process-wide thread pool of a given size, created on first use"""
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='search')
+        return pool
+
+
+def shard_bounds(n_rows, workers, min_shard_rows=MIN_SHARD_ROWS):
+    """[(start, stop)] of contiguous shards, at most one per worker and none under min_shard_rows"""
+    n_shards = max(1, min(workers, n_rows // max(min_shard_rows, 1)))
+    edges = np.linspace(0, n_rows, n_shards + 1).astype(np.int64)
+    return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+
+def _shards(n_rows, workers, min_rows):
+    """Shard bounds, or None when the search should stay on the calling thread"""
+    workers = default_workers() if workers is None else workers
+    if workers <= 1 or n_rows < min_rows:
+        return None
+    bounds = shard_bounds(n_rows, workers)
+    return bounds if len(bounds) > 1 else None
+
+
+def sharded_scores(kernel, state, features, x, rows=None, workers=None, min_rows=PARALLEL_MIN_ROWS):
+    """Kernel scores of x against features[rows] (all rows when None), scored in parallel shards when large"""
+    n_rows = len(features) if rows is None else len(rows)
+    bounds = _shards(n_rows, workers, min_rows)
+    if bounds is None:
+        return kernel.scores(state, features, x, rows)
+    out = np.empty(n_rows, dtype=np.float64)
+
+    def score_shard(start, stop):
+        shard = slice(start, stop) if rows is None else rows[start:stop]
+        out[start:stop] = kernel.scores(state, features, x, shard)
+
+    for future in [get_pool(len(bounds)).submit(score_shard, *bound) for bound in bounds]:
+        future.result()
+    return out
+
+
+def stable_top_k(scores, k):
+    """Indices of the k largest scores, best first, ties broken by the lower index
+    
+    argpartition alone keeps an arbitrary subset of the scores tied at the k-th
+    place, so everything above it is kept and the tied rows fill up in order.
+    """
+    top = top_k_indices(scores, k)
+    if len(top) == 0:
+        return top
+    kth = scores[top[-1]]
+    above = np.flatnonzero(scores > kth)
+    tied = np.flatnonzero(scores == kth)[:len(top) - len(above)]
+    top = np.concatenate([above, tied])
+    return top[np.lexsort((top, -scores[top]))]
+
+
+def sharded_top_k(scores, k, workers=None, min_rows=PARALLEL_MIN_ROWS):
+    """Indices of the k largest scores, best first; per-shard selections merged when large"""
+    bounds = _shards(len(scores), workers, min_rows)
+    if bounds is None:
+        return stable_top_k(scores, k)
+
+    def shard_top(start, stop):
+        return start + stable_top_k(scores[start:stop], k)
+
+    candidates = np.concatenate([future.result() for future in
+                                 [get_pool(len(bounds)).submit(shard_top, *bound) for bound in bounds]])
+    # Each shard keeps its lowest tied rows, so the merge picks the same rows as one stable_top_k pass
+    order = np.lexsort((candidates, -scores[candidates]))[:k]
+    return candidates[order]
+
+
+# ============================================================================
+# Benchmark
+# ============================================================================
+
+def benchmark(cluster_size, k, worker_counts, repeats=10):
+    from similarity_kernels import make_kernel
+    from streaming_loader import ClusterBlock, read_cluster_header, cluster_feature_columns
+
+    columns = cluster_feature_columns(read_cluster_header())
+    rng = np.random.default_rng(0)
+    features = rng.integers(1, 6, size=(cluster_size, len(columns))).astype(np.float32)
+    block = ClusterBlock(user_ids=np.arange(cluster_size, dtype=np.int32), features=features)
+    x = rng.integers(1, 6, size=len(columns)).astype(np.float64)
+    kernel = make_kernel('cosine')
+    state = kernel.prepare({0: block}, columns)[0]
+
+    reference = stable_top_k(kernel.scores(state, features, x), k)
+    print(f"{cluster_size} candidates x {len(columns)} features, top {k}, {default_workers()} usable core(s)")
+    print(f"{'workers':>8} {'shards':>7} {'search ms':>10} {'speedup':>8}")
+    baseline = None
+    for workers in worker_counts:
+        shards = len(shard_bounds(cluster_size, workers)) if workers > 1 else 1
+
+        def search():
+            scores = sharded_scores(kernel, state, features, x, workers=workers, min_rows=0)
+            return sharded_top_k(scores, k, workers=workers, min_rows=0)
+
+        top = search()
+        assert np.array_equal(top, reference), "sharded top-k differs from the exact one"
+        start = time.perf_counter()
+        for _ in range(repeats):
+            search()
+        search_ms = (time.perf_counter() - start) / repeats * 1e3
+        baseline = baseline or search_ms
+        print(f"{workers:>8} {shards:>7} {search_ms:>10.2f} {baseline / search_ms:>7.2f}x")
+
+    # What stays on the calling thread below the cutoff, and what a pool hand-off costs
+    small = features[:PARALLEL_MIN_ROWS // 10]
+    pool = get_pool(max(worker_counts))
+    start = time.perf_counter()
+    for _ in range(repeats * 10):
+        sharded_top_k(sharded_scores(kernel, state[:len(small)], small, x), k)
+    small_ms = (time.perf_counter() - start) / (repeats * 10) * 1e3
+    start = time.perf_counter()
+    for _ in range(repeats * 10):
+        pool.submit(int).result()
+    round_trip_ms = (time.perf_counter() - start) / (repeats * 10) * 1e3
+    print(f"  {len(small)} candidates on the calling thread: {small_ms:.3f} ms; "
+          f"one pool round trip: {round_trip_ms:.3f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-core sharded exact search")
+    parser.add_argument('--bench', action='store_true', help="speedup as the number of workers grows")
+    parser.add_argument('--cluster-size', type=int, default=1_000_000)
+    parser.add_argument('--k', type=int, default=50)
+    parser.add_argument('--workers', type=int, nargs='+', default=None,
+                        help="worker counts to compare (default: 1, 2, 4, ... up to the usable cores)")
+    args = parser.parse_args()
+
+    if args.bench:
+        counts = args.workers or sorted({1 << i for i in range(8) if 1 << i <= default_workers()}
+                                        | {default_workers()})
+        benchmark(args.cluster_size, args.k, counts)
+    else:
+        parser.print_help()
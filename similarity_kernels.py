@@ -0,0 +1,255 @@
+"""
+Pluggable similarity kernels for the matching engine.
+
+Every kernel scores one new user's feature vector against the rows of a
+cluster block, higher meaning more similar. Anything that depends only on
+the existing users (norms, weighted norms, squared standardized norms, answer
+codes) is precomputed per cluster by `prepare`, so a request is one
+matrix-vector product plus a few elementwise passes. No input validation is
+done: callers pass float32 blocks and float64 vectors in feature_columns order.
+Scratch space comes from per-thread buffers that only grow, and each request
+allocates little beyond the scores it returns.
+
+    cosine              cosine similarity on the raw encoded features (the notebook's metric)
+    weighted_cosine     cosine with a weight per feature group, by default down-weighting the
+                        categorical demographics that otherwise dominate the 1-5 answer codes
+    euclidean           1 / (1 + distance) on features standardized over all existing users
+    hamming             share of Entry Hall and Door 2 answer codes that are identical
+
+Run `python similarity_kernels.py --bench` for latency and neighbour overlap
+between kernels.
+"""
+
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from streaming_loader import DOOR2_ANSWER_COLUMNS, ENTRY_HALL_ANSWER_COLUMNS
+from match_explanations import EXPLANATION_GROUPS, group_matrix
+
+DEFAULT_KERNEL = 'cosine'
+DEFAULT_GROUP_WEIGHTS = {'Entry Hall': 1.0, 'Door 2': 1.0, 'Subscores': 1.0, 'Demographics': 0.25}
+ANSWER_CODE_COLUMNS = ENTRY_HALL_ANSWER_COLUMNS + DOOR2_ANSWER_COLUMNS
+
+
+class SimilarityKernel:
+    """Base class: prepare per-cluster state once, then score vectors against it"""
+
+    name = None
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _buffer(self, key, n, dtype=np.float64):
+        """Per-thread scratch array of at least n rows, reused across calls"""
+        buffers = self._local.__dict__.setdefault('buffers', {})
+        buf = buffers.get(key)
+        if buf is None or len(buf) < n:
+            buf = buffers[key] = np.empty(n, dtype=dtype)
+        return buf[:n]
+
+    def prepare(self, cluster_arrays, feature_columns):
+        """{cluster: state} for every cluster block"""
+        raise NotImplementedError
+
+    def scores(self, state, features, x, rows=None):
+        """
+        Similarity of x against features[rows] (all rows when rows is None).
+
+        rows may be a slice or an array of row positions and is applied to the
+        state the same way.
+        """
+        raise NotImplementedError
+
+
+def _take(array, rows):
+    return array if rows is None else array[rows]
+
+
+class CosineKernel(SimilarityKernel):
+    name = 'cosine'
+
+    def prepare(self, cluster_arrays, feature_columns):
+        return {cluster: np.linalg.norm(block.features.astype(np.float64), axis=1)
+                for cluster, block in cluster_arrays.items()}
+
+    def scores(self, state, features, x, rows=None):
+        features, norms = _take(features, rows), _take(state, rows)
+        out = np.matmul(features, x)
+        denom = np.multiply(norms, np.sqrt(x @ x), out=self._buffer('denom', len(norms)))
+        # Where a norm is zero the dot product is zero too, so zero vectors score 0 as in sklearn
+        return np.divide(out, denom, out=out, where=denom > 0)
+
+
+class WeightedCosineKernel(SimilarityKernel):
+    name = 'weighted_cosine'
+
+    def __init__(self, group_weights=None):
+        super().__init__()
+        self.group_weights = dict(DEFAULT_GROUP_WEIGHTS, **(group_weights or {}))
+        self.weights = None
+
+    def prepare(self, cluster_arrays, feature_columns):
+        groups = np.array([self.group_weights[group] for group in EXPLANATION_GROUPS])
+        self.weights = group_matrix(tuple(feature_columns)) @ groups
+        # Weighted norm of each row: sqrt(sum_j w_j z_j^2)
+        return {cluster: np.sqrt(np.square(block.features, dtype=np.float64) @ self.weights)
+                for cluster, block in cluster_arrays.items()}
+
+    def scores(self, state, features, x, rows=None):
+        features, norms = _take(features, rows), _take(state, rows)
+        wx = self.weights * x
+        out = np.matmul(features, wx)
+        denom = np.multiply(norms, np.sqrt(wx @ x), out=self._buffer('denom', len(norms)))
+        return np.divide(out, denom, out=out, where=denom > 0)
+
+
+class StandardizedEuclideanKernel(SimilarityKernel):
+    """
+    1 / (1 + ||(z - x) / sd||) with sd taken over all existing users.
+
+    The squared distance is expanded as sum(z^2/sd^2) - 2 z.(x/sd^2) + sum(x^2/sd^2)
+    so the block is never copied or standardized per request.
+    """
+    name = 'euclidean'
+
+    def __init__(self):
+        super().__init__()
+        self.inv_var = None
+
+    def prepare(self, cluster_arrays, feature_columns):
+        n = sum(len(block.user_ids) for block in cluster_arrays.values())
+        total = sum(block.features.sum(axis=0, dtype=np.float64) for block in cluster_arrays.values())
+        mean = total / max(n, 1)
+        sq = sum(np.square(block.features - mean, dtype=np.float64).sum(axis=0) for block in cluster_arrays.values())
+        sd = np.sqrt(sq / max(n, 1))
+        # Constant columns carry no information
+        self.inv_var = np.divide(1.0, sd ** 2, out=np.zeros_like(sd), where=sd > 0)
+        return {cluster: np.square(block.features, dtype=np.float64) @ self.inv_var
+                for cluster, block in cluster_arrays.items()}
+
+    def scores(self, state, features, x, rows=None):
+        features, row_sq = _take(features, rows), _take(state, rows)
+        scaled_x = self.inv_var * x
+        out = np.matmul(features, scaled_x)
+        out *= -2.0
+        out += row_sq
+        out += scaled_x @ x
+        np.maximum(out, 0.0, out=out)   # rounding can leave tiny negatives
+        np.sqrt(out, out=out)
+        out += 1.0
+        return np.reciprocal(out, out=out)
+
+
+class HammingKernel(SimilarityKernel):
+    """Share of the 40 Entry Hall and Door 2 answer codes on which two users agree"""
+    name = 'hamming'
+
+    def __init__(self):
+        super().__init__()
+        self.code_idx = None
+
+    def prepare(self, cluster_arrays, feature_columns):
+        columns = list(feature_columns)
+        self.code_idx = np.array([columns.index(col) for col in ANSWER_CODE_COLUMNS])
+        return {cluster: np.ascontiguousarray(block.features[:, self.code_idx]).astype(np.int8)
+                for cluster, block in cluster_arrays.items()}
+
+    def scores(self, state, features, x, rows=None):
+        codes = _take(state, rows)
+        x_codes = np.rint(x[self.code_idx]).astype(np.int8)
+        n = len(codes)
+        equal = self._buffer('equal', n * codes.shape[1], dtype=bool).reshape(n, codes.shape[1])
+        np.equal(codes, x_codes, out=equal)
+        return np.count_nonzero(equal, axis=1) / codes.shape[1]
+
+
+KERNELS = {kernel.name: kernel for kernel in
+           (CosineKernel, WeightedCosineKernel, StandardizedEuclideanKernel, HammingKernel)}
+
+
+def make_kernel(name, **options):
+    """Instantiate a kernel by name"""
+    if name not in KERNELS:
+        raise KeyError(f"Unknown similarity kernel {name!r}, expected one of {sorted(KERNELS)}")
+    return KERNELS[name](**options)
+
+
+# ============================================================================
+# Benchmark
+# ============================================================================
+
+def _top_sets(kernel, states, cluster_arrays, k):
+    """Top-k neighbour id sets of every existing user (themselves excluded) under one kernel"""
+    tops = {}
+    for cluster, block in cluster_arrays.items():
+        features = block.features.astype(np.float64)
+        for i, user_id in enumerate(block.user_ids.tolist()):
+            scores = kernel.scores(states[cluster], block.features, features[i])
+            scores[i] = -np.inf
+            kk = min(k, len(scores) - 1)
+            tops[user_id] = set(block.user_ids[np.argpartition(-scores, kk - 1)[:kk]].tolist()) if kk > 0 else set()
+    return tops
+
+
+def benchmark(cluster_size, k, repeats=20):
+    from sklearn.metrics.pairwise import cosine_similarity
+    from streaming_loader import ClusterBlock, read_cluster_header, cluster_feature_columns
+    import matching_engine
+
+    columns = cluster_feature_columns(read_cluster_header())
+    rng = np.random.default_rng(0)
+    features = rng.integers(1, 6, size=(cluster_size, len(columns))).astype(np.float32)
+    synthetic = {0: ClusterBlock(user_ids=np.arange(cluster_size, dtype=np.int32), features=features)}
+    x = rng.integers(1, 6, size=len(columns)).astype(np.float64)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        cosine_similarity(features, x.reshape(1, -1))
+    sklearn_ms = (time.perf_counter() - start) / repeats * 1e3
+    print(f"{cluster_size} candidates x {len(columns)} features")
+    print(f"{'kernel':>16} {'prepare s':>10} {'score ms':>9}")
+    print(f"{'sklearn cosine':>16} {'':>10} {sklearn_ms:>9.2f}")
+    for name in KERNELS:
+        kernel = make_kernel(name)
+        start = time.perf_counter()
+        states = kernel.prepare(synthetic, columns)
+        prepare_s = time.perf_counter() - start
+        kernel.scores(states[0], features, x)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            kernel.scores(states[0], features, x)
+        print(f"{name:>16} {prepare_s:>10.3f} {(time.perf_counter() - start) / repeats * 1e3:>9.2f}")
+
+    # Neighbour overlap on the real users: mean Jaccard of each user's top-k under two kernels
+    if not matching_engine.load_matching_data():
+        return
+    tops = {}
+    for name in KERNELS:
+        kernel = make_kernel(name)
+        states = kernel.prepare(matching_engine.cluster_arrays, matching_engine.feature_columns)
+        tops[name] = _top_sets(kernel, states, matching_engine.cluster_arrays, k)
+    names = list(KERNELS)
+    print(f"\nmean Jaccard overlap of top-{k} neighbours on the existing users")
+    print(f"{'':>16}" + "".join(f"{name:>16}" for name in names))
+    for a in names:
+        overlaps = []
+        for b in names:
+            jaccard = [len(tops[a][u] & tops[b][u]) / max(len(tops[a][u] | tops[b][u]), 1) for u in tops[a]]
+            overlaps.append(np.mean(jaccard))
+        print(f"{a:>16}" + "".join(f"{overlap:>16.3f}" for overlap in overlaps))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pluggable similarity kernels")
+    parser.add_argument('--bench', action='store_true', help="latency and neighbour overlap between kernels")
+    parser.add_argument('--cluster-size', type=int, default=200_000)
+    parser.add_argument('--k', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.cluster_size, args.k)
+    else:
+        parser.print_help()
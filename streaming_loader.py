@@ -0,0 +1,274 @@
+"""
+Chunked, column-pruned loading of the matching tables.
+
+The original loader read user_clusters_6_clusters.csv and user_profiles.csv in
+one shot with default dtypes (object strings, int64/float64 everywhere) and
+kept every profile column. This module streams both files in chunks with
+explicit compact dtypes, encodes each cluster chunk with the label encoders as
+it arrives and appends it to per-cluster float32 feature arrays.
+
+Run `python streaming_loader.py --report` to compare peak RSS against the
+original one-shot loader.
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+CLUSTERS_CSV = "user_clusters_6_clusters.csv"
+PROFILES_CSV = "user_profiles.csv"
+DEFAULT_CHUNKSIZE = 100_000
+
+# Columns encoded with label_encoders.pkl (same list pre_processing uses)
+CATEGORICAL_COLUMNS = ['gender', 'education_level', 'occupation_status', 'diet_type', 'stress_level',
+                       'mental_health_condition', 'relationship_status', 'age_groups', 'work_hours_groups',
+                       'sleep_hours_groups', 'physical_activity_groups', 'screen_time_groups', 'friends_groups']
+
+DOOR2_ANSWER_COLUMNS = [f'answer_code_{56 + i}' for i in range(25)]
+ENTRY_HALL_ANSWER_COLUMNS = [f'entry_hall_answer_code_{i + 1}' for i in range(15)]
+SUBSCORE_COLUMNS = ['entry_hall_pulse_score', 'entry_hall_mood_index', 'entry_hall_energy_index',
+                    'entry_hall_social_index', 'entry_hall_security_index']
+
+# Profile fields shown on the completion page - names, emails, hobbies etc. are never read by matching
+PROFILE_COLUMNS = ['user_id', 'first_name', 'last_name', 'age', 'gender', 'country',
+                   'education_level', 'occupation_status', 'relationship_status']
+PROFILE_DTYPES = {
+    'user_id': 'int32',
+    'first_name': 'category',
+    'last_name': 'category',
+    'age': 'int8',
+    'gender': 'category',
+    'country': 'category',
+    'education_level': 'category',
+    'occupation_status': 'category',
+    'relationship_status': 'category',
+}
+
+
+class ClusterBlock(NamedTuple):
+    """Encoded feature rows of one cluster, row-aligned with their user ids"""
+    user_ids: np.ndarray   # int32, shape (n,)
+    features: np.ndarray   # float32, shape (n, n_features), columns in cluster_feature_columns order
+
+
+def cluster_dtypes(columns):
+    """Explicit compact dtypes for the cluster table columns"""
+    dtypes = {}
+    for col in columns:
+        if col == 'user_id':
+            dtypes[col] = 'int32'
+        elif col in CATEGORICAL_COLUMNS:
+            dtypes[col] = 'category'
+        elif col in DOOR2_ANSWER_COLUMNS or col in ENTRY_HALL_ANSWER_COLUMNS:
+            dtypes[col] = 'int8'
+        elif col in ('has_mental_health_condition', 'Class Name'):
+            dtypes[col] = 'int8'
+        else:
+            # matching_score and Entry Hall subscores
+            dtypes[col] = 'float32'
+    return dtypes
+
+
+def cluster_feature_columns(columns):
+    """Feature columns in classifier order (everything except user_id and Class Name)"""
+    return [col for col in columns if col not in ('user_id', 'Class Name')]
+
+
+def read_cluster_header(path=CLUSTERS_CSV):
+    """Column names of the cluster table, without reading any rows"""
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def encode_chunk(chunk, compiled, report=None):
+    """Encode the categorical columns of one chunk in place (unknown categories -> 0)"""
+    from table_encoder import encode_column
+    for col in CATEGORICAL_COLUMNS:
+        if col in chunk.columns:
+            chunk[col] = encode_column(chunk[col], compiled[col], col, report)
+    return chunk
+
+
+def stream_cluster_arrays(encoders, path=CLUSTERS_CSV, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Stream the cluster table in chunks and build per-cluster encoded arrays.
+
+    Returns (cluster_arrays, feature_columns, template_row) where cluster_arrays maps
+    each Class Name to a ClusterBlock and template_row is the first raw row of the
+    table (used as the structure template for new users).
+    """
+    from table_encoder import compile_encoders, UnknownReport
+
+    columns = read_cluster_header(path)
+    feature_columns = cluster_feature_columns(columns)
+    dtypes = cluster_dtypes(columns)
+    # Keep the raw strings of the template row, the categorical codes are meaningless there
+    template_row = pd.read_csv(path, nrows=1)
+
+    compiled = compile_encoders(encoders)
+    report = UnknownReport()
+    ids_parts: Dict[int, List[np.ndarray]] = {}
+    feature_parts: Dict[int, List[np.ndarray]] = {}
+
+    for chunk in pd.read_csv(path, usecols=columns, dtype=dtypes, chunksize=chunksize):
+        encode_chunk(chunk, compiled, report)
+        labels = chunk['Class Name'].to_numpy()
+        user_ids = chunk['user_id'].to_numpy()
+        features = chunk[feature_columns].to_numpy(dtype=np.float32)
+
+        for cluster in np.unique(labels):
+            mask = labels == cluster
+            ids_parts.setdefault(int(cluster), []).append(user_ids[mask])
+            feature_parts.setdefault(int(cluster), []).append(features[mask])
+
+    if report.total:
+        print(f"[WARNING] {report.total} unknown categories mapped to 0: {report.summary()}")
+
+    cluster_arrays = {}
+    for cluster in sorted(ids_parts):
+        cluster_arrays[cluster] = ClusterBlock(
+            user_ids=np.concatenate(ids_parts.pop(cluster)),
+            features=np.concatenate(feature_parts.pop(cluster)),
+        )
+
+    return cluster_arrays, feature_columns, template_row
+
+
+def stream_profiles(path=PROFILES_CSV, keep_ids=None, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Stream the display fields of user_profiles.csv, indexed by user_id.
+
+    If keep_ids is given, only those users are kept (matching can only ever
+    return users that are in the cluster table).
+    """
+    parts = []
+    for chunk in pd.read_csv(path, usecols=PROFILE_COLUMNS, dtype=PROFILE_DTYPES, chunksize=chunksize):
+        if keep_ids is not None:
+            chunk = chunk[np.isin(chunk['user_id'].to_numpy(), keep_ids)]
+        parts.append(chunk)
+
+    if not parts:
+        return pd.DataFrame(columns=PROFILE_COLUMNS).set_index('user_id')
+
+    # Chunks carry different category sets - union them instead of falling back to object
+    merged = {}
+    for col in PROFILE_COLUMNS:
+        if PROFILE_DTYPES[col] == 'category':
+            merged[col] = union_categoricals([part[col] for part in parts])
+        else:
+            merged[col] = np.concatenate([part[col].to_numpy() for part in parts])
+    profiles = pd.DataFrame(merged)
+    profiles.set_index('user_id', inplace=True)
+    return profiles
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+# ============================================================================
+# Peak RSS report
+# ============================================================================
+
+def _load_encoders():
+    import pickle
+    with open('label_encoders.pkl', 'rb') as file:
+        return pickle.load(file)
+
+
+def _legacy_load(clusters_path, profiles_path, encoders):
+    """The original one-shot loader: full read_csv of both tables + pre_processing"""
+    import matching_engine
+    from table_encoder import compile_encoders
+    df_clusters = pd.read_csv(clusters_path)
+    df_user_profiles = pd.read_csv(profiles_path)
+    df_matrix = matching_engine.pre_processing(df_clusters.copy(), compiled=compile_encoders(encoders))
+    return df_clusters, df_user_profiles, df_matrix
+
+
+def _streaming_load(clusters_path, profiles_path, encoders, chunksize):
+    cluster_arrays, _, _ = stream_cluster_arrays(encoders, clusters_path, chunksize)
+    keep_ids = np.concatenate([block.user_ids for block in cluster_arrays.values()])
+    profiles = stream_profiles(profiles_path, keep_ids=keep_ids, chunksize=chunksize)
+    return cluster_arrays, profiles
+
+
+def _run_single(mode, clusters_path, profiles_path, chunksize):
+    """Run one loader in this process and print 'baseline_mb peak_mb seconds'"""
+    import matching_engine  # noqa: F401 - same imports in both modes, so the baseline is comparable
+    encoders = _load_encoders()
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if mode == 'legacy':
+        result = _legacy_load(clusters_path, profiles_path, encoders)
+    else:
+        result = _streaming_load(clusters_path, profiles_path, encoders, chunksize)
+    elapsed = time.perf_counter() - start
+    print(f"{baseline:.1f} {peak_rss_mb():.1f} {elapsed:.3f}")
+    del result
+
+
+def _scale_tables(factor, out_dir):
+    """Write copies of both tables repeated `factor` times with fresh user ids"""
+    clusters = pd.read_csv(CLUSTERS_CSV)
+    profiles = pd.read_csv(PROFILES_CSV)
+    id_offset = int(max(clusters['user_id'].max(), profiles['user_id'].max())) + 1
+    clusters_path = os.path.join(out_dir, CLUSTERS_CSV)
+    profiles_path = os.path.join(out_dir, PROFILES_CSV)
+
+    for i in range(factor):
+        header = i == 0
+        mode = 'w' if header else 'a'
+        shifted = clusters.assign(user_id=clusters['user_id'] + i * id_offset)
+        shifted.to_csv(clusters_path, index=False, header=header, mode=mode)
+        shifted = profiles.assign(user_id=profiles['user_id'] + i * id_offset)
+        shifted.to_csv(profiles_path, index=False, header=header, mode=mode)
+
+    return clusters_path, profiles_path
+
+
+def report(scales, chunksize):
+    """Print peak RSS and load time of both loaders at several table sizes"""
+    print(f"{'scale':>7} {'rows':>10} {'loader':>10} {'peak MB':>9} {'delta MB':>9} {'seconds':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in scales:
+            clusters_path, profiles_path = _scale_tables(scale, tmp)
+            n_rows = sum(1 for _ in open(clusters_path, encoding='utf-8')) - 1
+            for mode in ('legacy', 'streaming'):
+                # Fresh interpreter per run so ru_maxrss only reflects this loader
+                out = subprocess.run(
+                    [sys.executable, '-W', 'ignore', os.path.abspath(__file__), '--run', mode,
+                     '--clusters', clusters_path, '--profiles', profiles_path,
+                     '--chunksize', str(chunksize)],
+                    capture_output=True, text=True, check=True,
+                )
+                baseline, peak, seconds = map(float, out.stdout.split()[-3:])
+                print(f"{scale:>7} {n_rows:>10} {mode:>10} {peak:>9.1f} {peak - baseline:>9.1f} {seconds:>8.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streaming loader for the matching tables")
+    parser.add_argument('--report', action='store_true', help="compare peak RSS against the one-shot loader")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 100, 1000],
+                        help="table size multipliers used by --report")
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--run', choices=['legacy', 'streaming'], help=argparse.SUPPRESS)
+    parser.add_argument('--clusters', default=CLUSTERS_CSV, help=argparse.SUPPRESS)
+    parser.add_argument('--profiles', default=PROFILES_CSV, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        _run_single(args.run, args.clusters, args.profiles, args.chunksize)
+    else:
+        report(args.scales, args.chunksize)
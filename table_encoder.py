@@ -0,0 +1,194 @@
+"""
+Table-mode categorical encoder for the matching tables.
+
+pre_processing used to run a serial `.map(mapping_dict)` plus an
+`isna().any()` scan for each of the 13 categorical columns, on a copy of a
+copy of the frame. Here every label encoder is compiled once into a
+category list plus an int8 lookup array. A column is encoded by factorizing
+it, resolving only its distinct labels against that list and indexing the
+lookup array, so unknown values (code -1) land on the default slot and are
+counted in the same pass. Large tables can be split by rows across a process pool.
+
+Run `python table_encoder.py --bench` to compare against the per-column map.
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from streaming_loader import CATEGORICAL_COLUMNS
+
+# Value used for unseen categories (same fallback pre_processing always used)
+UNKNOWN_CODE = 0
+# Below this many rows per worker the pickling cost outweighs the pool
+MIN_ROWS_PER_JOB = 250_000
+# Distinct unseen values remembered per column for the report
+MAX_UNKNOWN_SAMPLES = 5
+
+
+class CompiledEncoder(NamedTuple):
+    """One label encoder as a category list and a lookup array"""
+    categories: pd.Index   # encoder keys, position i <-> lookup[i]
+    lookup: np.ndarray     # int8 codes, with UNKNOWN_CODE appended as the last slot
+
+
+class UnknownReport:
+    """Counts of values that had no entry in the label encoders"""
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+        self.samples: Dict[str, List] = {}
+
+    def add(self, col, count, samples=()):
+        if count == 0:
+            return
+        self.counts[col] = self.counts.get(col, 0) + int(count)
+        kept = self.samples.setdefault(col, [])
+        for value in samples:
+            if len(kept) >= MAX_UNKNOWN_SAMPLES:
+                break
+            if value not in kept:
+                kept.append(value)
+
+    def merge(self, other):
+        for col, count in other.counts.items():
+            self.add(col, count, other.samples.get(col, ()))
+        return self
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def summary(self):
+        """One-line summary, e.g. "diet_type=3 ['Fast Food'], age_groups=1 ['Under 18']" """
+        return ", ".join(f"{col}={count} {self.samples.get(col, [])}" for col, count in self.counts.items())
+
+
+def compile_encoders(encoders, columns=CATEGORICAL_COLUMNS):
+    """Precompile each label encoder dict into a CompiledEncoder"""
+    compiled = {}
+    for col in columns:
+        mapping_dict = encoders[col]
+        lookup = np.array(list(mapping_dict.values()) + [UNKNOWN_CODE], dtype=np.int8)
+        compiled[col] = CompiledEncoder(categories=pd.Index(list(mapping_dict.keys())), lookup=lookup)
+    return compiled
+
+
+def encode_column(values, compiled_encoder, col=None, report=None):
+    """Encode one column of raw labels to int8 codes, counting unknown values in `report`"""
+    # Hash each row once, then resolve only the distinct labels against the encoder
+    row_codes, uniques = pd.factorize(values)
+    codes = compiled_encoder.categories.get_indexer(uniques)[row_codes] if len(uniques) else row_codes
+    # codes == -1 for unseen labels and missing values, which indexes the trailing UNKNOWN_CODE slot
+    encoded = compiled_encoder.lookup[codes]
+    if report is not None:
+        unknown = codes < 0
+        n_unknown = int(np.count_nonzero(unknown))
+        if n_unknown:
+            raw = values.to_numpy() if isinstance(values, pd.Series) else np.asarray(values)
+            samples = pd.unique(raw[unknown][:1000])[:MAX_UNKNOWN_SAMPLES]
+            report.add(col, n_unknown, list(samples))
+    return encoded
+
+
+def _encode_columns(columns, compiled):
+    """Encode a {col: values} dict serially (also the process pool worker)"""
+    report = UnknownReport()
+    encoded = {col: encode_column(values, compiled[col], col, report) for col, values in columns.items()}
+    return encoded, report
+
+
+def encode_table(df, compiled, n_jobs=1, min_rows_per_job=MIN_ROWS_PER_JOB):
+    """
+    Encode the categorical columns of a table in one pass.
+
+    Returns (encoded, report) where encoded maps each categorical column present
+    in `df` to an int8 array. The frame itself is not copied or modified. With
+    n_jobs > 1 and enough rows, row slices are encoded in a process pool.
+    """
+    cols = [col for col in compiled if col in df.columns]
+    n_rows = len(df)
+    n_jobs = max(1, min(n_jobs, n_rows // max(1, min_rows_per_job)))
+
+    if n_jobs == 1:
+        return _encode_columns({col: df[col] for col in cols}, compiled)
+
+    bounds = np.linspace(0, n_rows, n_jobs + 1, dtype=int)
+    slices = [
+        {col: df[col].to_numpy()[start:stop] for col in cols}
+        for start, stop in zip(bounds[:-1], bounds[1:])
+    ]
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        parts = list(pool.map(_encode_columns, slices, [compiled] * n_jobs))
+
+    report = UnknownReport()
+    for _, part_report in parts:
+        report.merge(part_report)
+    encoded = {col: np.concatenate([part[col] for part, _ in parts]) for col in cols}
+    return encoded, report
+
+
+def encode_frame(df, compiled, n_jobs=1):
+    """Return a new frame with the categorical columns replaced by their codes"""
+    encoded, report = encode_table(df, compiled, n_jobs)
+    # assign() builds one new frame; untouched columns are not copied under copy-on-write
+    return df.assign(**encoded), report
+
+
+# ============================================================================
+# Benchmark
+# ============================================================================
+
+def _map_encode(df, encoders):
+    """The previous per-column encoding loop, for comparison"""
+    cluster_df = df.copy()
+    for col in CATEGORICAL_COLUMNS:
+        cluster_df[col] = cluster_df[col].map(encoders[col])
+        if cluster_df[col].isna().any():
+            cluster_df[col] = cluster_df[col].fillna(0)
+    return cluster_df
+
+
+def benchmark(n_rows, jobs):
+    import pickle
+    from streaming_loader import CLUSTERS_CSV
+
+    with open('label_encoders.pkl', 'rb') as file:
+        encoders = pickle.load(file)
+    compiled = compile_encoders(encoders)
+
+    base = pd.read_csv(CLUSTERS_CSV)
+    reps = int(np.ceil(n_rows / len(base)))
+    df = pd.concat([base] * reps, ignore_index=True).iloc[:n_rows]
+    # A few unseen labels so the unknown path is exercised
+    df.loc[df.index[::1000], 'diet_type'] = 'Fast Food'
+
+    start = time.perf_counter()
+    expected = _map_encode(df, encoders)
+    print(f"{'per-column map':>22}: {time.perf_counter() - start:8.3f} s")
+
+    for n_jobs in jobs:
+        start = time.perf_counter()
+        encoded, report = encode_table(df, compiled, n_jobs=n_jobs, min_rows_per_job=1)
+        elapsed = time.perf_counter() - start
+        for col in CATEGORICAL_COLUMNS:
+            assert np.array_equal(encoded[col], expected[col].to_numpy().astype(np.int8)), col
+        print(f"{f'compiled, {n_jobs} job(s)':>22}: {elapsed:8.3f} s   unknown: {report.summary()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Table-mode categorical encoder")
+    parser.add_argument('--bench', action='store_true', help="benchmark against the per-column map")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 2, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    if args.bench:
+        benchmark(args.rows, args.jobs)
+    else:
+        parser.print_help()
@@ -0,0 +1,296 @@
+"""
+Record-and-replay load harness built on the answer journal.
+
+The app journals every page transition `main()` dispatches, every answer and
+the matching-relevant profile (see answer_journal.py), each with a timestamp.
+The gaps between a session's events are its think-times, so a journal is a
+recording of real flows with real answer distributions and click timing.
+Load tests replay that recording instead of random answers:
+
+    engine      the matching-engine calls the app makes for the flow: the Door 2
+                matcher is started when the page opens, updated per answer and
+                finished on the last answer (fast, no Streamlit)
+    app         the flow is clicked through app.py in a local Streamlit AppTest,
+                one script rerun per recorded click, timing every rerun; each
+                concurrent session runs in its own process, as AppTest keeps
+                per-process Streamlit state
+
+Think-times are divided by --speedup (0 replays without waiting) and capped at
+--max-think seconds, and --concurrency sessions run at once, each flow
+--repeat times. The report gives latency percentiles per operation.
+The matches of every replayed session are written to --out, and `diff`
+compares the outputs of two builds (run the same journal on each checkout):
+
+    python traffic_replay.py replay --mode engine --speedup 20 --concurrency 8 --out before.json
+    git checkout my-branch
+    python traffic_replay.py replay --mode engine --speedup 20 --concurrency 8 --out after.json
+    python traffic_replay.py diff before.json after.json
+
+Profile creation and the initial questionnaire are not replayed: app mode
+starts each flow at the Entry Hall with the journaled profile.
+"""
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from answer_journal import ANSWER_STAGES, journal_dir, read_events
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+DEFAULT_MAX_THINK = 30.0        # seconds; longer pauses are someone who left the tab
+DOOR2_QUESTIONS = 25
+
+# Buttons that move between pages: (from page, to page) -> button key or label
+NAVIGATION = {
+    ('door_selection', 'door1'): 'door1',
+    ('door_selection', 'door2'): 'door2',
+    ('door_selection', 'door3'): 'door3',
+    ('door1', 'door_selection'): '← Back to Doors',
+    ('door2', 'door_selection'): '← Back to Doors',
+    ('door3', 'door_selection'): '← Back to Doors',
+    ('completion', 'door_selection'): '🚪 Try Another Door',
+}
+_MATCH_LABEL = re.compile(r'^\*\*Match #\d+: (.*?)\*\*')
+
+
+def session_flows(events):
+    """Replayable flows {session: [event, ...]} with event['think_time'] in seconds"""
+    flows = {}
+    for event in events:
+        flows.setdefault(event['session'], []).append(event)
+    replayable = {}
+    for session, flow in flows.items():
+        # Sessions that never finished the questionnaire have nothing to replay
+        if not any(event['stage'] == 'profile' for event in flow):
+            continue
+        flow.sort(key=lambda event: event['ts'])
+        previous = flow[0]['ts']
+        for event in flow:
+            event['think_time'] = event['ts'] - previous
+            previous = event['ts']
+        replayable[session] = flow
+    return replayable
+
+
+class Timings:
+    """Latencies in ms per operation, shared by the replay threads"""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def merge(self, samples):
+        with self._lock:
+            for op, values in samples.items():
+                self.samples.setdefault(op, []).extend(values)
+
+    def time(self, op, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = (time.perf_counter() - start) * 1e3
+        with self._lock:
+            self.samples.setdefault(op, []).append(elapsed)
+        return result
+
+    def report(self):
+        print(f"{'operation':>28} {'n':>6} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for op, samples in sorted(self.samples.items()):
+            p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+            print(f"{op:>28} {len(samples):>6} {p50:>8.2f} {p90:>8.2f} {p99:>8.2f} {max(samples):>8.2f}")
+
+
+def think(event, speedup, max_think):
+    if speedup > 0:
+        time.sleep(min(event['think_time'], max_think) / speedup)
+
+
+# ============================================================================
+# Engine replay
+# ============================================================================
+
+def replay_engine(flow, timings, speedup, max_think):
+    """Issue the flow's matching-engine calls; returns {'cluster', 'matches'} or None"""
+    import matching_engine
+
+    profile, answers = {}, {stage: {} for stage in ANSWER_STAGES}
+    matcher, result = None, None
+    for event in flow:
+        think(event, speedup, max_think)
+        stage = event['stage']
+        if stage == 'profile':
+            profile.update(event['profile'])
+        elif stage == 'page' and event['page'] == 'door2':
+            matcher = timings.time('start_incremental_match', matching_engine.start_incremental_match,
+                                   profile, answers['entry_hall'])
+        elif stage in ANSWER_STAGES:
+            answers[stage][f"q_{event['question']}"] = event['code']
+            if stage != 'door2':
+                continue
+            if matcher is not None:
+                timings.time('record_answer', matcher.record_answer, event['question'], event['code'])
+            if event['question'] == DOOR2_QUESTIONS - 1:
+                if matcher is not None:
+                    matches, cluster = timings.time('finish_incremental_match',
+                                                    matching_engine.finish_incremental_match, matcher, 5)
+                else:
+                    matches, cluster = timings.time('get_user_matches', matching_engine.get_user_matches,
+                                                    profile, answers['entry_hall'], answers['door2'], 5)
+                matcher = None
+                result = {'cluster': None if cluster is None else int(cluster),
+                          'matches': [int(match['user_id']) for match in matches or []]}
+    return result
+
+
+# ============================================================================
+# App replay
+# ============================================================================
+
+def _click(at, timings, op, key_or_label):
+    buttons = [b for b in at.button if b.key == key_or_label or b.label == key_or_label]
+    if not buttons:
+        return False
+    timings.time(op, buttons[0].click().run)
+    return True
+
+
+def replay_app(flow, timings, speedup, max_think):
+    """Click the flow through app.py in an AppTest; returns {'cluster', 'matches'} or None"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.run()
+    at.session_state.user_profile = next(event['profile'] for event in flow if event['stage'] == 'profile')
+    at.session_state.page = 'entry_hall'
+    timings.time('rerun:entry_hall', at.run)
+
+    for event in flow:
+        think(event, speedup, max_think)
+        stage, page = event['stage'], at.session_state.page
+        if stage in ANSWER_STAGES:
+            if stage != page:
+                continue
+            while at.session_state.current_question > event['question']:
+                if not _click(at, timings, f"previous:{page}", '← Previous'):
+                    break
+            if at.session_state.current_question != event['question'] or not at.radio:
+                continue
+            radio = at.radio[0]
+            radio.set_value(radio.options[event['code'] - 1])
+            submit = [b for b in at.button if b.label.startswith(('Next', 'Complete'))]
+            if submit:
+                timings.time(f"answer:{stage}", submit[0].click().run)
+        elif stage == 'page' and event['page'] != page:
+            button = NAVIGATION.get((page, event['page']))
+            if button is not None:
+                _click(at, timings, f"page:{event['page']}", button)
+        if at.exception:
+            print(f"[ERROR] Replay of session {flow[0]['session']} raised: {at.exception[0].message}")
+            return None
+
+    if 'user_cluster' not in at.session_state or at.session_state.user_cluster is None:
+        return None
+    return {'cluster': int(at.session_state.user_cluster),
+            'matches': [m.group(1) for m in (_MATCH_LABEL.match(e.label) for e in at.expander) if m]}
+
+
+def _replay_job(job):
+    mode, session, flow, speedup, max_think = job
+    timings = Timings()
+    replay_flow = replay_engine if mode == 'engine' else replay_app
+    return session, replay_flow(flow, timings, speedup, max_think), timings.samples
+
+
+def replay(directory, mode, speedup, concurrency, repeat, max_think, limit=None):
+    """Replay every flow of a journal; returns (results by session, Timings, wall seconds)"""
+    import matching_engine
+
+    flows = session_flows(read_events(directory))
+    if limit:
+        flows = dict(list(flows.items())[:limit])
+    if not flows:
+        print(f"[WARNING] No replayable sessions in {directory}")
+        return {}, Timings(), 0.0
+    if mode == 'engine' and not matching_engine.load_matching_data():
+        return {}, Timings(), 0.0
+
+    timings = Timings()
+    jobs = [(mode, session, flow, speedup, max_think) for session, flow in flows.items() for _ in range(repeat)]
+    print(f"[INFO] Replaying {len(flows)} sessions x{repeat} in {mode} mode, "
+          f"{concurrency} at a time, think-time /{speedup:g}")
+    start = time.perf_counter()
+    # Engine replays share the loaded engine across threads; see the module docstring for app mode
+    executor = ThreadPoolExecutor if mode == 'engine' else ProcessPoolExecutor
+    results = {}
+    with executor(max_workers=concurrency) as pool:
+        for session, result, samples in pool.map(_replay_job, jobs):
+            timings.merge(samples)
+            if result is not None:
+                results[session] = result
+    wall = time.perf_counter() - start
+    return results, timings, wall
+
+
+def diff(path_a, path_b):
+    with open(path_a) as file:
+        a = json.load(file)
+    with open(path_b) as file:
+        b = json.load(file)
+    if a['mode'] != b['mode']:
+        print(f"[ERROR] Cannot compare a {a['mode']} replay with a {b['mode']} replay")
+        return
+    common = sorted(set(a['sessions']) & set(b['sessions']))
+    print(f"{len(common)} sessions in both ({len(a['sessions'])} in {path_a}, {len(b['sessions'])} in {path_b})")
+    if not common:
+        return
+    changed_cluster, identical, overlaps = [], 0, []
+    for session in common:
+        ra, rb = a['sessions'][session], b['sessions'][session]
+        if ra['cluster'] != rb['cluster']:
+            changed_cluster.append(session)
+        if ra['matches'] == rb['matches']:
+            identical += 1
+        overlaps.append(len(set(ra['matches']) & set(rb['matches'])) / max(len(ra['matches']), len(rb['matches']), 1))
+    print(f"  identical match lists: {identical}/{len(common)}")
+    print(f"  cluster changed:       {len(changed_cluster)}/{len(common)}")
+    print(f"  mean top-k overlap:    {np.mean(overlaps):.3f}")
+    for session in [s for s in common if a['sessions'][s] != b['sessions'][s]][:10]:
+        print(f"  {session}: {a['sessions'][session]} -> {b['sessions'][session]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay journaled sessions as load")
+    sub = parser.add_subparsers(dest='command')
+    run = sub.add_parser('replay', help="replay the journal and report latency percentiles")
+    run.add_argument('--dir', default=journal_dir())
+    run.add_argument('--mode', choices=['engine', 'app'], default='engine')
+    run.add_argument('--speedup', type=float, default=10.0, help="divide think-times by this (0: no waiting)")
+    run.add_argument('--max-think', type=float, default=DEFAULT_MAX_THINK)
+    run.add_argument('--concurrency', type=int, default=4)
+    run.add_argument('--repeat', type=int, default=1, help="replay every session this many times")
+    run.add_argument('--limit', type=int, help="replay only the first N sessions")
+    run.add_argument('--out', help="write the match outputs to this JSON file")
+    compare = sub.add_parser('diff', help="compare the match outputs of two replays")
+    compare.add_argument('before')
+    compare.add_argument('after')
+    args = parser.parse_args()
+
+    if args.command == 'replay':
+        results, timings, wall = replay(args.dir, args.mode, args.speedup, args.concurrency, args.repeat,
+                                        args.max_think, args.limit)
+        if timings.samples:
+            timings.report()
+            print(f"{len(results)} sessions with matches, wall time {wall:.1f} s")
+        if args.out:
+            with open(args.out, 'w') as file:
+                json.dump({'mode': args.mode, 'sessions': results}, file, indent=1)
+            print(f"[OK] Match outputs written to {args.out}")
+    elif args.command == 'diff':
+        diff(args.before, args.after)
+    else:
+        parser.print_help()